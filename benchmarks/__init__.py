@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/8/7 10:02
+@desc:
+"""
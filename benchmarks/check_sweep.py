@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/9/25 11:08
+@desc: Check that every row of a parameter sweep matches a back test of its configuration alone, over a synthetic
+universe and a grid that varies the base filter. Exit with 1 when a row differs.
+
+    python -m benchmarks.check_sweep --tickers 100 --days 600
+"""
+import argparse
+import copy
+import sys
+
+import pandas as pd
+
+from benchmarks.synthetic import SyntheticDataSource
+from si.config import load_config
+from si.parameter_sweep import ParameterSweep, summarize, _apply_params
+from si.strategy.registry import get_strategy_class
+from si.strategy_runner import StrategyRunner
+
+# A grid whose configurations keep different companies, by sector, by daily volume and by the window thresholds #
+CHECK_GRID = {
+    'base_filter.exclude_sectors': [['Healthcare'], []],
+    'base_filter.min_daily_volume': [100, 300000],
+    'base_filter.min_volume': [0, 1000000],
+}
+
+
+def check_sweep(config, n_tickers, n_days, seed=0):
+    """
+    Sweep CHECK_GRID, and back test every configuration of the grid with its own StrategyRunner.
+
+    Returns:
+        A tuple like (sweep summary, back test summary), DataFrames like ParameterSweep.run.
+    """
+    config = copy.deepcopy(config)
+    config['data']['use_cache'] = False
+    # looser thresholds than a real scan, so that the configurations have signals to compare
+    config['base_filter']['min_close_range'] = 1.1
+    config['strategy']['bigspike']['rule_8_volume_multiple'] = 1.2
+    config['sweep'].update({'grid': CHECK_GRID, 'past_ob_window': n_days, 'n_workers': 1})
+    data_source = SyntheticDataSource(n_tickers, n_days, seed)
+    strategy_cls = get_strategy_class(config['sweep']['strategy'])
+
+    sweep = ParameterSweep(strategy_cls, config)
+    sweep.runner.db = data_source
+    sweep_summary = sweep.run()
+
+    params_list = list(sweep.iter_params())
+    results = []
+    for params in params_list:
+        params_config = _apply_params(config, params)
+        runner = StrategyRunner(strategy_cls(params_config), params_config)
+        runner.db = data_source
+        results.append(runner.back_test(sweep.past_ob_window, sweep.future_window))
+
+    return sweep_summary, summarize(params_list, results)
+
+
+def main(args):
+    config = load_config(args.config_filename)
+    sweep_summary, back_test_summary = check_sweep(config, args.tickers, args.days, seed=args.seed)
+    print(sweep_summary.to_string())
+
+    try:
+        pd.testing.assert_frame_equal(sweep_summary, back_test_summary)
+    except AssertionError as error:
+        print(f"The sweep differs from the back tests:\n{error}\n{back_test_summary.to_string()}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config_filename', default='config/local.yaml', type=str, required=False,
+                        help='Configuration filename, its base_filter, strategy and sweep sections are checked')
+    parser.add_argument('--tickers', default=100, type=int, help='Number of tickers of the universe')
+    parser.add_argument('--days', default=600, type=int, help='Number of bars per ticker')
+    parser.add_argument('--seed', default=0, type=int, help='Seed of the synthetic universe')
+    main(parser.parse_args())
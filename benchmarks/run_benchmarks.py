@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/8/7 14:31
+@desc: Time the indicators, the strategies, the base filter and the runner scans over a synthetic universe, and write
+a JSON report that can be compared with the report of an earlier release.
+
+    python -m benchmarks.run_benchmarks --tickers 5000 --days 5000 --output report.json
+    python -m benchmarks.run_benchmarks --baseline old_report.json
+"""
+import argparse
+import contextlib
+import copy
+import datetime
+import io
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import SyntheticDataSource, make_quotes
+from si.config import load_config
+from si.lib import ta_lib
+from si.lib.indicator_store import IndicatorStore
+from si.strategy.bigspike_strategy import BigSpikeStrategy
+from si.strategy.registry import get_strategy_class, strategy_names
+from si.strategy_runner import StrategyRunner
+
+STRATEGIES = {name: get_strategy_class(name) for name in strategy_names()}
+
+# Series indicators, as name: function of quotes #
+SERIES_INDICATORS = {
+    'moving_average_series': lambda quotes: ta_lib.moving_average_series(quotes.close, 20),
+    'exp_moving_average_series': lambda quotes: ta_lib.exp_moving_average_series(quotes.close, 20),
+    'moving_max_series': lambda quotes: ta_lib.moving_max_series(quotes.high, 20),
+    'moving_min_series': lambda quotes: ta_lib.moving_min_series(quotes.low, 20),
+    'true_range_series': ta_lib.true_range_series,
+    'average_true_range_series': ta_lib.average_true_range_series,
+    'norm_price_series': ta_lib.norm_price_series,
+    'money_flow_index_series': ta_lib.money_flow_index_series,
+    'mass_index_series': ta_lib.mass_index_series,
+    'volatility_series': ta_lib.volatility_series,
+}
+
+# Scalar indicators evaluated at one index, as name: function of (quotes, cur_idx) #
+SCALAR_INDICATORS = {
+    'moving_average': lambda quotes, cur_idx: ta_lib.moving_average(quotes.close, cur_idx, 20),
+    'exp_moving_average': lambda quotes, cur_idx: ta_lib.exp_moving_average(quotes.close, cur_idx, 20),
+    'average_true_range': ta_lib.average_true_range,
+    'money_flow_index': ta_lib.money_flow_index,
+    'mass_index': ta_lib.mass_index,
+}
+
+# A benchmark whose time grows by more than this ratio over the baseline is reported as a regression #
+REGRESSION_RATIO = 1.2
+
+
+class BenchmarkSuite(object):
+    """
+    Run every benchmark of a synthetic universe and collect the timings.
+
+    The per-index benchmarks (the scalar indicators, forward and filter_quotes) run on the last n_indices bars of
+    n_sample tickers, the series benchmarks on the whole history of the same tickers, and the runner benchmarks scan
+    the whole universe end to end from a warm quote cache.
+    """
+
+    def __init__(self, config, n_tickers, n_days, seed=0, repeat=3, n_sample=20, n_indices=250):
+        self.config = config
+        self.n_tickers = n_tickers
+        self.n_days = n_days
+        self.seed = seed
+        self.repeat = repeat
+        self.n_sample = min(n_sample, n_tickers)
+        self.n_indices = min(n_indices, n_days)
+        self.results = []
+
+        self._sample = [make_quotes(n_days, seed + company_id) for company_id in range(1, self.n_sample + 1)]
+
+    def run(self, groups=None):
+        """
+        Args:
+            groups: list of str, optional.
+                Only run these groups of indicator, strategy, base_filter and runner.
+
+        Returns:
+            A report dict like {'meta': {...}, 'results': [...]}.
+        """
+        benchmarks = {
+            'indicator': self.bench_indicators,
+            'strategy': self.bench_strategies,
+            'base_filter': self.bench_base_filter,
+            'runner': self.bench_runner,
+        }
+        for group, bench in benchmarks.items():
+            if groups is None or group in groups:
+                bench()
+
+        return {'meta': self.meta(), 'results': self.results}
+
+    def bench_indicators(self):
+        for name, func in SERIES_INDICATORS.items():
+            self.time_it('indicator', name, lambda: [func(quotes) for quotes in self._sample],
+                         n_items=self.n_sample * self.n_days)
+
+        for name, func in SCALAR_INDICATORS.items():
+            self.time_it('indicator', name, lambda: [func(quotes, cur_idx) for quotes in self._sample
+                                                     for cur_idx in self._indices()],
+                         n_items=self.n_sample * self.n_indices)
+
+    def bench_strategies(self):
+        for name, strategy_cls in STRATEGIES.items():
+            strategy = strategy_cls(self.config)
+            self.time_it('strategy', name + '.forward',
+                         lambda: [strategy.forward(quotes, cur_idx) for quotes in self._sample
+                                  for cur_idx in self._indices()],
+                         n_items=self.n_sample * self.n_indices)
+            self.time_it('strategy', name + '.forward_all',
+                         lambda: [strategy.forward_all(quotes) for quotes in self._sample],
+                         n_items=self.n_sample * self.n_days)
+
+    def bench_base_filter(self):
+        strategy = BigSpikeStrategy(self.config)
+        self.time_it('base_filter', 'filter_quotes',
+                     lambda: [strategy.filter_quotes(quotes, cur_idx) for quotes in self._sample
+                              for cur_idx in self._indices()],
+                     n_items=self.n_sample * self.n_indices)
+        self.time_it('base_filter', 'filter_quotes_all',
+                     lambda: [strategy.filter_quotes_all(quotes, IndicatorStore(quotes)) for quotes in self._sample],
+                     n_items=self.n_sample * self.n_days)
+
+    def bench_runner(self):
+        cache_dir = tempfile.mkdtemp(prefix='si_benchmark_')
+        try:
+            config = copy.deepcopy(self.config)
+            config['data'].update({'use_cache': True, 'cache_dir': cache_dir})
+            data_source = SyntheticDataSource(self.n_tickers, self.n_days, self.seed)
+
+            for name, strategy_cls in STRATEGIES.items():
+                runner = StrategyRunner(strategy_cls(config), config)
+                runner.db = data_source
+                # fill the quote cache outside of the timings
+                runner.quote_cache.refresh(data_source, runner.quote_filter)
+
+                self.time_it('runner', name + '.run', lambda: _quiet(runner.run, past_ob_window=20),
+                             n_items=self.n_tickers)
+                self.time_it('runner', name + '.back_test',
+                             lambda: runner.back_test(past_ob_window=250, future_window=20),
+                             n_items=self.n_tickers)
+
+            # all strategies in one scan, every ticker is loaded and filtered once
+            runner = StrategyRunner([strategy_cls(config) for strategy_cls in STRATEGIES.values()], config)
+            runner.db = data_source
+            self.time_it('runner', 'all.back_test', lambda: runner.back_test(past_ob_window=250, future_window=20),
+                         n_items=self.n_tickers)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def time_it(self, group, name, func, n_items):
+        """
+        Call func repeat times after a warm-up call and record the timings.
+        Args:
+            n_items: int.
+                The number of units processed per call, e.g. bars or tickers, to report the throughput.
+        """
+        func()
+        seconds = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            func()
+            seconds.append(time.perf_counter() - start)
+
+        best = min(seconds)
+        self.results.append({
+            'group': group,
+            'name': name,
+            'best_s': best,
+            'mean_s': float(np.mean(seconds)),
+            'n_items': n_items,
+            'items_per_s': n_items / best if best > 0 else None,
+        })
+        print(f"{group:>12} {name:<36} best {best * 1000:10.2f} ms", file=sys.stderr)
+
+    def meta(self):
+        return {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'n_tickers': self.n_tickers,
+            'n_days': self.n_days,
+            'seed': self.seed,
+            'repeat': self.repeat,
+            'n_sample': self.n_sample,
+            'n_indices': self.n_indices,
+        }
+
+    def _indices(self):
+        return range(self.n_days - self.n_indices, self.n_days)
+
+
+def compare_reports(baseline, report, ratio=REGRESSION_RATIO):
+    """
+    Compare the best times of the benchmarks of both reports.
+
+    Returns:
+        DataFrame of the common benchmarks with the baseline and current best times and their ratio, and whether the
+        ratio exceeds the threshold.
+    """
+    columns = ['group', 'name', 'best_s']
+    merged = pd.merge(pd.DataFrame(baseline['results'])[columns], pd.DataFrame(report['results'])[columns],
+                      on=['group', 'name'], suffixes=('_baseline', '_current'))
+    merged['ratio'] = merged['best_s_current'] / merged['best_s_baseline']
+    merged['regression'] = merged['ratio'] > ratio
+    return merged
+
+
+def _quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args):
+    config = load_config(args.config_filename)
+
+    suite = BenchmarkSuite(config, args.tickers, args.days, seed=args.seed, repeat=args.repeat,
+                           n_sample=args.sample, n_indices=args.indices)
+    report = suite.run(args.groups)
+
+    report_json = json.dumps(report, indent=2)
+    if args.output is None:
+        print(report_json)
+    else:
+        with open(args.output, 'w') as report_file:
+            report_file.write(report_json)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            comparison = compare_reports(json.load(baseline_file), report)
+        print(comparison.to_string(), file=sys.stderr)
+        if comparison['regression'].any():
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config_filename', default='config/local.yaml', type=str, required=False,
+                        help='Configuration filename, its base_filter and strategy sections are benchmarked')
+    parser.add_argument('--tickers', default=5000, type=int, help='Number of tickers of the universe')
+    parser.add_argument('--days', default=5000, type=int, help='Number of bars per ticker')
+    parser.add_argument('--seed', default=0, type=int, help='Seed of the synthetic universe')
+    parser.add_argument('--repeat', default=3, type=int, help='Number of timed calls per benchmark')
+    parser.add_argument('--sample', default=20, type=int,
+                        help='Number of tickers of the indicator, strategy and base filter benchmarks')
+    parser.add_argument('--indices', default=250, type=int,
+                        help='Number of trailing indices of the per-index benchmarks')
+    parser.add_argument('--groups', nargs='+', default=None,
+                        choices=['indicator', 'strategy', 'base_filter', 'runner'],
+                        help='Only run these benchmark groups')
+    parser.add_argument('--output', default=None, type=str, help='Write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', default=None, type=str,
+                        help='A former JSON report, exit with 1 when a benchmark regresses by more than 20%%')
+    main(parser.parse_args())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/8/7 10:05
+@desc: A deterministic synthetic OHLCV universe served through the DataSource interface.
+"""
+import numpy as np
+import pandas as pd
+
+from si.lib.data_source import DataSource, QUOTE_COLUMN_LIST
+from si.lib.quote_arrays import QuoteArrays
+
+# The first quote_date, as the yyyymmdd integers of the database #
+FIRST_QUOTE_DATE = '2000-01-03'
+
+SECTORS = ['Technology', 'Finance', 'Energy', 'Consumer Cyclical', 'Industrials', 'Healthcare']
+
+
+def quote_dates(n_days):
+    """
+    Returns:
+        An int64 ndarray of n_days business days like 20000103.
+    """
+    dates = pd.bdate_range(FIRST_QUOTE_DATE, periods=n_days)
+    return (dates.year * 10000 + dates.month * 100 + dates.day).values.astype(np.int64)
+
+
+def make_quotes(n_days, seed):
+    """
+    Generate the quotes of one ticker: a geometric random walk whose volatility switches between calm and volatile
+    regimes, with volume that spikes together with the large moves, so the base filter and the strategies fire now
+    and then like on real data.
+    Args:
+        n_days: int.
+            The number of bars.
+        seed: int.
+            The same seed always gives the same quotes.
+
+    Returns:
+        QuoteArrays.
+    """
+    rng = np.random.default_rng(seed)
+    volatile = np.repeat(rng.random(n_days // 50 + 1) < 0.3, 50)[:n_days]
+    daily_sigma = np.where(volatile, 0.035, 0.012)
+    returns = rng.normal(0.0003, 1.0, n_days) * daily_sigma
+
+    close = rng.uniform(2, 80) * np.exp(np.cumsum(returns))
+    open_ = close * np.exp(rng.normal(0, 0.005, n_days))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, daily_sigma / 2)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, daily_sigma / 2)))
+
+    base_volume = rng.uniform(2e5, 3e6)
+    volume = base_volume * np.exp(rng.normal(0, 0.3, n_days) + 15 * np.abs(returns))
+
+    return QuoteArrays(quote_dates(n_days), open_, close, high, low, volume.astype(np.int64) + 101)
+
+
+def make_companies(n_tickers):
+    """
+    Returns:
+        DataFrame of companies with the columns of get_companies_with_id, the ids are 1 to n_tickers.
+    """
+    company_ids = np.arange(1, n_tickers + 1)
+    return pd.DataFrame({
+        'id': company_ids,
+        'symbol': [f'SYN{company_id:05d}' for company_id in company_ids],
+        'name': [f'Synthetic {company_id}' for company_id in company_ids],
+        'ipo_year': 2000,
+        'sector': [SECTORS[company_id % len(SECTORS)] for company_id in company_ids],
+        'industry': 'Synthetic',
+        'last_quote_dt': 'synthetic',
+    })
+
+
+class SyntheticDataSource(DataSource):
+    """
+    Serve a universe of n_tickers tickers with n_days bars each. The quotes of a ticker are generated on demand from
+    seed + company id, so a large universe never has to fit in memory and every run sees the same data.
+
+    The quote_filter only drops companies by sector here, the quote thresholds are left to the base filter.
+    """
+
+    def __init__(self, n_tickers, n_days, seed=0):
+        self.n_tickers = n_tickers
+        self.n_days = n_days
+        self.seed = seed
+        self._companies = make_companies(n_tickers)
+
+    def connect(self):
+        pass
+
+    def close_db(self):
+        pass
+
+    def get_companies_with_id(self, quote_filter=None):
+        if quote_filter is None:
+            return self._companies.copy()
+
+        keep = [quote_filter.accept_company(company) for _, company in self._companies.iterrows()]
+        return self._companies[keep].reset_index(drop=True)
+
+    def iter_quotes_by_company_ids(self, company_ids, after_dates=None, quote_window=None, as_arrays=False):
+        if after_dates is None:
+            after_dates = [None] * len(company_ids)
+
+        for company_id, after_date in zip(company_ids, after_dates):
+            quotes = make_quotes(self.n_days, self.seed + int(company_id))
+            if after_date is not None:
+                quotes = quotes[quotes.quote_date > after_date]
+            if quote_window is not None:
+                quotes = quote_window.slice(quotes)
+
+            if as_arrays:
+                yield quotes
+            else:
+                yield quotes.to_frame()[QUOTE_COLUMN_LIST]
@@ -4,35 +4,144 @@
 @author: Maple.S
 @project: StockInsight
 @time: 2021/1/9 19:42
-@desc:
+@desc: The command line of the scans, back tests, sweeps and replays.
+
+    python main.py run --strategies bigspike stable_break
+    python main.py run --symbols AAPL
+    python main.py backtest --past_ob_window 100 --future_window 20
+    python main.py sweep
+
+The subcommands import NumPy, pandas and the data backends when they run, so --help and argument errors return
+without loading them.
 """
 import argparse
-import yaml
 
-from si.strategy.bigspike_strategy import BigSpikeStrategy
-from si.strategy.stable_break_strategy import StableBreakStrategy
-from si.strategy_runner import StrategyRunner
+from si.config import load_config, validate_config
+from si.strategy.registry import get_strategy_class, strategy_names
+
+
+def _build_runner(args, config):
+    strategy_classes = [get_strategy_class(name) for name in args.strategies]
+    validate_config(config, strategy_classes)
+
+    from si.strategy_runner import StrategyRunner
+    # run strategies, every ticker is loaded once for all of them
+    return StrategyRunner([strategy_cls(config) for strategy_cls in strategy_classes], config)
+
+
+def run(args, config):
+    runner = _build_runner(args, config)
+    if args.incremental:
+        runner.run_incremental(past_ob_window=args.past_ob_window)
+    elif args.panel:
+        runner.run_panel(past_ob_window=args.past_ob_window)
+    else:
+        runner.run(past_ob_window=args.past_ob_window, symbols=args.symbols)
+
+
+def backtest(args, config):
+    runner = _build_runner(args, config)
+    signals = runner.back_test(args.past_ob_window, args.future_window, start_date=args.start_date,
+                               end_date=args.end_date, symbols=args.symbols)
+    print(signals.to_string())
+
+
+def sweep(args, config):
+    sweep_config = config.get('sweep')
+    strategy_classes = []
+    if isinstance(sweep_config, dict) and 'strategy' in sweep_config:
+        strategy_classes.append(get_strategy_class(sweep_config['strategy']))
+    validate_config(config, strategy_classes, sweep=True)
+
+    from si.parameter_sweep import ParameterSweep
+    print(ParameterSweep(strategy_classes[0], config).run().to_string())
+
+
+def replay(args, config):
+    runner = _build_runner(args, config)
+
+    from si.replay_engine import ReplayEngine
+    trades, equity = ReplayEngine(runner, config).run(start_date=args.start_date, end_date=args.end_date)
+    print(trades.to_string())
+    if len(equity) > 0:
+        print(f"Final equity: {equity['equity'].iloc[-1]:.2f}, Trades: {len(trades)}")
+
+
+def export(args, config):
+    validate_config(config)
+
+    # pyarrow is only needed to write or read a snapshot
+    from si.lib.data_source import create_data_source
+    from si.lib.parquet_source import write_parquet_snapshot
+    data_source = create_data_source(config['data'])
+    data_source.connect()
+    n_companies = write_parquet_snapshot(data_source, args.path)
+    data_source.close_db()
+    print(f"Exported {n_companies} companies to {args.path}")
 
 
 def main(args):
     # read config
-    config_filename = args.config_filename
-    with open(config_filename) as config_file:
-        config = yaml.load(config_file, Loader=yaml.FullLoader)
+    config = load_config(args.config_filename)
+    args.command(args, config)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config_filename', default='config/local.yaml', type=str, required=False,
+                        help='Configuration filename')
+    subparsers = parser.add_subparsers(required=True, metavar='command')
+
+    strategies_parser = argparse.ArgumentParser(add_help=False)
+    strategies_parser.add_argument('--strategies', nargs='+', default=['stable_break'], choices=strategy_names(),
+                                   help='Strategies to run over the same scan, their signals are tagged with the '
+                                        'strategy name')
+
+    symbols_parser = argparse.ArgumentParser(add_help=False)
+    symbols_parser.add_argument('--symbols', nargs='+', default=None,
+                                help='Only scan these tickers instead of the whole universe')
 
-    # run strategy
-    # strategy = BigSpikeStrategy(config)
-    strategy = StableBreakStrategy(config)
+    date_range_parser = argparse.ArgumentParser(add_help=False)
+    date_range_parser.add_argument('--start_date', default=None, type=int, required=False,
+                                   help='The first quote_date, like 20210104')
+    date_range_parser.add_argument('--end_date', default=None, type=int, required=False,
+                                   help='The last quote_date, like 20211231')
 
-    runner = StrategyRunner(strategy, config)
-    # runner.back_test(past_ob_window=100, future_window=20)
-    runner.run(past_ob_window=20)
+    run_parser = subparsers.add_parser('run', parents=[strategies_parser, symbols_parser],
+                                       help='Print the signals of the strategies over the last dates')
+    run_parser.add_argument('--past_ob_window', default=20, type=int,
+                            help='Number of last dates whose signals are printed')
+    mode_group = run_parser.add_mutually_exclusive_group()
+    mode_group.add_argument('--incremental', action='store_true',
+                            help='Only evaluate the bars that arrived since the last incremental run')
+    mode_group.add_argument('--panel', action='store_true',
+                            help='Evaluate all tickers at once on a date x ticker panel of the last dates')
+    run_parser.set_defaults(command=run)
+
+    backtest_parser = subparsers.add_parser('backtest', parents=[strategies_parser, symbols_parser, date_range_parser],
+                                            help='Print the signals of the strategies with their ROI in the future '
+                                                 'window')
+    backtest_parser.add_argument('--past_ob_window', default=100, type=int,
+                                 help='Number of dates back tested before the future window, unless a date range '
+                                      'is set')
+    backtest_parser.add_argument('--future_window', default=20, type=int,
+                                 help='Number of dates after a signal whose ROI is measured')
+    backtest_parser.set_defaults(command=backtest)
+
+    sweep_parser = subparsers.add_parser('sweep', help='Back test the grid of the sweep config section')
+    sweep_parser.set_defaults(command=sweep)
+
+    replay_parser = subparsers.add_parser('replay', parents=[strategies_parser, date_range_parser],
+                                          help='Replay the bars of all tickers in time order and simulate the trades '
+                                               'of the strategies')
+    replay_parser.set_defaults(command=replay)
+
+    export_parser = subparsers.add_parser('export', help='Write the quotes of the data source to a Parquet snapshot')
+    export_parser.add_argument('path', type=str, help='The snapshot directory')
+    export_parser.set_defaults(command=export)
+
+    return parser
 
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    config_name = 'config/local.yaml'
-    parser.add_argument('--config_filename', default=config_name, type=str, required=False,
-                        help='Configuration filename')
-    args = parser.parse_args()
-    main(args)
+    main(build_parser().parse_args())
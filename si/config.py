@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/9/18 10:52
+@desc: Load and validate the YAML config, without importing the scan dependencies.
+"""
+import yaml
+
+# The libyaml loader when PyYAML is built with it, the config only holds plain scalars, lists and mappings #
+CONFIG_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# The keys of the data config section that every backend needs #
+DATA_BACKEND_KEYS = {
+    'postgres': ['database', 'user', 'password', 'host', 'port'],
+    'sqlite': ['path'],
+    'parquet': ['path'],
+}
+
+
+def load_config(config_filename):
+    """
+    Returns:
+        The config dict of config_filename.
+    """
+    with open(config_filename) as config_file:
+        config = yaml.load(config_file, Loader=CONFIG_LOADER)
+    if not isinstance(config, dict):
+        raise ValueError(f"Invalid config {config_filename}: expected a mapping of sections")
+    return config
+
+
+def has_config_key(config, dotted_key):
+    """
+    Whether the dotted key, e.g. 'strategy.bigspike.ob_window', is set in config.
+    """
+    section = config
+    for key in dotted_key.split('.'):
+        if not isinstance(section, dict) or key not in section:
+            return False
+        section = section[key]
+    return True
+
+
+def validate_config(config, strategy_classes=(), sweep=False):
+    """
+    Check the config once before a command runs, so a missing key fails up front instead of in a worker process
+    halfway through a scan.
+    Args:
+        config: dict.
+        strategy_classes: list of BaseStrategy subclasses.
+            The strategies to run, their required_config keys must be set.
+        sweep: bool, default false.
+            Whether the sweep section is needed.
+
+    Raises:
+        ValueError listing every problem of the config.
+    """
+    errors = []
+    data_config = config.get('data')
+    if not isinstance(data_config, dict):
+        errors.append("missing section: data")
+    else:
+        backend = data_config.get('backend', 'postgres')
+        if backend not in DATA_BACKEND_KEYS:
+            errors.append(f"unknown data backend: {backend}, expected one of {list(DATA_BACKEND_KEYS.keys())}")
+        else:
+            errors.extend(f"missing key: data.{key} of the {backend} backend"
+                          for key in DATA_BACKEND_KEYS[backend] if key not in data_config)
+
+    required_keys = []
+    for strategy_cls in strategy_classes:
+        for key in strategy_cls.required_config:
+            if key not in required_keys:
+                required_keys.append(key)
+    errors.extend(f"missing key: {key}" for key in required_keys if not has_config_key(config, key))
+
+    if sweep:
+        sweep_config = config.get('sweep')
+        if not isinstance(sweep_config, dict):
+            errors.append("missing section: sweep")
+        elif 'strategy' not in sweep_config:
+            errors.append("missing key: sweep.strategy")
+        elif not isinstance(sweep_config.get('grid'), dict):
+            errors.append("missing key: sweep.grid")
+        else:
+            # the grid overrides existing keys, a typo would silently sweep nothing
+            errors.extend(f"unknown sweep.grid key: {key}" for key in sweep_config['grid']
+                          if not has_config_key(config, key))
+
+    if len(errors) > 0:
+        raise ValueError("Invalid config:\n  " + "\n  ".join(errors))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/7/31 10:18
+@desc: The interface of the quote data backends.
+"""
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from si.config import DATA_BACKEND_KEYS
+from si.lib.profiler import NULL_PROFILER
+from si.lib.quote_arrays import QUOTE_COLUMN_DTYPES, COMPACT_QUOTE_COLUMN_DTYPES
+
+# Columns Name #
+COMPANY_COLUMN_LIST = ['symbol', 'name', 'ipo_year', 'sector', 'industry']
+
+QUOTE_COLUMN_LIST = ['quote_date', 'open', 'close', 'high', 'low', 'volume']
+
+# Data backends of the data config section #
+DATA_BACKENDS = list(DATA_BACKEND_KEYS.keys())
+
+
+def default_company_filter(quotes):
+    """
+    The default company filter, drop the company whose volume is less than 100 on any day.
+    """
+    return np.all(quotes.volume > 100)
+
+
+class DataSource(ABC):
+    """
+    Where the companies and their quotes are read from. StrategyRunner, QuoteCache and ParameterSweep only use this
+    interface, so a backtest runs the same against Postgres, a SQLite file or a local Parquet snapshot.
+
+    A backend implements connect, close_db, get_companies_with_id and iter_quotes_by_company_ids, and overrides the
+    other methods when it can answer them faster, e.g. DBService loads all quotes in one ordered query.
+    """
+    # StrategyRunner replaces it when the profiling is enabled #
+    profiler = NULL_PROFILER
+
+    # The dtypes of the fetched quote columns, create_data_source sets COMPACT_QUOTE_COLUMN_DTYPES with compact_quotes #
+    quote_dtypes = QUOTE_COLUMN_DTYPES
+
+    @abstractmethod
+    def connect(self):
+        pass
+
+    @abstractmethod
+    def close_db(self):
+        pass
+
+    def get_companies(self):
+        """
+
+        Returns:
+            DataFrame of companies
+        """
+        return self.get_companies_with_id()[COMPANY_COLUMN_LIST]
+
+    @abstractmethod
+    def get_companies_with_id(self, quote_filter=None):
+        """
+
+        Args:
+            quote_filter: QuoteFilterSpec, optional.
+                When it's set, only the companies kept by the filter are returned.
+
+        Returns:
+            DataFrame of companies with their id and last_quote_dt, sorted by id ascending.
+        """
+        pass
+
+    @abstractmethod
+    def iter_quotes_by_company_ids(self, company_ids, after_dates=None, quote_window=None, as_arrays=False):
+        """
+        Get the quotes of many companies.
+        Args:
+            company_ids: list of int.
+                The company ids.
+            after_dates: list, optional.
+                One per company. When it's set, only the quotes with quote_date greater than the company's after_date
+                are returned, None means all quotes.
+            quote_window: QuoteWindow, optional.
+                When it's set, only the quotes in the window are returned.
+            as_arrays: bool, default False.
+                Yield the quotes as QuoteArrays instead of DataFrames.
+
+        Returns:
+            The quotes of every company in the order of company_ids, sorted by quote_date ascending.
+        """
+        pass
+
+    def get_quote_arrays_by_company_id(self, company_id, after_date=None, quote_window=None):
+        """
+        Get the quotes specified by company id as QuoteArrays, see iter_quotes_by_company_ids.
+        """
+        return next(iter(self.iter_quotes_by_company_ids([company_id], [after_date], quote_window, as_arrays=True)))
+
+    def iter_company_quotes(self, as_arrays=False, after_date=None, quote_filter=None, quote_window=None):
+        """
+        Pair every company with its quotes.
+        Args:
+            as_arrays: bool, default False.
+                Build QuoteArrays instead of DataFrames.
+            after_date: optional
+                When it's set, only the quotes with quote_date greater than after_date are loaded.
+            quote_filter: QuoteFilterSpec, optional.
+                When it's set, only the companies kept by the filter are loaded.
+            quote_window: QuoteWindow, optional.
+                When it's set, only the quotes in the window are loaded.
+
+        Returns:
+            A tuple like (company, quotes). The quotes of a company without any quote is empty.
+        """
+        companies = self.get_companies_with_id(quote_filter)
+        quotes_iter = self.iter_quotes_by_company_ids(companies['id'].tolist(), [after_date] * len(companies),
+                                                      quote_window, as_arrays)
+        for (_, company), quotes in zip(companies.iterrows(), quotes_iter):
+            yield company, quotes
+
+    def get_all_company_quotes(self, company_filter_func=default_company_filter):
+        """
+
+        Args:
+            company_filter_func: function, default filter volume less than 100.
+                A function that operates on all quotes of a company. When it returns true, keep the company's quotes,
+                otherwise drop the company's quotes.
+
+        Returns:
+            A dict with key that's stock symbol and value that's quotes
+        """
+        all_quotes = {}
+        for company, quotes in self.get_all_company_quotes_iterator(company_filter_func):
+            all_quotes[company['symbol']] = quotes
+
+        return all_quotes
+
+    def get_all_company_quotes_iterator(self, company_filter_func=default_company_filter,
+                                        companies=None, as_arrays=False, quote_filter=None, quote_window=None):
+        """
+
+        Args:
+            company_filter_func: function, default filter volume less than 100.
+                A function that operates on all quotes of a company. When it returns true, keep the company's quotes,
+                otherwise drop the company's quotes.
+            companies: DataFrame, optional.
+                A subset of get_companies_with_id(). When it's set, the quotes of these companies are fetched one
+                company at a time instead of by iter_company_quotes.
+            as_arrays: bool, default False.
+                Yield the quotes as QuoteArrays instead of DataFrames.
+            quote_filter: QuoteFilterSpec, optional.
+                When it's set, the companies dropped by the filter are excluded by the backend.
+            quote_window: QuoteWindow, optional.
+                When it's set, only the quotes in the window are loaded, and company_filter_func only sees them.
+
+        Returns:
+            A tuple like (company, quotes)
+        """
+        if companies is None:
+            company_quotes = self.iter_company_quotes(as_arrays=as_arrays, quote_filter=quote_filter,
+                                                      quote_window=quote_window)
+        else:
+            company_quotes = zip((company for _, company in companies.iterrows()),
+                                 self.iter_quotes_by_company_ids(companies['id'].tolist(), quote_window=quote_window,
+                                                                 as_arrays=as_arrays))
+
+        for company, quotes in company_quotes:
+            # filter quotes
+            if company_filter_func is None or company_filter_func(quotes):
+                yield company, quotes
+
+
+def create_data_source(data_config):
+    """
+    Build the data backend of the data config section:
+        backend: postgres (default), sqlite or parquet.
+        postgres: database, user, password, host, port, and pool_size > 1 for a PooledDBService.
+        sqlite: path of the database file, with the same tables as Postgres.
+        parquet: path of a snapshot written by si.lib.parquet_source.write_parquet_snapshot.
+        compact_quotes: fetch the quotes as COMPACT_QUOTE_COLUMN_DTYPES, false by default.
+
+    Returns:
+        DataSource, not connected yet.
+    """
+    backend = data_config.get('backend', 'postgres')
+    if backend not in DATA_BACKENDS:
+        raise ValueError(f"Unknown data backend: {backend}, expected one of {DATA_BACKENDS}")
+
+    # the backends are imported on demand, so e.g. pyarrow is only needed by the parquet backend
+    if backend == 'parquet':
+        from si.lib.parquet_source import ParquetDataSource
+        source = ParquetDataSource(data_config['path'])
+    elif backend == 'sqlite':
+        from si.lib.db_operation import SQLiteDBService
+        source = SQLiteDBService(data_config['path'])
+    else:
+        from si.lib.db_operation import DBService, PooledDBService
+        db_kwargs = dict(database=data_config['database'], user=data_config['user'],
+                         password=data_config['password'], host=data_config['host'], port=data_config['port'])
+        if data_config.get('pool_size', 1) > 1:
+            source = PooledDBService(pool_size=data_config['pool_size'], **db_kwargs)
+        else:
+            source = DBService(**db_kwargs)
+
+    if data_config.get('compact_quotes', False):
+        source.quote_dtypes = COMPACT_QUOTE_COLUMN_DTYPES
+    return source
@@ -1,16 +1,28 @@
-import psycopg2 as db
+import queue
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+
 import pandas as pd
-import numpy as np
 
-# Columns Name #
-COMPANY_COLUMN_LIST = ['symbol', 'name', 'ipo_year', 'sector', 'industry']
+from si.lib.data_source import DataSource, COMPANY_COLUMN_LIST
+from si.lib.prefetch import ordered_map
+from si.lib.quote_arrays import QuoteArrays
 
-QUOTE_COLUMN_LIST = ['quote_date', 'open', 'close', 'high', 'low', 'volume']
+# Number of rows fetched per round trip by the server-side cursor
+QUOTE_FETCH_BATCH_SIZE = 100000
 
 # Select SQL #
 SELECT_ALL_COMPANIES_SQL = 'SELECT com.symbol, com.name, com.ipo_year, com.sector, com.industry \
     FROM company com'
 
+SELECT_ALL_COMPANIES_WITH_ID_SQL = 'SELECT com.id, com.symbol, com.name, com.ipo_year, com.sector, com.industry, \
+    com.last_quote_dt \
+    FROM company com \
+    {where} \
+    ORDER BY com.id ASC'
+
 SELECT_COMPANY_WITH_STATISTICS_SQL = 'SELECT com.id, com.symbol, com.name, com.sector, com.last_quote_dt, st.insider_own_perc, st.inst_own_perc, st.shs_outstand, st.shs_float \
     FROM company com JOIN company_statistics st ON com.id = st.company_id'
 
@@ -19,8 +31,54 @@ SELECT_QUOTES_BY_SYMBOL_SQL = 'SELECT quo.quote_date, quo.open, quo.close, quo.h
     WHERE com.symbol LIKE \'%s\' \
     ORDER BY quo.quote_date ASC'
 
+SELECT_QUOTES_BY_COMPANY_ID_SQL = 'SELECT quo.quote_date, quo.open, quo.close, quo.high, quo.low, quo.volume \
+    FROM stock_quote quo \
+    WHERE quo.company_id = %s \
+    ORDER BY quo.quote_date ASC'
+
+SELECT_QUOTES_BY_COMPANY_ID_AFTER_DATE_SQL = 'SELECT quo.quote_date, quo.open, quo.close, quo.high, quo.low, quo.volume \
+    FROM stock_quote quo \
+    WHERE quo.company_id = %s AND quo.quote_date > %s \
+    ORDER BY quo.quote_date ASC'
+
+SELECT_ALL_QUOTES_SQL = 'SELECT quo.company_id, quo.quote_date, quo.open, quo.close, quo.high, quo.low, quo.volume \
+    FROM stock_quote quo \
+    {where} \
+    ORDER BY quo.company_id ASC, quo.quote_date ASC'
+
+# The last %s quotes of every company #
+SELECT_TRAILING_QUOTES_SQL = 'SELECT quo.company_id, quo.quote_date, quo.open, quo.close, quo.high, quo.low, quo.volume \
+    FROM (SELECT quo.company_id, quo.quote_date, quo.open, quo.close, quo.high, quo.low, quo.volume, \
+    ROW_NUMBER() OVER (PARTITION BY quo.company_id ORDER BY quo.quote_date DESC) AS row_num \
+    FROM stock_quote quo \
+    {where}) quo \
+    WHERE quo.row_num <= %s \
+    ORDER BY quo.company_id ASC, quo.quote_date ASC'
+
+# The quotes of every company within {range_where}, padded with %s quotes before and %s quotes after #
+SELECT_DATE_RANGE_QUOTES_SQL = 'WITH numbered AS ( \
+    SELECT quo.company_id, quo.quote_date, quo.open, quo.close, quo.high, quo.low, quo.volume, \
+    ROW_NUMBER() OVER (PARTITION BY quo.company_id ORDER BY quo.quote_date ASC) AS row_num \
+    FROM stock_quote quo \
+    {where}), \
+    bounds AS ( \
+    SELECT quo.company_id, MIN(quo.row_num) AS first_row_num, MAX(quo.row_num) AS last_row_num \
+    FROM numbered quo \
+    {range_where} \
+    GROUP BY quo.company_id) \
+    SELECT quo.company_id, quo.quote_date, quo.open, quo.close, quo.high, quo.low, quo.volume \
+    FROM numbered quo JOIN bounds ON bounds.company_id = quo.company_id \
+    WHERE quo.row_num >= bounds.first_row_num - %s AND quo.row_num <= bounds.last_row_num + %s \
+    ORDER BY quo.company_id ASC, quo.quote_date ASC'
+
+
+def _where_sql(where_list):
+    if len(where_list) == 0:
+        return ''
+    return 'WHERE ' + ' AND '.join(where_list)
+
 
-class DBService:
+class DBService(DataSource):
 
     def __init__(self, database='ps', user='postgres', password='123456', host='localhost', port='5432'):
         self.database = database
@@ -33,12 +91,21 @@ class DBService:
         self.cursor = None
 
     def connect(self):
-        self.conn = db.connect(database=self.database, user=self.user, password=self.password, host=self.host,
-                               port=self.port)
+        self.conn = self._new_connection()
         self.cursor = self.conn.cursor()
 
+    def _new_connection(self):
+        # psycopg2 is only needed by Postgres, the SQLite backend shares this module without it
+        import psycopg2
+        return psycopg2.connect(database=self.database, user=self.user, password=self.password, host=self.host,
+                                port=self.port)
+
     def close_db(self):
-        self.conn.close()
+        # also called in a finally after a failed connect
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+            self.cursor = None
 
     def get_companies(self):
         """
@@ -50,59 +117,372 @@ class DBService:
         # return np.array(self.cursor.fetchall())
         return pd.DataFrame(data=self.cursor.fetchall(), columns=COMPANY_COLUMN_LIST)
 
-    def get_quotes_by_symbol(self, symbol):
+    def get_quotes_by_symbol(self, symbol, quote_window=None):
         """
         Get the quotes DataFrame specified by symbol.
         Args:
             symbol: str
                 The stock symbol.
+            quote_window: QuoteWindow, optional.
+                When it's set, only the quotes in the window are returned.
 
         Returns:
+            DataFrame of quotes with the columns of quote_dtypes, sorted by quote_date ascending.
+        """
+        if quote_window is None:
+            self.cursor.execute(SELECT_QUOTES_BY_SYMBOL_SQL % symbol)
+            rows = self.cursor.fetchall()
+        else:
+            sql, params = self._select_quotes_sql(
+                ['quo.company_id IN (SELECT com.id FROM company com WHERE com.symbol = %s)'], (symbol,), quote_window)
+            self.cursor.execute(sql, params)
+            rows = [row[1:] for row in self.cursor.fetchall()]
+        return QuoteArrays.from_rows(rows, self.quote_dtypes).to_frame()
 
+    def get_companies_with_id(self, quote_filter=None):
         """
-        self.cursor.execute(SELECT_QUOTES_BY_SYMBOL_SQL % symbol)
-        return pd.DataFrame(data=self.cursor.fetchall(), columns=QUOTE_COLUMN_LIST)
 
-    def get_all_company_quotes(self, company_filter_func=lambda quotes: np.all(quotes.volume > 100)):
+        Args:
+            quote_filter: QuoteFilterSpec, optional.
+                When it's set, only the companies kept by the filter are returned.
+
+        Returns:
+            DataFrame of companies with their id and last_quote_dt, sorted by id ascending.
         """
+        where_list, params = self._quote_filter_where(quote_filter, 'com.id')
+        self.cursor.execute(SELECT_ALL_COMPANIES_WITH_ID_SQL.format(where=_where_sql(where_list)), params)
+        return pd.DataFrame(data=self.cursor.fetchall(), columns=['id'] + COMPANY_COLUMN_LIST + ['last_quote_dt'])
 
+    def get_quote_arrays_by_company_id(self, company_id, after_date=None, quote_window=None):
+        """
+        Get the quotes specified by company id as QuoteArrays.
         Args:
-            company_filter_func: function, default filter volume less than 100.
-                A function that operates on all quotes of a company. When it returns true, keep the company's quotes,
-                otherwise drop the company's quotes.
+            company_id: int
+                The company id.
+            after_date: optional
+                When it's set, only the quotes with quote_date greater than after_date are returned.
+            quote_window: QuoteWindow, optional.
+                When it's set, only the quotes in the window are returned.
 
         Returns:
-            A dict with key that's stock symbol and value that's quotes
+            QuoteArrays, sorted by quote_date ascending.
         """
-        companies = self.get_companies()
-        all_quotes = {}
-        for symbol in companies.symbol.values:
-            quotes = self.get_quotes_by_symbol(symbol)
-            # filter quotes
-            if company_filter_func is None or company_filter_func(quotes):
-                all_quotes[symbol] = quotes
+        rows = self._fetch_quotes_by_company_id(company_id, after_date, quote_window)
+        return QuoteArrays.from_rows(rows, self.quote_dtypes)
 
-        return all_quotes
+    def iter_quotes_by_company_ids(self, company_ids, after_dates=None, quote_window=None, as_arrays=False):
+        """
+        Get the quotes of many companies, one query per company.
+        Args:
+            company_ids: list of int.
+                The company ids.
+            after_dates: list, optional.
+                One per company. When it's set, only the quotes with quote_date greater than the company's after_date
+                are returned, None means all quotes.
+            quote_window: QuoteWindow, optional.
+                When it's set, only the quotes in the window are returned.
+            as_arrays: bool, default False.
+                Yield the quotes as QuoteArrays instead of DataFrames.
 
-    def get_all_company_quotes_iterator(self, company_filter_func=lambda quotes: np.all(quotes.volume > 100)):
+        Returns:
+            The quotes of every company in the order of company_ids, sorted by quote_date ascending.
         """
+        if after_dates is None:
+            after_dates = [None] * len(company_ids)
 
+        for rows in self._map_fetch_quotes(zip(company_ids, after_dates), quote_window):
+            with self.profiler.stage('db.build'):
+                if as_arrays:
+                    quotes = QuoteArrays.from_rows(rows, self.quote_dtypes)
+                else:
+                    quotes = QuoteArrays.from_rows(rows, self.quote_dtypes).to_frame()
+            yield quotes
+
+    def _map_fetch_quotes(self, requests, quote_window=None):
+        """
+        Run _fetch_quotes_by_company_id for every (company_id, after_date) of requests, one at a time.
+        """
+        for company_id, after_date in requests:
+            yield self._fetch_quotes_by_company_id(company_id, after_date, quote_window)
+
+    def _fetch_quotes_by_company_id(self, company_id, after_date=None, quote_window=None, cursor=None):
+        """
         Args:
-            company_filter_func: function, default filter volume less than 100.
-                A function that operates on all quotes of a company. When it returns true, keep the company's quotes,
-                otherwise drop the company's quotes.
+            cursor: optional.
+                The cursor to run the query, self.cursor when it's None.
 
         Returns:
-            A tuple like (company, quotes)
+            A list of rows like (quote_date, open, close, high, low, volume), sorted by quote_date ascending.
         """
-        companies = self.get_companies()
+        if cursor is None:
+            cursor = self.cursor
+
+        with self.profiler.stage('db.query'):
+            rows = self._run_quotes_query(cursor, company_id, after_date, quote_window)
+        self.profiler.count('rows_fetched', len(rows))
+        return rows
+
+    def _run_quotes_query(self, cursor, company_id, after_date, quote_window):
+        if quote_window is not None:
+            where_list = ['quo.company_id = %s']
+            params = (int(company_id),)
+            if after_date is not None:
+                where_list.append('quo.quote_date > %s')
+                params += (after_date,)
+            sql, params = self._select_quotes_sql(where_list, params, quote_window)
+            cursor.execute(sql, params)
+            return [row[1:] for row in cursor.fetchall()]
+
+        if after_date is None:
+            cursor.execute(SELECT_QUOTES_BY_COMPANY_ID_SQL, (int(company_id),))
+        else:
+            cursor.execute(SELECT_QUOTES_BY_COMPANY_ID_AFTER_DATE_SQL, (int(company_id), after_date))
+        return cursor.fetchall()
+
+    def iter_quote_blocks(self, batch_size=QUOTE_FETCH_BATCH_SIZE, as_arrays=False, after_date=None,
+                          quote_filter=None, quote_window=None):
+        """
+        Load the quotes of all companies in one ordered query through a server-side cursor, and split them by
+        company_id.
+        Args:
+            batch_size: int, default QUOTE_FETCH_BATCH_SIZE.
+                The number of rows fetched per round trip.
+            as_arrays: bool, default False.
+                Build QuoteArrays instead of DataFrames.
+            after_date: optional
+                When it's set, only the quotes with quote_date greater than after_date are loaded.
+            quote_filter: QuoteFilterSpec, optional.
+                When it's set, only the quotes of the companies kept by the filter are loaded.
+            quote_window: QuoteWindow, optional.
+                When it's set, only the quotes in the window are loaded, e.g. the last N quotes of every company.
+
+        Returns:
+            A tuple like (company_id, quotes), sorted by company_id ascending.
+        """
+        where_list, params = self._quote_filter_where(quote_filter, 'quo.company_id')
+        if after_date is not None:
+            where_list.append('quo.quote_date > %s')
+            params += (after_date,)
+
+        cursor = self.conn.cursor(name='all_quotes_cursor')
+        cursor.itersize = batch_size
+        try:
+            with self.profiler.stage('db.query'):
+                cursor.execute(*self._select_quotes_sql(where_list, params, quote_window))
+            for company_id, rows in groupby(cursor, key=itemgetter(0)):
+                # the rows are fetched from the server-side cursor batch by batch while they are grouped
+                with self.profiler.stage('db.fetch'):
+                    rows = [row[1:] for row in rows]
+                self.profiler.count('rows_fetched', len(rows))
+                with self.profiler.stage('db.build'):
+                    if as_arrays:
+                        quotes = QuoteArrays.from_rows(rows, self.quote_dtypes)
+                    else:
+                        quotes = QuoteArrays.from_rows(rows, self.quote_dtypes).to_frame()
+                yield company_id, quotes
+        finally:
+            cursor.close()
+
+    def iter_company_quotes(self, batch_size=QUOTE_FETCH_BATCH_SIZE, as_arrays=False, after_date=None,
+                            quote_filter=None, quote_window=None):
+        """
+        Pair every company with its quotes, using the bulk loader instead of one query per symbol.
+        Args:
+            batch_size: int, default QUOTE_FETCH_BATCH_SIZE.
+                The number of rows fetched per round trip.
+            as_arrays: bool, default False.
+                Build QuoteArrays instead of DataFrames.
+            after_date: optional
+                When it's set, only the quotes with quote_date greater than after_date are loaded.
+            quote_filter: QuoteFilterSpec, optional.
+                When it's set, only the companies kept by the filter are loaded.
+            quote_window: QuoteWindow, optional.
+                When it's set, only the quotes in the window are loaded.
+
+        Returns:
+            A tuple like (company, quotes). The quotes of a company without any quote is empty.
+        """
+        companies = self.get_companies_with_id(quote_filter)
+        blocks = self.iter_quote_blocks(batch_size, as_arrays, after_date, quote_filter, quote_window)
+
+        block_id, block = next(blocks, (None, None))
         for _, company in companies.iterrows():
-            symbol = company['symbol']
-            quotes = self.get_quotes_by_symbol(symbol)
-            # filter quotes
-            if company_filter_func is None or company_filter_func(quotes):
-                yield company, quotes
-
-    def execute_sql(self, sql):
-        self.cursor.execute(sql)
-        return np.array(self.cursor.fetchall())
+            # skip the quotes of unknown companies
+            while block_id is not None and block_id < company['id']:
+                block_id, block = next(blocks, (None, None))
+
+            if block_id == company['id']:
+                quotes = block
+                block_id, block = next(blocks, (None, None))
+            elif as_arrays:
+                quotes = QuoteArrays.from_rows([], self.quote_dtypes)
+            else:
+                quotes = QuoteArrays.from_rows([], self.quote_dtypes).to_frame()
+
+            yield company, quotes
+
+        blocks.close()
+
+    @staticmethod
+    def _quote_filter_where(quote_filter, company_id_column):
+        """
+        Returns:
+            A tuple like (where_list, params) restricting company_id_column to the companies kept by quote_filter.
+        """
+        if quote_filter is None:
+            return [], ()
+
+        company_id_sql, params = quote_filter.company_id_sql()
+        if company_id_sql is None:
+            return [], ()
+
+        return [company_id_column + ' IN (' + company_id_sql + ')'], params
+
+    @staticmethod
+    def _select_quotes_sql(where_list, params, quote_window=None):
+        """
+        Build the query of the quotes matching where_list, restricted to quote_window. The trailing window ranks the
+        quotes of every company by quote_date descending, the date range window locates the first and last quote in
+        the range of every company and pads them by row number, so both are answered in one query.
+
+        Returns:
+            A tuple like (sql, params) selecting the rows of (company_id, quote_date, open, close, high, low, volume),
+            sorted by company_id and quote_date ascending.
+        """
+        where = _where_sql(where_list)
+        if quote_window is not None and quote_window.is_date_range:
+            range_list = []
+            range_params = ()
+            if quote_window.start_date is not None:
+                range_list.append('quo.quote_date >= %s')
+                range_params += (quote_window.start_date,)
+            if quote_window.end_date is not None:
+                range_list.append('quo.quote_date <= %s')
+                range_params += (quote_window.end_date,)
+            sql = SELECT_DATE_RANGE_QUOTES_SQL.format(where=where, range_where=_where_sql(range_list))
+            return sql, tuple(params) + range_params + (quote_window.n_before, quote_window.n_after)
+
+        if quote_window is not None and quote_window.last_n is not None:
+            return SELECT_TRAILING_QUOTES_SQL.format(where=where), tuple(params) + (quote_window.last_n,)
+
+        return SELECT_ALL_QUOTES_SQL.format(where=where), tuple(params)
+
+
+class _SQLiteCursor(object):
+    """
+    Run the queries of DBService, written for psycopg2, on a sqlite3 cursor: the %s placeholders become ?, and a
+    tuple parameter, e.g. of an IN clause, is expanded to one placeholder per item.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        # only meaningful for the server-side cursors of psycopg2
+        self.itersize = None
+
+    def execute(self, sql, params=()):
+        sql_parts = sql.split('%s')
+        query = [sql_parts[0]]
+        flat_params = []
+        for param, sql_part in zip(params, sql_parts[1:]):
+            if isinstance(param, tuple):
+                query.append('(' + ', '.join(['?'] * len(param)) + ')')
+                flat_params.extend(param)
+            else:
+                query.append('?')
+                flat_params.append(param)
+            query.append(sql_part)
+        self._cursor.execute(''.join(query), flat_params)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+
+class _SQLiteConnection(object):
+    """
+    A sqlite3 connection with the cursor interface of psycopg2 that DBService uses. It can be shared across threads,
+    e.g. with the prefetch thread of StrategyRunner.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+
+    def cursor(self, name=None):
+        # sqlite3 cursors already step through the rows lazily, so a named cursor is a plain one
+        return _SQLiteCursor(self._conn.cursor())
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLiteDBService(DBService):
+    """
+    A DBService over a SQLite database file with the company and stock_quote tables of the Postgres schema, e.g. a
+    local copy for backtests without a database server. Window functions need SQLite 3.25 or later.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def _new_connection(self):
+        return _SQLiteConnection(self.path)
+
+
+class PooledDBService(DBService):
+    """
+    A DBService with a pool of pool_size extra connections, so that the per-company queries of
+    iter_quotes_by_company_ids are kept in flight concurrently instead of one after another. The other queries still
+    run on the main connection.
+
+    The pool is a plain queue of connections made by _new_connection, so any DB-API driver whose connections can be
+    shared across threads works, e.g. an in-process SQLite database for testing.
+    """
+
+    def __init__(self, pool_size=4, **kwargs):
+        super().__init__(**kwargs)
+        self.pool_size = pool_size
+        self._pool = None
+        self._executor = None
+
+    def connect(self):
+        super().connect()
+        self._pool = queue.LifoQueue()
+        for _ in range(self.pool_size):
+            self._pool.put(self._new_connection())
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='quote-fetch')
+
+    def close_db(self):
+        # the running fetches put their connections back when they finish, so wait for them before the drain
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._pool is not None:
+            while not self._pool.empty():
+                self._pool.get_nowait().close()
+            self._pool = None
+        super().close_db()
+
+    def _map_fetch_quotes(self, requests, quote_window=None):
+        """
+        Run _fetch_quotes_by_company_id for every (company_id, after_date) of requests on the pooled connections,
+        keeping the results in order.
+        """
+        def fetch(request):
+            company_id, after_date = request
+            conn = self._pool.get()
+            try:
+                cursor = conn.cursor()
+                try:
+                    return self._fetch_quotes_by_company_id(company_id, after_date, quote_window, cursor)
+                finally:
+                    cursor.close()
+            finally:
+                self._pool.put(conn)
+
+        return ordered_map(fetch, requests, self.pool_size, executor=self._executor)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/7/3 11:20
+@desc: Memoized indicator arrays of one ticker.
+"""
+from collections import OrderedDict
+
+from si.lib.ta_lib import _as_float_array, moving_average_series, exp_moving_average_series, moving_max_series, \
+    moving_min_series, shift_series, moving_average, exp_moving_average, moving_max, moving_min, true_range_series, \
+    average_true_range_series, norm_price_series, money_flow_index_series, mass_index_series, volatility_series, \
+    volatility_an_series
+
+# Series indicators over one column that the store can compute #
+INDICATOR_FUNCS = {
+    'moving_average': moving_average_series,
+    'exp_moving_average': exp_moving_average_series,
+    'moving_max': moving_max_series,
+    'moving_min': moving_min_series,
+}
+
+# The scalar counterparts of INDICATOR_FUNCS, as function of (data_array, cur_idx, window) #
+SCALAR_FUNCS = {
+    'moving_average': moving_average,
+    'exp_moving_average': exp_moving_average,
+    'moving_max': moving_max,
+    'moving_min': moving_min,
+}
+
+# Series indicators over the whole quotes, as function of (quotes, window) #
+QUOTE_INDICATOR_FUNCS = {
+    'true_range': lambda quotes, window: true_range_series(quotes),
+    'average_true_range': average_true_range_series,
+    'norm_price': lambda quotes, window: norm_price_series(quotes),
+    'money_flow_index': money_flow_index_series,
+    'mass_index': mass_index_series,
+    'volatility': volatility_series,
+    'volatility_an': volatility_an_series,
+}
+
+# Number of arrays kept before the least recently used ones are evicted #
+DEFAULT_MAX_ARRAYS = 128
+
+# Number of scalar values kept before the least recently used ones are evicted #
+DEFAULT_MAX_VALUES = 4096
+
+
+class IndicatorStore(object):
+    """
+    Compute every indicator of one ticker once, keyed by (indicator, column, window, shift), so the base filter and
+    all strategies, or all configurations of a parameter sweep, share them.
+
+    get returns whole arrays for the vectorized paths, value returns the indicator at one index for the per-index
+    paths, read from the array when it's already computed and otherwise computed from the tail of the window only.
+    Both are kept in least recently used order and evicted beyond max_arrays and max_values, so a long sweep over
+    many windows doesn't hold every array of a ticker.
+    """
+
+    def __init__(self, quotes, max_arrays=DEFAULT_MAX_ARRAYS, max_values=DEFAULT_MAX_VALUES):
+        self.quotes = quotes
+        self.max_arrays = max_arrays
+        self.max_values = max_values
+        self._arrays = OrderedDict()
+        self._values = OrderedDict()
+
+    def get(self, indicator, column, window, shift=0):
+        """
+        Args:
+            indicator: str.
+                A key of INDICATOR_FUNCS, or of QUOTE_INDICATOR_FUNCS with column None.
+            column: str.
+                The quote column, e.g. 'close'.
+            window: int > 0.
+                The size of observation window.
+            shift: int >= 0, default 0.
+                Shift the indicator forward, e.g. shift 1 gives the indicator of the window [i - window, i).
+
+        Returns:
+            A float ndarray with the same length as quotes.
+        """
+        key = (indicator, column, window, shift)
+        array = self._lookup(self._arrays, key)
+        if array is None:
+            if shift > 0:
+                array = shift_series(self.get(indicator, column, window), shift)
+            elif column is None:
+                array = QUOTE_INDICATOR_FUNCS[indicator](self.quotes, window)
+            else:
+                array = INDICATOR_FUNCS[indicator](self.column(column), window)
+            self._insert(self._arrays, key, array, self.max_arrays)
+        return array
+
+    def value(self, indicator, column, window, cur_idx, shift=0):
+        """
+        The indicator at cur_idx, the same as get(indicator, column, window, shift)[cur_idx].
+
+        Returns:
+            A scalar.
+        """
+        key = (indicator, column, window, shift)
+        array = self._lookup(self._arrays, key)
+        if array is not None:
+            return array[cur_idx]
+
+        value_key = key + (cur_idx,)
+        value = self._lookup(self._values, value_key)
+        if value is None:
+            idx = cur_idx - shift
+            if indicator not in SCALAR_FUNCS:
+                value = self.get(indicator, column, window)[idx] if idx >= 0 else float('nan')
+            elif idx < 0:
+                value = float('nan')
+            else:
+                value = SCALAR_FUNCS[indicator](getattr(self.quotes, column), idx, window)
+            self._insert(self._values, value_key, value, self.max_values)
+        return value
+
+    def column(self, column, shift=0):
+        """
+        Args:
+            column: str.
+                The quote column, e.g. 'close'.
+            shift: int >= 0, default 0.
+                Shift the column forward, e.g. shift 1 gives the previous day.
+
+        Returns:
+            A float64 ndarray with the same length as quotes.
+        """
+        key = ('column', column, None, shift)
+        array = self._lookup(self._arrays, key)
+        if array is None:
+            if shift > 0:
+                array = shift_series(self.column(column), shift)
+            else:
+                array = _as_float_array(getattr(self.quotes, column))
+            self._insert(self._arrays, key, array, self.max_arrays)
+        return array
+
+    @staticmethod
+    def _lookup(cache, key):
+        item = cache.get(key)
+        if item is not None:
+            cache.move_to_end(key)
+        return item
+
+    @staticmethod
+    def _insert(cache, key, item, max_size):
+        cache[key] = item
+        if len(cache) > max_size:
+            cache.popitem(last=False)
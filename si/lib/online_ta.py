@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/6/26 15:48
+@desc: Streaming indicators that are updated bar by bar at O(1) cost, mirroring si.lib.ta_lib.
+"""
+from collections import deque
+
+import numpy as np
+
+
+class OnlineMovingSum(object):
+    """
+    Sum of the last window values.
+    """
+
+    def __init__(self, window=14):
+        self.window = window
+        self._values = deque()
+        self._sum = 0.0
+
+    def update(self, x):
+        self._values.append(x)
+        self._sum += x
+        if len(self._values) > self.window:
+            self._sum -= self._values.popleft()
+        return self.value
+
+    @property
+    def value(self):
+        """
+        The sum, NaN until window values are received.
+        """
+        if len(self._values) < self.window:
+            return np.nan
+        return self._sum
+
+
+class OnlineMovingAverage(object):
+    """
+    Moving Average (MA) of the last window values, see ta_lib.moving_average.
+    """
+
+    def __init__(self, window=14):
+        self.window = window
+        self._sum = OnlineMovingSum(window)
+
+    def update(self, x):
+        self._sum.update(x)
+        return self.value
+
+    @property
+    def value(self):
+        return self._sum.value / self.window
+
+
+class OnlineExpMovingAverage(object):
+    """
+    Exponential Moving Average (EMA) with the windowed definition of ta_lib.exp_moving_average: the ema at index i is
+    seeded by x[i - window] and then updated by x in (i - window, i], that is
+        ema_i = (1 - alpha)^window * x[i - window] + alpha * sum_{k < window} (1 - alpha)^k * x[i - k]
+    The weighted sum is kept incrementally, adding the new value and removing the one that leaves the window.
+    """
+
+    def __init__(self, window=14):
+        self.window = window
+        self.alpha = 2 / (window + 1)
+        self._drop_weight = self.alpha * (1 - self.alpha) ** window
+        self._seed_weight = (1 - self.alpha) ** window
+        # x[i - window], ..., x[i]
+        self._values = deque(maxlen=window + 1)
+        self._weighted_sum = 0.0
+
+    def update(self, x):
+        if len(self._values) == self.window + 1:
+            # x[i - window + 1] leaves the weighted sum
+            self._weighted_sum = ((1 - self.alpha) * self._weighted_sum + self.alpha * x
+                                  - self._drop_weight * self._values[1])
+        elif len(self._values) > 0:
+            self._weighted_sum = (1 - self.alpha) * self._weighted_sum + self.alpha * x
+        self._values.append(x)
+        return self.value
+
+    @property
+    def value(self):
+        """
+        The ema, NaN until window + 1 values are received.
+        """
+        if len(self._values) <= self.window:
+            return np.nan
+        return self._seed_weight * self._values[0] + self._weighted_sum
+
+
+class OnlineAverageTrueRange(object):
+    """
+    Average True Range (ATR), see ta_lib.average_true_range.
+    """
+
+    def __init__(self, window=14):
+        self.window = window
+        self._true_range = OnlineMovingAverage(window)
+        self._pre_close = None
+
+    def update(self, bar):
+        """
+        Args:
+            bar: Bar.
+                Any object with the high, low and close attributes.
+        """
+        if self._pre_close is not None:
+            self._true_range.update(max(bar.high - bar.low, abs(bar.high - self._pre_close),
+                                        abs(bar.low - self._pre_close)))
+        self._pre_close = bar.close
+        return self.value
+
+    @property
+    def value(self):
+        return self._true_range.value
+
+
+class OnlineMoneyFlowIndex(object):
+    """
+    Money Flow Index (MFI), see ta_lib.money_flow_index.
+    """
+
+    def __init__(self, window=14):
+        self.window = window
+        self._pos_mf = OnlineMovingSum(window)
+        self._neg_mf = OnlineMovingSum(window)
+        self._prev_np = None
+
+    def update(self, bar):
+        """
+        Args:
+            bar: Bar.
+                Any object with the high, low, close and volume attributes.
+        """
+        cur_np = (bar.high + bar.low + bar.close) / 3
+        if self._prev_np is not None:
+            raw_mf = bar.volume * cur_np
+            self._pos_mf.update(raw_mf if self._prev_np < cur_np else 0.0)
+            self._neg_mf.update(raw_mf if self._prev_np > cur_np else 0.0)
+        self._prev_np = cur_np
+        return self.value
+
+    @property
+    def value(self):
+        pos_mf = self._pos_mf.value
+        neg_mf = self._neg_mf.value
+        if np.isnan(pos_mf) or pos_mf + neg_mf == 0:
+            return np.nan
+        return 100 * (pos_mf / (pos_mf + neg_mf))
+
+
+class OnlineMassIndex(object):
+    """
+    Mass Index (MI), see ta_lib.mass_index.
+    """
+
+    def __init__(self, window=25, ema_period=9):
+        self.window = window
+        self._single_ema = OnlineExpMovingAverage(ema_period)
+        self._double_ema = OnlineExpMovingAverage(ema_period)
+        self._ratio_sum = OnlineMovingSum(window)
+
+    def update(self, bar):
+        """
+        Args:
+            bar: Bar.
+                Any object with the high and low attributes.
+        """
+        single_ema = self._single_ema.update(bar.high - bar.low)
+        if not np.isnan(single_ema):
+            double_ema = self._double_ema.update(single_ema)
+            if not np.isnan(double_ema):
+                self._ratio_sum.update(single_ema / double_ema)
+        return self.value
+
+    @property
+    def value(self):
+        return self._ratio_sum.value
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/7/31 15:27
+@desc: A data backend over a local partitioned Parquet snapshot.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from si.lib.data_source import DataSource, QUOTE_COLUMN_LIST
+from si.lib.quote_arrays import QuoteArrays
+
+COMPANIES_FILENAME = 'companies.parquet'
+
+QUOTES_DIRNAME = 'quotes'
+
+# Number of rows per row group, the unit that the quote_date predicates skip by their statistics #
+QUOTE_ROW_GROUP_SIZE = 1000
+
+# The quote statistics that QuoteFilterSpec.accept_statistics checks, as (column, aggregation) #
+QUOTE_STATISTICS = [('volume', 'min'), ('volume', 'max'), ('low', 'max'), ('close', 'min'), ('close', 'max')]
+
+
+class ParquetDataSource(DataSource):
+    """
+    Read a snapshot written by write_parquet_snapshot, so a backtest runs at disk speed without a database server.
+
+    The layout of root:
+        companies.parquet                           the companies with their id and last_quote_dt.
+        quotes/company_id=<id>/part-0.parquet       the quotes of a company, sorted by quote_date.
+
+    Only the quote columns are read, the quotes of a company are located by its hive partition without touching the
+    other files, and a quote_date condition is pushed down to skip the row groups by their statistics.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._companies = None
+        self._quotes = None
+        self._fragments = None
+        self._statistics = None
+
+    def connect(self):
+        self._companies = pd.read_parquet(os.path.join(self.root, COMPANIES_FILENAME))
+        self._quotes = ds.dataset(os.path.join(self.root, QUOTES_DIRNAME), format='parquet', partitioning='hive')
+
+        # the fragments of every company, so a company is read without filtering the partitions of all others
+        self._fragments = {}
+        for fragment in self._quotes.get_fragments():
+            company_id = ds.get_partition_keys(fragment.partition_expression)['company_id']
+            self._fragments.setdefault(int(company_id), []).append(fragment)
+
+    def close_db(self):
+        self._companies = None
+        self._quotes = None
+        self._fragments = None
+        self._statistics = None
+
+    def get_companies_with_id(self, quote_filter=None):
+        """
+
+        Args:
+            quote_filter: QuoteFilterSpec, optional.
+                When it's set, only the companies kept by the filter are returned.
+
+        Returns:
+            DataFrame of companies with their id and last_quote_dt, sorted by id ascending.
+        """
+        companies = self._companies
+        if quote_filter is None:
+            return companies.copy()
+
+        keep = np.array([quote_filter.accept_company(company) for _, company in companies.iterrows()], dtype=bool)
+        if quote_filter.has_quote_conditions:
+            statistics = self._get_statistics()
+            kept_ids = statistics.index[quote_filter.accept_statistics(statistics)]
+            keep = keep & companies['id'].isin(kept_ids).values
+
+        return companies[keep].reset_index(drop=True)
+
+    def iter_quotes_by_company_ids(self, company_ids, after_dates=None, quote_window=None, as_arrays=False):
+        """
+        Get the quotes of many companies, see DataSource.iter_quotes_by_company_ids. The quote_window is applied
+        after reading, as its padding is counted in bars rather than dates.
+        """
+        if after_dates is None:
+            after_dates = [None] * len(company_ids)
+
+        for company_id, after_date in zip(company_ids, after_dates):
+            quotes = self._read_quotes(company_id, after_date)
+            if quote_window is not None:
+                quotes = quote_window.slice(quotes)
+
+            if as_arrays:
+                yield quotes
+            else:
+                yield quotes.to_frame()
+
+    def _read_quotes(self, company_id, after_date=None):
+        """
+        Returns:
+            QuoteArrays of the quotes of a company, sorted by quote_date ascending.
+        """
+        fragments = self._fragments.get(int(company_id), [])
+        if len(fragments) == 0:
+            return QuoteArrays.from_rows([], self.quote_dtypes)
+
+        date_filter = None if after_date is None else ds.field('quote_date') > after_date
+        table = pa.concat_tables([fragment.to_table(columns=QUOTE_COLUMN_LIST, filter=date_filter)
+                                  for fragment in fragments])
+        if len(fragments) > 1:
+            table = table.sort_by('quote_date')
+
+        return QuoteArrays(*[table.column(column).to_numpy() for column in QUOTE_COLUMN_LIST], dtypes=self.quote_dtypes)
+
+    def _get_statistics(self):
+        """
+        The quote statistics of every company, aggregated once per connection over the needed columns only.
+
+        Returns:
+            DataFrame indexed by company id, with the min_volume, max_volume, max_low, min_close and max_close columns.
+        """
+        if self._statistics is None:
+            columns = ['company_id'] + sorted(set(column for column, _ in QUOTE_STATISTICS))
+            table = self._quotes.to_table(columns=columns).group_by('company_id').aggregate(QUOTE_STATISTICS)
+            self._statistics = table.to_pandas().set_index('company_id').rename(
+                columns={f'{column}_{aggregation}': f'{aggregation}_{column}'
+                         for column, aggregation in QUOTE_STATISTICS})
+
+        return self._statistics
+
+
+def write_parquet_snapshot(data_source, root, row_group_size=QUOTE_ROW_GROUP_SIZE):
+    """
+    Write the companies and quotes of a data source, e.g. the Postgres database, as a snapshot that
+    ParquetDataSource reads. root should be a new or empty directory.
+    Args:
+        data_source: DataSource.
+            A connected DataSource.
+        root: str.
+            The snapshot directory.
+        row_group_size: int, default QUOTE_ROW_GROUP_SIZE.
+            The number of quotes per row group.
+
+    Returns:
+        The number of companies written.
+    """
+    os.makedirs(os.path.join(root, QUOTES_DIRNAME), exist_ok=True)
+
+    companies = data_source.get_companies_with_id()
+    for company, quotes in data_source.iter_company_quotes(as_arrays=True):
+        if len(quotes) == 0:
+            continue
+
+        table = pa.table({column: getattr(quotes, column) for column in QUOTE_COLUMN_LIST})
+        partition_dir = os.path.join(root, QUOTES_DIRNAME, f"company_id={int(company['id'])}")
+        os.makedirs(partition_dir, exist_ok=True)
+        pq.write_table(table, os.path.join(partition_dir, 'part-0.parquet'), row_group_size=row_group_size)
+
+    companies.to_parquet(os.path.join(root, COMPANIES_FILENAME), index=False)
+
+    return len(companies)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/7/24 15:06
+@desc: Overlap the quote fetching with the strategy evaluation.
+"""
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Marks the end of the prefetched items #
+_END = object()
+
+
+def prefetch(iterable, queue_size=2):
+    """
+    Iterate iterable in a background thread that stays at most queue_size items ahead of the consumer, so the
+    consumer evaluates item k while item k + 1 is being fetched. The database drivers release the GIL while they wait
+    for the server, so the fetch and the evaluation really run at the same time.
+    Args:
+        iterable: iterable.
+            Usually an iterator of (company, quotes). It's only advanced by the background thread.
+        queue_size: int, default 2.
+            The bound of the prefetch queue. When it's 0, iterable is iterated in the caller's thread.
+
+    Returns:
+        The items of iterable in order. An exception raised by iterable is raised to the consumer.
+    """
+    if queue_size <= 0:
+        for item in iterable:
+            yield item
+        return
+
+    items = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+
+    def put(item):
+        # give up when the consumer stops early, instead of blocking on a full queue forever
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except BaseException as e:
+            put((_END, e))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    producer = threading.Thread(target=produce, name='quote-prefetch', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+
+def ordered_map(func, iterable, n_workers, max_in_flight=None, executor=None):
+    """
+    Apply func to every item of iterable in a thread pool, keeping at most max_in_flight calls submitted ahead of the
+    consumer.
+    Args:
+        func: function.
+            Usually a blocking query.
+        iterable: iterable.
+            The arguments of func.
+        n_workers: int > 0.
+            The number of threads.
+        max_in_flight: int, optional.
+            Default 2 * n_workers.
+        executor: ThreadPoolExecutor, optional.
+            Submit the calls to it instead of a pool owned by the iteration, so that its owner can shut it down and
+            wait for the running calls, e.g. before closing the connections that they use.
+
+    Returns:
+        The results of func in the order of iterable.
+    """
+    if max_in_flight is None:
+        max_in_flight = 2 * n_workers
+
+    if executor is not None:
+        for result in _ordered_results(func, iterable, executor, max_in_flight):
+            yield result
+        return
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for result in _ordered_results(func, iterable, executor, max_in_flight):
+            yield result
+
+
+def _ordered_results(func, iterable, executor, max_in_flight):
+    futures = deque()
+    try:
+        for item in iterable:
+            futures.append(executor.submit(func, item))
+            if len(futures) >= max_in_flight:
+                yield futures.popleft().result()
+        while len(futures) > 0:
+            yield futures.popleft().result()
+    finally:
+        for future in futures:
+            future.cancel()
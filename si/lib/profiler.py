@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/8/14 16:20
+@desc: Per-stage timers and counters of a scan.
+"""
+import cProfile
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class _NullStage(object):
+    """
+    The stage of a disabled profiler, entering and leaving it does nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StageProfiler(object):
+    """
+    Cumulative wall time and number of calls per stage, counters like the rows fetched or the indices evaluated, and
+    the number of indices rejected by every rule, read from the profiling config section:
+        enabled: bool, default False.
+        summary_path: str, optional.
+            Write the JSON summary of every run or back test here, otherwise print it to stderr.
+        cprofile_path: str, optional.
+            Also run cProfile over the run or back test and dump its stats here, for pstats or snakeviz.
+
+    A disabled profiler returns a shared no-op stage and ignores the counts, so the instrumentation costs a method
+    call per stage. The stages may be timed from the prefetch thread too, they only overlap with the stages of the
+    main thread, which is why the stage times can add up to more than the wall time.
+    """
+
+    def __init__(self, enabled=False, summary_path=None, cprofile_path=None):
+        self.enabled = enabled
+        self.summary_path = summary_path
+        self.cprofile_path = cprofile_path
+        self._lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_config(cls, profiling_config):
+        return cls(enabled=profiling_config.get('enabled', False),
+                   summary_path=profiling_config.get('summary_path'),
+                   cprofile_path=profiling_config.get('cprofile_path'))
+
+    def reset(self):
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.rejections = defaultdict(int)
+
+    def __getstate__(self):
+        # a strategy holding the profiler is pickled to the worker processes
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        """
+        Time a stage, e.g.
+            with profiler.stage('apply_strategy'):
+                ...
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.stage_seconds[name] += seconds
+            self.stage_calls[name] += 1
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += int(n)
+
+    def reject(self, rule, n=1):
+        """
+        Count n indices rejected by rule, e.g. 'base_filter.min_price'.
+        """
+        if self.enabled:
+            with self._lock:
+                self.rejections[rule] += int(n)
+
+    def count_rejections(self, prefix, rules, alive):
+        """
+        Count, for every rule in order, the alive indices that it rejects first, like a short-circuit evaluation
+        would.
+        Args:
+            prefix: str.
+                Prepended to the rule names, e.g. 'base_filter'.
+            rules: dict.
+                Rule name to its bool ndarray at every index.
+            alive: bool ndarray.
+                The indices that are still evaluated.
+
+        Returns:
+            The indices that pass all rules.
+        """
+        for rule, passed in rules.items():
+            self.reject(prefix + '.' + rule, (alive & ~passed).sum())
+            alive = alive & passed
+        return alive
+
+    def timed_iter(self, name, iterable):
+        """
+        Iterate iterable and time the waits for its items as the stage name.
+        """
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(name, iterable)
+
+    def _timed_iter(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add_time(name, time.perf_counter() - start)
+            yield item
+
+    @contextmanager
+    def session(self, command):
+        """
+        Profile a run or back test: reset the timers, run cProfile when cprofile_path is set, and write the summary at
+        the end.
+        """
+        if not self.enabled:
+            yield self
+            return
+
+        self.reset()
+        profile = cProfile.Profile() if self.cprofile_path is not None else None
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield self
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(self.cprofile_path)
+            self.dump(self.summary(command, time.perf_counter() - start))
+
+    def state(self):
+        """
+        Returns:
+            The timers and counters as plain dicts, e.g. to send them from a worker process.
+        """
+        return {
+            'stage_seconds': dict(self.stage_seconds),
+            'stage_calls': dict(self.stage_calls),
+            'counters': dict(self.counters),
+            'rejections': dict(self.rejections),
+        }
+
+    def merge(self, state):
+        """
+        Add the state of another profiler, e.g. of a worker process.
+        """
+        for name, seconds in state['stage_seconds'].items():
+            self.stage_seconds[name] += seconds
+        for attr in ['stage_calls', 'counters', 'rejections']:
+            totals = getattr(self, attr)
+            for name, n in state[attr].items():
+                totals[name] += n
+
+    def summary(self, command, wall_seconds):
+        """
+        Returns:
+            A JSON-serializable dict of the run.
+        """
+        return {
+            'command': command,
+            'wall_s': wall_seconds,
+            'stages': {name: {'seconds': self.stage_seconds[name], 'calls': self.stage_calls[name]}
+                       for name in sorted(self.stage_seconds, key=self.stage_seconds.get, reverse=True)},
+            'counters': dict(self.counters),
+            'rejections': dict(sorted(self.rejections.items(), key=lambda item: item[1], reverse=True)),
+        }
+
+    def dump(self, summary):
+        summary_json = json.dumps(summary, indent=2)
+        if self.summary_path is None:
+            print(summary_json, file=sys.stderr)
+        else:
+            with open(self.summary_path, 'w') as summary_file:
+                summary_file.write(summary_json)
+
+
+# The profiler of the components that are not given one #
+NULL_PROFILER = StageProfiler(enabled=False)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/6/12 16:03
+@desc: A compact array-backed view of the quotes of one ticker.
+"""
+import datetime
+from collections import namedtuple
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+# Numeric dtype of every quote column, used when the quotes are stored outside of the database #
+QUOTE_COLUMN_DTYPES = {
+    'quote_date': np.int64,
+    'open': np.float64,
+    'close': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'volume': np.int64,
+}
+
+# The compact dtypes of the data config compact_quotes, half the memory of QUOTE_COLUMN_DTYPES for the dates and
+# prices. quote_date keeps its yyyymmdd value, which fits in an int32 #
+COMPACT_QUOTE_COLUMN_DTYPES = {
+    'quote_date': np.int32,
+    'open': np.float32,
+    'close': np.float32,
+    'high': np.float32,
+    'low': np.float32,
+    'volume': np.int64,
+}
+
+# A single daily bar #
+Bar = namedtuple('Bar', ['quote_date', 'open', 'close', 'high', 'low', 'volume'])
+
+
+def date_to_int(date):
+    """
+    The yyyymmdd int of a date, the form of quote_date in the arrays.
+    """
+    return date.year * 10000 + date.month * 100 + date.day
+
+
+class QuoteArrays(object):
+    """
+    The quotes of one ticker as contiguous column arrays, sorted by quote_date ascending.
+
+    Columns are read as attributes, e.g. quotes.close[cur_idx], which costs an array lookup instead of building a
+    pandas Series per row like quotes.iloc[cur_idx]['close'].
+
+    The columns are cast to dtypes, QUOTE_COLUMN_DTYPES by default or COMPACT_QUOTE_COLUMN_DTYPES, and the slices and
+    concatenations keep the dtypes of their source.
+    """
+    __slots__ = ('quote_date', 'open', 'close', 'high', 'low', 'volume')
+
+    def __init__(self, quote_date, open, close, high, low, volume, dtypes=QUOTE_COLUMN_DTYPES):
+        self.quote_date = np.ascontiguousarray(quote_date, dtype=dtypes['quote_date'])
+        self.open = np.ascontiguousarray(open, dtype=dtypes['open'])
+        self.close = np.ascontiguousarray(close, dtype=dtypes['close'])
+        self.high = np.ascontiguousarray(high, dtype=dtypes['high'])
+        self.low = np.ascontiguousarray(low, dtype=dtypes['low'])
+        self.volume = np.ascontiguousarray(volume, dtype=dtypes['volume'])
+
+    @classmethod
+    def from_rows(cls, rows, dtypes=QUOTE_COLUMN_DTYPES):
+        """
+        Build from the rows fetched by a cursor, decoding every column straight into a preallocated array of its
+        dtype, so the Decimal prices of the driver never make an object column.
+        Args:
+            rows: list of tuple.
+                Each row is like (quote_date, open, close, high, low, volume), quote_date is a yyyymmdd int or a date.
+            dtypes: dict, default QUOTE_COLUMN_DTYPES.
+                The dtype of every column, e.g. COMPACT_QUOTE_COLUMN_DTYPES.
+
+        Returns:
+            QuoteArrays.
+        """
+        n_rows = len(rows)
+        columns = []
+        for col_idx, column in enumerate(cls.__slots__):
+            values = map(itemgetter(col_idx), rows)
+            if col_idx == 0 and n_rows > 0 and isinstance(rows[0][0], datetime.date):
+                values = map(date_to_int, values)
+            columns.append(np.fromiter(values, dtype=dtypes[column], count=n_rows))
+        return cls(*columns, dtypes=dtypes)
+
+    @classmethod
+    def concat(cls, quotes_list):
+        """
+        Concatenate the quotes in order.
+        Args:
+            quotes_list: list of QuoteArrays.
+
+        Returns:
+            QuoteArrays.
+        """
+        dtypes = quotes_list[0].dtypes if len(quotes_list) > 0 else QUOTE_COLUMN_DTYPES
+        return cls(*[np.concatenate([getattr(quotes, column) for quotes in quotes_list]) for column in cls.__slots__],
+                   dtypes=dtypes)
+
+    def __len__(self):
+        return len(self.quote_date)
+
+    @property
+    def dtypes(self):
+        """
+        The dict of column to dtype.
+        """
+        return {column: getattr(self, column).dtype for column in self.__slots__}
+
+    def __getitem__(self, key):
+        """
+        quotes['close'] returns the column, quotes[start:stop] returns a QuoteArrays of views of the rows.
+        """
+        if isinstance(key, str):
+            return getattr(self, key)
+        return QuoteArrays(*[getattr(self, column)[key] for column in self.__slots__], dtypes=self.dtypes)
+
+    def to_frame(self):
+        """
+
+        Returns:
+            DataFrame of quotes, whose columns are the arrays themselves.
+        """
+        return pd.DataFrame({column: getattr(self, column) for column in self.__slots__}, copy=False)
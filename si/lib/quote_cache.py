@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/6/5 10:12
+@desc: A local columnar quote cache in front of the database.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from si.lib.data_source import QUOTE_COLUMN_LIST, default_company_filter
+from si.lib.quote_arrays import QuoteArrays, QUOTE_COLUMN_DTYPES
+from si.lib.quote_summary import QuoteSummary
+
+COMPANIES_FILENAME = 'companies.pkl'
+META_FILENAME = 'meta.json'
+SUMMARIES_FILENAME = 'summaries.pkl'
+
+
+class QuoteCache(object):
+    """
+    Store the quotes of every symbol on disk, one .npy file per column of QUOTE_COLUMN_LIST, and read them back with
+    mmap so only the touched pages are loaded.
+
+    The layout of cache_dir:
+        companies.pkl               the companies DataFrame of the last refresh.
+        summaries.pkl               {symbol: QuoteSummary of its quotes}, read once to skip companies unread.
+        <symbol>/meta.json          the company's last_quote_dt and the last cached quote_date.
+        <symbol>/<column>.npy       one column of the quotes.
+
+    The columns are stored as dtypes, e.g. COMPACT_QUOTE_COLUMN_DTYPES halves the files of the dates and prices.
+    """
+
+    def __init__(self, cache_dir, dtypes=QUOTE_COLUMN_DTYPES):
+        self.cache_dir = cache_dir
+        self.dtypes = dtypes
+        self._summaries = None
+
+    def refresh(self, db, quote_filter=None):
+        """
+        Bring the cache up to date with the database. An empty cache is filled by the bulk loader, otherwise only the
+        companies whose last_quote_dt changed are fetched, and only the bars newer than the cached ones.
+        Args:
+            db: DataSource.
+                A connected DataSource.
+            quote_filter: QuoteFilterSpec, optional.
+                When it's set, only the companies kept by the filter are refreshed and listed by get_companies.
+
+        Returns:
+            The number of refreshed companies.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cold_start = not os.path.exists(self._companies_path())
+
+        n_refreshed = 0
+        if cold_start:
+            for company, quotes in db.iter_company_quotes(as_arrays=True, quote_filter=quote_filter):
+                self._write_quotes(company, quotes)
+                n_refreshed += 1
+            companies = db.get_companies_with_id(quote_filter)
+        else:
+            companies = db.get_companies_with_id(quote_filter)
+            n_refreshed = self._refresh_stale(db, companies)
+
+        companies.to_pickle(self._companies_path())
+        self._save_summaries()
+
+        return n_refreshed
+
+    def refresh_symbols(self, db, symbols, quote_filter=None):
+        """
+        Bring only the cached quotes of symbols up to date, e.g. before a scan of a few tickers, so the other
+        companies are neither fetched nor listed. The company list of get_companies is left as it is.
+        Args:
+            db: DataSource.
+                A connected DataSource.
+            symbols: list of str.
+                The stock symbols.
+            quote_filter: QuoteFilterSpec, optional.
+                When it's set, only the companies of symbols kept by the filter are refreshed and returned.
+
+        Returns:
+            DataFrame of the refreshed companies, like get_companies.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        companies = db.get_companies_with_id(quote_filter)
+        companies = companies[companies['symbol'].isin(symbols)].reset_index(drop=True)
+        self._refresh_stale(db, companies)
+        self._save_summaries()
+        return companies
+
+    def _refresh_stale(self, db, companies):
+        """
+        Fetch the companies whose last_quote_dt changed, and only their bars newer than the cached ones.
+
+        Returns:
+            The number of refreshed companies.
+        """
+        # (company, after_date) of the stale companies, after_date is None for a company that is not cached
+        stale_list = []
+        for _, company in companies.iterrows():
+            meta = self._read_meta(company['symbol'])
+            if meta is None:
+                stale_list.append((company, None))
+            elif meta['last_quote_dt'] != str(company['last_quote_dt']):
+                stale_list.append((company, meta['last_quote_date']))
+
+        # a pooled db keeps several of these queries in flight
+        new_quotes_iter = db.iter_quotes_by_company_ids([company['id'] for company, _ in stale_list],
+                                                        [after_date for _, after_date in stale_list],
+                                                        as_arrays=True)
+        for (company, after_date), new_quotes in zip(stale_list, new_quotes_iter):
+            if after_date is None:
+                self._write_quotes(company, new_quotes)
+            else:
+                self._append_quotes(company, new_quotes)
+        return len(stale_list)
+
+    def get_companies(self):
+        """
+
+        Returns:
+            DataFrame of companies of the last refresh.
+        """
+        return pd.read_pickle(self._companies_path())
+
+    def get_quotes_by_symbol(self, symbol):
+        """
+        Get the quotes DataFrame specified by symbol, whose columns are backed by the memory-mapped files.
+        Args:
+            symbol: str
+                The stock symbol.
+
+        Returns:
+            DataFrame of quotes, sorted by quote_date ascending.
+        """
+        return pd.DataFrame(self._load_columns(symbol), columns=QUOTE_COLUMN_LIST, copy=False)
+
+    def get_quote_arrays_by_symbol(self, symbol):
+        """
+        Get the quotes specified by symbol as QuoteArrays, whose columns are the memory-mapped arrays themselves.
+        Args:
+            symbol: str
+                The stock symbol.
+
+        Returns:
+            QuoteArrays, sorted by quote_date ascending.
+        """
+        return QuoteArrays(**self._load_columns(symbol), dtypes=self.dtypes)
+
+    def get_summary(self, symbol):
+        """
+
+        Returns:
+            The QuoteSummary of the quotes specified by symbol, None if it's not cached.
+        """
+        return self._get_summaries().get(symbol)
+
+    def get_all_company_quotes_iterator(self, company_filter_func=default_company_filter,
+                                        companies=None, as_arrays=False, quote_window=None, span_filter=None):
+        """
+
+        Args:
+            company_filter_func: function, default filter volume less than 100.
+                A function that operates on all quotes of a company. When it returns true, keep the company's quotes,
+                otherwise drop the company's quotes.
+            companies: DataFrame, optional.
+                A subset of get_companies(). When it's set, only the quotes of these companies are read.
+            as_arrays: bool, default False.
+                Yield the quotes as QuoteArrays instead of DataFrames.
+            quote_window: QuoteWindow, optional.
+                When it's set, only the quotes in the window are yielded. company_filter_func still sees all quotes.
+            span_filter: QuoteFilterSpec, optional.
+                When it's set, the companies whose summary fails its accept_span over the bars of quote_window are
+                dropped before their quotes are read.
+
+        Returns:
+            A tuple like (company, quotes)
+        """
+        if companies is None:
+            companies = self.get_companies()
+        for _, company in companies.iterrows():
+            if span_filter is not None and not self._accept_summary(company['symbol'], span_filter, quote_window):
+                continue
+            if as_arrays:
+                quotes = self.get_quote_arrays_by_symbol(company['symbol'])
+            else:
+                quotes = self.get_quotes_by_symbol(company['symbol'])
+            # filter quotes
+            if company_filter_func is None or company_filter_func(quotes):
+                if quote_window is not None:
+                    quotes = quote_window.slice(quotes)
+                yield company, quotes
+
+    def _accept_summary(self, symbol, span_filter, quote_window):
+        summary = self.get_summary(symbol)
+        # a cache written before the summaries keeps every company
+        return summary is None or span_filter.accept_span(summary.span_statistics(*summary.span(quote_window)))
+
+    def _load_columns(self, symbol):
+        columns = {}
+        for column in QUOTE_COLUMN_LIST:
+            path = self._column_path(symbol, column)
+            if os.path.exists(path):
+                columns[column] = np.load(path, mmap_mode='r')
+            else:
+                columns[column] = np.empty(0, dtype=self.dtypes[column])
+        return columns
+
+    def _write_quotes(self, company, quotes):
+        symbol = company['symbol']
+        os.makedirs(self._symbol_dir(symbol), exist_ok=True)
+
+        for column in QUOTE_COLUMN_LIST:
+            values = np.asarray(quotes[column], dtype=self.dtypes[column])
+            self._save_array(self._column_path(symbol, column), values)
+
+        self._write_summary(symbol)
+        self._write_meta(company, np.asarray(quotes['quote_date']))
+
+    def _append_quotes(self, company, new_quotes):
+        symbol = company['symbol']
+        if len(new_quotes) > 0:
+            for column in QUOTE_COLUMN_LIST:
+                path = self._column_path(symbol, column)
+                new_values = np.asarray(new_quotes[column], dtype=self.dtypes[column])
+                values = np.concatenate([np.load(path, mmap_mode='r'), new_values], dtype=self.dtypes[column])
+                self._save_array(path, values)
+
+        self._write_summary(symbol)
+        quote_dates = np.load(self._column_path(symbol, 'quote_date'), mmap_mode='r')
+        self._write_meta(company, quote_dates)
+
+    def _write_summary(self, symbol):
+        # kept in memory until refresh saves all of them
+        self._get_summaries()[symbol] = QuoteSummary.from_quotes(self.get_quote_arrays_by_symbol(symbol))
+
+    def _get_summaries(self):
+        if self._summaries is None:
+            path = self._summaries_path()
+            self._summaries = pd.read_pickle(path) if os.path.exists(path) else {}
+        return self._summaries
+
+    def _save_summaries(self):
+        tmp_path = self._summaries_path() + '.tmp'
+        pd.to_pickle(self._get_summaries(), tmp_path)
+        os.replace(tmp_path, self._summaries_path())
+
+    def _write_meta(self, company, quote_dates):
+        meta = {
+            'last_quote_dt': str(company['last_quote_dt']),
+            'last_quote_date': int(quote_dates[-1]) if len(quote_dates) > 0 else None,
+        }
+        with open(self._meta_path(company['symbol']), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+    def _read_meta(self, symbol):
+        path = self._meta_path(symbol)
+        if not os.path.exists(path):
+            return None
+        with open(path) as meta_file:
+            return json.load(meta_file)
+
+    @staticmethod
+    def _save_array(path, values):
+        # write to a temporary file first, so a crash never leaves a truncated column
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as array_file:
+            np.save(array_file, values)
+        os.replace(tmp_path, path)
+
+    def _symbol_dir(self, symbol):
+        return os.path.join(self.cache_dir, symbol.replace(os.sep, '_'))
+
+    def _column_path(self, symbol, column):
+        return os.path.join(self._symbol_dir(symbol), column + '.npy')
+
+    def _meta_path(self, symbol):
+        return os.path.join(self._symbol_dir(symbol), META_FILENAME)
+
+    def _summaries_path(self):
+        return os.path.join(self.cache_dir, SUMMARIES_FILENAME)
+
+    def _companies_path(self):
+        return os.path.join(self.cache_dir, COMPANIES_FILENAME)
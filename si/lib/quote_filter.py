@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/7/10 10:35
+@desc: A declarative company filter that is compiled into SQL.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_EXCLUDE_SECTORS = ['Healthcare']
+
+DEFAULT_MIN_DAILY_VOLUME = 100
+
+DEFAULT_MIN_CLOSE_RANGE = 1.4
+
+
+class QuoteFilterSpec(object):
+    """
+    The conditions that a company must meet to be scanned, read from the base_filter config section:
+        exclude_sectors: list of str, default ['Healthcare'].
+            Drop the companies of these sectors.
+        min_daily_volume: int, default 100.
+            Drop the companies whose volume is not greater than it on any day.
+        min_price, min_volume, min_close_range:
+            The thresholds of BaseStrategy.filter_quotes. The filter checks them over a window, so a company can only
+            pass when its whole history does: some low >= min_price, some volume >= min_volume and
+            max(close) >= min_close_range * min(close).
+
+    The spec is compiled into the WHERE/HAVING clauses of a company id subquery, so the dropped companies never leave
+    the database.
+    """
+
+    def __init__(self, exclude_sectors=None, min_daily_volume=None, min_price=None, min_volume=None,
+                 min_close_range=None):
+        self.exclude_sectors = list(exclude_sectors or [])
+        self.min_daily_volume = min_daily_volume
+        self.min_price = min_price
+        self.min_volume = min_volume
+        self.min_close_range = min_close_range
+
+    @classmethod
+    def from_config(cls, base_filter_config):
+        return cls(exclude_sectors=base_filter_config.get('exclude_sectors', DEFAULT_EXCLUDE_SECTORS),
+                   min_daily_volume=base_filter_config.get('min_daily_volume', DEFAULT_MIN_DAILY_VOLUME),
+                   min_price=base_filter_config.get('min_price'),
+                   min_volume=base_filter_config.get('min_volume'),
+                   min_close_range=base_filter_config.get('min_close_range', DEFAULT_MIN_CLOSE_RANGE))
+
+    @classmethod
+    def from_configs(cls, base_filter_configs):
+        """
+        The loosest spec of several base_filter config sections, e.g. of the configurations of a sweep, which keeps
+        every company that one of them keeps: a threshold is the lowest one, or None when a config doesn't set it, and
+        only the sectors that every config excludes are excluded.
+        """
+        specs = [cls.from_config(base_filter_config) for base_filter_config in base_filter_configs]
+        exclude_sectors = [sector for sector in specs[0].exclude_sectors
+                           if all(sector in spec.exclude_sectors for spec in specs[1:])]
+
+        thresholds = {}
+        for key in ['min_daily_volume', 'min_price', 'min_volume', 'min_close_range']:
+            values = [getattr(spec, key) for spec in specs]
+            thresholds[key] = None if any(value is None for value in values) else min(values)
+        return cls(exclude_sectors=exclude_sectors, **thresholds)
+
+    def company_id_sql(self):
+        """
+        Compile the spec into a subquery of the ids of the kept companies.
+
+        Returns:
+            A tuple like (sql, params), or (None, ()) when the spec keeps every company.
+        """
+        where_list = []
+        params = []
+        if len(self.exclude_sectors) > 0:
+            where_list.append('(com.sector IS NULL OR com.sector NOT IN %s)')
+            params.append(tuple(self.exclude_sectors))
+
+        having_list = []
+        if self.min_daily_volume is not None:
+            having_list.append('MIN(quo.volume) > %s')
+            params.append(self.min_daily_volume)
+        if self.min_price is not None:
+            having_list.append('MAX(quo.low) >= %s')
+            params.append(self.min_price)
+        if self.min_volume is not None:
+            having_list.append('MAX(quo.volume) >= %s')
+            params.append(self.min_volume)
+        if self.min_close_range is not None:
+            having_list.append('MAX(quo.close) >= %s * MIN(quo.close)')
+            params.append(self.min_close_range)
+
+        if len(having_list) > 0:
+            where_list.append('com.id IN (SELECT quo.company_id FROM stock_quote quo GROUP BY quo.company_id '
+                              'HAVING ' + ' AND '.join(having_list) + ')')
+
+        if len(where_list) == 0:
+            return None, ()
+
+        return 'SELECT com.id FROM company com WHERE ' + ' AND '.join(where_list), tuple(params)
+
+    def accept_statistics(self, statistics):
+        """
+        The HAVING part of the spec, checked on the quote statistics of every company by the backends without SQL.
+        Args:
+            statistics: DataFrame.
+                One row per company, with the min_volume, max_volume, max_low, min_close and max_close of its quotes.
+
+        Returns:
+            A bool Series aligned with statistics.
+        """
+        keep = pd.Series(True, index=statistics.index)
+        if self.min_daily_volume is not None:
+            keep &= statistics['min_volume'] > self.min_daily_volume
+        if self.min_price is not None:
+            keep &= statistics['max_low'] >= self.min_price
+        if self.min_volume is not None:
+            keep &= statistics['max_volume'] >= self.min_volume
+        if self.min_close_range is not None:
+            keep &= statistics['max_close'] >= self.min_close_range * statistics['min_close']
+        return keep
+
+    def accept_span(self, statistics):
+        """
+        The window thresholds of the spec, checked on the statistics of the bars that a scan evaluates, e.g. from
+        QuoteSummary.span_statistics. Every window of BaseStrategy.filter_quotes lies in these bars, so a ticker that
+        fails can't pass the filter anywhere in the scan.
+        Args:
+            statistics: dict.
+                The max_low, max_volume, max_close and min_close of the bars, None when there is no bar.
+
+        Returns:
+            A bool, false if no window of the bars can pass.
+        """
+        if statistics is None:
+            return False
+        if self.min_price is not None and not statistics['max_low'] >= self.min_price:
+            return False
+        if self.min_volume is not None and not statistics['max_volume'] >= self.min_volume:
+            return False
+        if self.min_close_range is not None:
+            # the same division as the filter, which can only be smaller on a window
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if not statistics['max_close'] / statistics['min_close'] >= self.min_close_range:
+                    return False
+        return True
+
+    @property
+    def has_quote_conditions(self):
+        """
+        Whether the spec drops companies by their quotes, then a company without any quote is dropped too.
+        """
+        return any(threshold is not None for threshold in
+                   [self.min_daily_volume, self.min_price, self.min_volume, self.min_close_range])
+
+    def accept_company(self, company):
+        """
+        The sector part of the spec, checked in Python.
+        """
+        return company['sector'] not in self.exclude_sectors
+
+    def accept_quotes(self, quotes):
+        """
+        The daily volume part of the spec, checked in Python. It's the company_filter_func of the quote iterators.
+        """
+        return self.min_daily_volume is None or bool(np.all(quotes.volume > self.min_daily_volume))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/8/28 15:12
+@desc: The quotes of the whole universe as date x ticker panels.
+"""
+import numpy as np
+import pandas as pd
+
+# The quote columns of a panel #
+PANEL_COLUMNS = ['open', 'close', 'high', 'low', 'volume']
+
+# The dtype of every panel column, NaN marks a missing bar. The volume stays float64, float32 is only exact up to 2**24
+# shares #
+PANEL_DTYPES = {'open': np.float32, 'close': np.float32, 'high': np.float32, 'low': np.float32, 'volume': np.float64}
+
+
+class QuotePanel(object):
+    """
+    The quotes of many tickers aligned on the union of their quote dates, one 2-D array per column with a row per
+    date and a column per ticker, and NaN where a ticker has no bar on a date.
+
+    The columns are read as attributes like QuoteArrays, e.g. panel.close[-1] is the last close of every ticker, so
+    an IndicatorStore over a panel rolls every indicator along the date axis for all tickers at once, and the
+    whole-array rules of the base filter and the strategies evaluate the universe in one expression.
+
+    A window that contains a missing bar gives NaN and fails every rule, and the windows are counted in dates of the
+    panel, so a ticker with gaps can differ from its per-ticker scan around the gaps.
+    """
+
+    def __init__(self, quote_date, companies, open, close, high, low, volume):
+        self.quote_date = np.asarray(quote_date, dtype=np.int64)
+        self.companies = companies.reset_index(drop=True)
+        self.symbols = self.companies['symbol'].to_numpy()
+        self.open = open
+        self.close = close
+        self.high = high
+        self.low = low
+        self.volume = volume
+
+    @classmethod
+    def from_company_quotes(cls, company_quotes, n_dates=None):
+        """
+        Build a panel from (company, quotes) pairs.
+        Args:
+            company_quotes: iterable.
+                A tuple like (company, quotes), quotes is QuoteArrays sorted by quote_date ascending.
+            n_dates: int, optional.
+                Only keep the last n_dates dates of the panel, e.g. the bars a scan of the latest dates needs.
+
+        Returns:
+            QuotePanel.
+        """
+        companies = []
+        quotes_list = []
+        for company, quotes in company_quotes:
+            if len(quotes) > 0:
+                companies.append(company)
+                quotes_list.append(quotes)
+
+        if len(quotes_list) > 0:
+            quote_date = np.unique(np.concatenate([quotes.quote_date for quotes in quotes_list]))
+        else:
+            quote_date = np.empty(0, dtype=np.int64)
+        if n_dates is not None:
+            quote_date = quote_date[max(len(quote_date) - n_dates, 0):]
+
+        columns = {column: np.full((len(quote_date), len(quotes_list)), np.nan, dtype=PANEL_DTYPES[column])
+                   for column in PANEL_COLUMNS}
+        for ticker_idx, quotes in enumerate(quotes_list):
+            start = np.searchsorted(quotes.quote_date, quote_date[0]) if len(quote_date) > 0 else len(quotes)
+            date_idx = np.searchsorted(quote_date, quotes.quote_date[start:])
+            for column in PANEL_COLUMNS:
+                columns[column][date_idx, ticker_idx] = getattr(quotes, column)[start:]
+
+        companies = pd.DataFrame(companies) if len(companies) > 0 else pd.DataFrame(columns=['id', 'symbol'])
+        return cls(quote_date, companies, **columns)
+
+    def __len__(self):
+        return len(self.quote_date)
+
+    @property
+    def n_tickers(self):
+        return len(self.symbols)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/9/4 14:22
+@desc: Block statistics of the quotes of one ticker, to skip the tickers that can't pass the base filter.
+"""
+import numpy as np
+
+# Number of bars summarized by one block #
+SUMMARY_BLOCK_SIZE = 64
+
+
+class QuoteSummary(object):
+    """
+    The max low, max volume and max/min close of every block of block_size bars of a ticker, with the quote_date of
+    the first bar of every block, like the row group statistics of a Parquet file. NaN bars are ignored.
+
+    span_statistics bounds the statistics of a range of bars by the blocks that overlap it, so the statistics of
+    every window of the range are within them, e.g. when the max low of the range is below min_price, every window of
+    the range has a low below min_price.
+    """
+
+    def __init__(self, n_quotes, first_date, max_low, max_volume, max_close, min_close, block_size=SUMMARY_BLOCK_SIZE):
+        self.n_quotes = int(n_quotes)
+        self.first_date = first_date
+        self.max_low = max_low
+        self.max_volume = max_volume
+        self.max_close = max_close
+        self.min_close = min_close
+        self.block_size = int(block_size)
+
+    @classmethod
+    def from_quotes(cls, quotes, block_size=SUMMARY_BLOCK_SIZE):
+        """
+        Args:
+            quotes: QuoteArrays.
+                The quotes sorted by quote_date ascending.
+            block_size: int > 0, default SUMMARY_BLOCK_SIZE.
+                The number of bars per block.
+
+        Returns:
+            QuoteSummary.
+        """
+        starts = np.arange(0, len(quotes), block_size)
+        if len(starts) == 0:
+            empty = np.empty(0, dtype=np.float64)
+            return cls(0, np.empty(0, dtype=np.int64), empty, empty, empty, empty, block_size)
+
+        with np.errstate(invalid='ignore'):
+            return cls(len(quotes), np.asarray(quotes.quote_date)[starts],
+                       np.fmax.reduceat(np.asarray(quotes.low, dtype=np.float64), starts),
+                       np.fmax.reduceat(np.asarray(quotes.volume, dtype=np.float64), starts),
+                       np.fmax.reduceat(np.asarray(quotes.close, dtype=np.float64), starts),
+                       np.fmin.reduceat(np.asarray(quotes.close, dtype=np.float64), starts),
+                       block_size)
+
+    def span(self, quote_window=None):
+        """
+        The range of bars that covers the bars of quote_window, maybe wider as the dates are only known per block.
+
+        Returns:
+            A tuple like (start, stop).
+        """
+        if quote_window is None:
+            return 0, self.n_quotes
+
+        if quote_window.is_date_range:
+            start = 0
+            stop = self.n_quotes
+            if quote_window.start_date is not None:
+                start_block = max(int(np.searchsorted(self.first_date, quote_window.start_date, side='right')) - 1, 0)
+                start = max(start_block * self.block_size - quote_window.n_before, 0)
+            if quote_window.end_date is not None:
+                stop_block = int(np.searchsorted(self.first_date, quote_window.end_date, side='right'))
+                stop = min(stop_block * self.block_size + quote_window.n_after, self.n_quotes)
+            return start, stop
+
+        if quote_window.last_n is not None:
+            return max(self.n_quotes - quote_window.last_n, 0), self.n_quotes
+
+        return 0, self.n_quotes
+
+    def span_statistics(self, start=0, stop=None):
+        """
+        The statistics of the blocks that overlap the bars [start, stop).
+
+        Returns:
+            A dict with the max_low, max_volume, max_close and min_close, None when there is no bar.
+        """
+        if stop is None:
+            stop = self.n_quotes
+
+        start_block = start // self.block_size
+        stop_block = -(-stop // self.block_size)
+        if start_block >= stop_block:
+            return None
+
+        blocks = slice(start_block, stop_block)
+        with np.errstate(invalid='ignore'):
+            return {
+                'max_low': np.fmax.reduce(self.max_low[blocks]),
+                'max_volume': np.fmax.reduce(self.max_volume[blocks]),
+                'max_close': np.fmax.reduce(self.max_close[blocks]),
+                'min_close': np.fmin.reduce(self.min_close[blocks]),
+            }
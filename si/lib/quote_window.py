@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/7/17 9:42
+@desc: The bounded range of bars of each ticker that a scan needs.
+"""
+import numpy as np
+
+
+class QuoteWindow(object):
+    """
+    The bars of each ticker to load, either
+        the trailing mode: the last last_n bars, or
+        the date range mode: the bars of [start_date, end_date], padded with n_before bars before start_date and
+        n_after bars after end_date. A ticker without any bar in the range gets no bars at all.
+
+    DBService compiles the window into SQL and slice applies it to the quotes that are already loaded, e.g. from the
+    quote cache, so both return the same bars.
+    """
+
+    def __init__(self, last_n=None, start_date=None, end_date=None, n_before=0, n_after=0):
+        self.last_n = last_n
+        self.start_date = start_date
+        self.end_date = end_date
+        self.n_before = n_before
+        self.n_after = n_after
+
+    @classmethod
+    def trailing(cls, last_n):
+        return cls(last_n=last_n)
+
+    @classmethod
+    def date_range(cls, start_date=None, end_date=None, n_before=0, n_after=0):
+        return cls(start_date=start_date, end_date=end_date, n_before=n_before, n_after=n_after)
+
+    @property
+    def is_date_range(self):
+        return self.start_date is not None or self.end_date is not None
+
+    def slice(self, quotes):
+        """
+        Args:
+            quotes: QuoteArrays.
+                The quotes sorted by quote_date ascending.
+
+        Returns:
+            QuoteArrays of views of the bars in the window.
+        """
+        len_quotes = len(quotes)
+        if self.is_date_range:
+            start_idx, end_idx = self.date_range_indices(quotes)
+            if start_idx >= end_idx:
+                return quotes[0:0]
+            return quotes[max(start_idx - self.n_before, 0): end_idx + self.n_after]
+
+        if self.last_n is not None:
+            return quotes[max(len_quotes - self.last_n, 0):]
+
+        return quotes
+
+    def date_range_indices(self, quotes):
+        """
+        Returns:
+            A tuple like (start_idx, end_idx), the indices of quotes in [start_date, end_date] are in
+            [start_idx, end_idx).
+        """
+        start_idx = 0
+        end_idx = len(quotes)
+        if self.start_date is not None:
+            start_idx = int(np.searchsorted(quotes.quote_date, self.start_date, side='left'))
+        if self.end_date is not None:
+            end_idx = int(np.searchsorted(quotes.quote_date, self.end_date, side='right'))
+        return start_idx, end_idx
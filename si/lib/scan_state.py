@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/6/19 20:36
+@desc: Per-ticker state of the incremental daily scan.
+"""
+import json
+import os
+
+import numpy as np
+
+from si.lib.quote_arrays import QuoteArrays
+
+INDEX_FILENAME = 'index.json'
+
+
+class ScanState(object):
+    """
+    Persist, for every ticker, the quote_date of the last evaluated index and the trailing bars that the strategy
+    needs as context. All indicators only depend on their observation windows, so evaluating the new bars on top of
+    this tail gives the same result as evaluating them on the full history.
+
+    The layout of state_dir:
+        index.json          {symbol: [last evaluated quote_date, last quote_date of the tail]}
+        <symbol>.npz        the tail quotes, one array per column.
+    """
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.index = self._read_index()
+
+    def get_last_evaluated_date(self, symbol):
+        """
+
+        Returns:
+            The quote_date of the last evaluated index, None if the ticker is never scanned.
+        """
+        if symbol not in self.index:
+            return None
+        return self.index[symbol][0]
+
+    def get_min_tail_date(self):
+        """
+
+        Returns:
+            The minimum last quote_date of all tails, None if no ticker is scanned. Every bar newer than the tails is
+            after this date.
+        """
+        if len(self.index) == 0:
+            return None
+        return min(tail_date for _, tail_date in self.index.values())
+
+    def load_tail(self, symbol):
+        """
+
+        Returns:
+            QuoteArrays of the tail, None if the ticker is never scanned.
+        """
+        path = self._tail_path(symbol)
+        if symbol not in self.index or not os.path.exists(path):
+            return None
+        with np.load(path) as tail:
+            columns = {column: tail[column] for column in QuoteArrays.__slots__}
+            return QuoteArrays(**columns, dtypes={column: values.dtype for column, values in columns.items()})
+
+    def update(self, symbol, last_evaluated_date, tail):
+        """
+        Record the scan result of a ticker.
+        Args:
+            symbol: str
+                The stock symbol.
+            last_evaluated_date: int
+                The quote_date of the last evaluated index.
+            tail: QuoteArrays
+                The trailing bars kept as context of the next scan.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        np.savez(self._tail_path(symbol), **{column: getattr(tail, column) for column in QuoteArrays.__slots__})
+        self.index[symbol] = [int(last_evaluated_date), int(tail.quote_date[-1])]
+
+    def save(self):
+        """
+        Write the index, it should be called after a scan finishes.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        with open(os.path.join(self.state_dir, INDEX_FILENAME), 'w') as index_file:
+            json.dump(self.index, index_file)
+
+    def _read_index(self):
+        path = os.path.join(self.state_dir, INDEX_FILENAME)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as index_file:
+            return json.load(index_file)
+
+    def _tail_path(self, symbol):
+        return os.path.join(self.state_dir, symbol.replace(os.sep, '_') + '.npz')
@@ -1,5 +1,334 @@
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# The Mass Index that marks a bulge for is_reverse_bulge #
+REVERSE_BULGE_THRESHOLD = 26.5
+
+
+# ---------------------------- Series Helper -----------------------------
+def _as_float_array(data_array):
+    """
+    Convert data_array (list, ndarray or Series, possibly of Decimal objects) into a float64 ndarray.
+    """
+    return np.asarray(data_array, dtype=np.float64)
+
+
+def _column(quotes, name, start=None, stop=None):
+    """
+    Positional slice [start, stop) of a quotes column as a float64 ndarray.
+    Args:
+        quotes: DataFrame or any object exposing the columns as attributes.
+        name: str.
+            The column name.
+        start: int or None.
+        stop: int or None.
+
+    Returns:
+        A float64 ndarray.
+    """
+    return _as_float_array(np.asarray(getattr(quotes, name))[start:stop])
+
+
+class _QuoteSlice(object):
+    """
+    Positional view [start, stop) of the quote columns, so the scalar indicators don't need to build sliced
+    DataFrames.
+    """
+
+    def __init__(self, quotes, start, stop):
+        self._quotes = quotes
+        self._start = start
+        self._stop = stop
+
+    def __getattr__(self, name):
+        return np.asarray(getattr(self._quotes, name))[self._start: self._stop]
+
+
+def _tail_start(cur_idx, length):
+    return max(cur_idx - length + 1, 0)
+
+
+def _rolling_apply(values, window, func):
+    """
+    Apply a numpy reduction func over every window (i - window, i] of values. The output has the same length as
+    values, and the first window - 1 elements are NaN.
+    The reduction of each window only depends on the window itself, so the value at index i is the same no matter
+    whether it's computed from the full array or from the tail ending at i.
+    A 2-D values, e.g. a date x ticker panel, is rolled along its first axis.
+    """
+    out = np.full(values.shape, np.nan)
+    if 0 < window <= len(values):
+        out[window - 1:] = func(sliding_window_view(values, window, axis=0), axis=-1)
+    return out
+
+
+def _rolling_sum(values, window):
+    """
+    The sum over every window (i - window, i] of values, accumulated from the oldest element to the newest like the
+    loop of a scalar indicator, so the sums are the same to the last bit (np.sum adds pairwise). The output has the
+    same length as values, and the first window - 1 elements are NaN. A 2-D values is rolled along its first axis.
+    """
+    out = np.full(values.shape, np.nan)
+    if 0 < window <= len(values):
+        windows = sliding_window_view(values, window, axis=0)
+        total = np.zeros(windows.shape[:-1])
+        for k in range(window):
+            total += windows[..., k]
+        out[window - 1:] = total
+    return out
+
+
+# ---------------------------- Standard Indicator (Series) -----------------------------
+def moving_average_series(data_array, window=14):
+    """
+    Moving Average (MA) of data_array for every index, i.e. the element i is the mean of window (i - window, i].
+    Args:
+        data_array: list or ndarray.
+            Full data list.
+        window: int > 0.
+            The size of observation window.
+
+    Returns:
+        A ndarray with the same length as data_array, NaN when the history is shorter than window.
+    """
+    return _rolling_apply(_as_float_array(data_array), window, np.mean)
+
+
+def exp_moving_average_series(data_array, window=14):
+    """
+    Exponential Moving Average (EMA) of data_array for every index. Like exp_moving_average, the ema at index i is
+    seeded by the element i - window and then updated by the elements in (i - window, i], so all indices are updated
+    at once per step and the loop runs window times instead of window times per index.
+    Args:
+        data_array: list or ndarray.
+            Full data list.
+        window: int > 0.
+            The size of observation window.
+
+    Returns:
+        A ndarray with the same length as data_array, NaN when the history is not longer than window.
+    """
+    values = _as_float_array(data_array)
+    n = len(values)
+    out = np.full(values.shape, np.nan)
+    if n <= window:
+        return out
+
+    alpha = 2 / (window + 1)
+    ema = values[:n - window]
+    for offset in range(1, window + 1):
+        ema = ema + alpha * (values[offset: n - window + offset] - ema)
+
+    out[window:] = ema
+    return out
+
+
+def moving_max_series(data_array, window=14):
+    """
+    Maximum of data_array in observation window (i - window, i] for every index i.
+    Args:
+        data_array: list or ndarray.
+            Full data list.
+        window: int > 0.
+            The size of observation window.
+
+    Returns:
+        A ndarray with the same length as data_array, NaN when the history is shorter than window.
+    """
+    return _rolling_apply(_as_float_array(data_array), window, np.max)
+
+
+def moving_min_series(data_array, window=14):
+    """
+    Minimum of data_array in observation window (i - window, i] for every index i.
+    Args:
+        data_array: list or ndarray.
+            Full data list.
+        window: int > 0.
+            The size of observation window.
+
+    Returns:
+        A ndarray with the same length as data_array, NaN when the history is shorter than window.
+    """
+    return _rolling_apply(_as_float_array(data_array), window, np.min)
+
+
+def shift_series(data_array, periods=1):
+    """
+    Shift data_array forward by periods, i.e. the element i of the output is the element i - periods of data_array.
+    Args:
+        data_array: list or ndarray.
+            Full data list.
+        periods: int >= 0.
+            The number of periods to shift.
+
+    Returns:
+        A float ndarray with the same length as data_array, the first periods elements are NaN.
+    """
+    values = _as_float_array(data_array)
+    out = np.full(values.shape, np.nan)
+    if periods < len(values):
+        out[periods:] = values[:len(values) - periods]
+    return out
+
+
+def true_range_series(quotes):
+    """
+    True Range (TR) for every index of quotes. The first element is NaN because there is no previous close.
+    Args:
+        quotes: DataFrame.
+            A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+
+    Returns:
+        A ndarray with the same length as quotes, or of the same shape as the columns of a QuotePanel.
+    """
+    high = _column(quotes, 'high')
+    low = _column(quotes, 'low')
+    close = _column(quotes, 'close')
+
+    out = np.full(close.shape, np.nan)
+    if len(close) > 1:
+        pre_close = close[:-1]
+        out[1:] = np.maximum(np.maximum(high[1:] - low[1:], np.abs(high[1:] - pre_close)),
+                             np.abs(low[1:] - pre_close))
+    return out
+
+
+def average_true_range_series(quotes, window=14):
+    """
+    Average True Range (ATR) for every index of quotes.
+    Args:
+        quotes: DataFrame.
+            A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+        window: int > 0.
+            The size of observation window.
+
+    Returns:
+        A ndarray with the same length as quotes, NaN when the history is not longer than window.
+    """
+    return _rolling_apply(true_range_series(quotes), window, np.mean)
+
+
+def norm_price_series(quotes):
+    """
+    Normalized Price (NP) for every index of quotes.
+    Args:
+        quotes: DataFrame.
+            A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+
+    Returns:
+        A ndarray with the same length as quotes.
+    """
+    return (_column(quotes, 'high') + _column(quotes, 'low') + _column(quotes, 'close')) / 3
+
+
+def money_flow_index_series(quotes, window=14):
+    """
+    Money Flow Index (MFI) for every index of quotes.
+    Args:
+        quotes: DataFrame.
+            A dataframe contains the <quote_date, open, high, low, close, volume>, and be sorted by quote_date
+            ascending.
+        window: int > 0.
+            The size of observation window.
+
+    Returns:
+        A ndarray with the same length as quotes, NaN when the history is not longer than window.
+    """
+    cur_np = norm_price_series(quotes)
+    raw_mf = _column(quotes, 'volume') * cur_np
+
+    pos_mf = np.zeros(cur_np.shape)
+    neg_mf = np.zeros(cur_np.shape)
+    if len(cur_np) > 1:
+        pos_mf[1:] = np.where(cur_np[:-1] < cur_np[1:], raw_mf[1:], 0.0)
+        neg_mf[1:] = np.where(cur_np[:-1] > cur_np[1:], raw_mf[1:], 0.0)
+
+    pos_sum = _rolling_sum(pos_mf, window)
+    neg_sum = _rolling_sum(neg_mf, window)
+    # the first flow has no previous price
+    pos_sum[:window] = np.nan
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * (pos_sum / (pos_sum + neg_sum))
+
+
+def mass_index_series(quotes, window=25, ema_period=9):
+    """
+    Mass Index (MI) for every index of quotes, the sum of single_ema / double_ema of the high-low range over window.
+    Args:
+        quotes: DataFrame.
+            A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+        window: int > 0.
+            The size of observation window.
+        ema_period: int > 0.
+            The window of the single and double ema.
+
+    Returns:
+        A ndarray with the same length as quotes, NaN when the history is shorter than window + 2 * ema_period.
+    """
+    high_low_diff = _column(quotes, 'high') - _column(quotes, 'low')
+    single_ema = exp_moving_average_series(high_low_diff, ema_period)
+    double_ema = exp_moving_average_series(single_ema, ema_period)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = single_ema / double_ema
+    return _rolling_apply(ratio, window, np.sum)
+
+
+def volatility_series(quotes, period=14):
+    """
+    Volatility, ATR divided by the mean close, for every index of quotes.
+    Args:
+        quotes: DataFrame.
+            A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+        period: int > 0.
+            The size of observation window.
+
+    Returns:
+        A ndarray with the same length as quotes, NaN when the history is not longer than period.
+    """
+    return average_true_range_series(quotes, period) / moving_average_series(_column(quotes, 'close'), period)
+
+
+def volatility_an_series(quotes, period=14):
+    """
+    Volatility, ATR divided by the mean NP, for every index of quotes.
+    Args:
+        quotes: DataFrame.
+            A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+        period: int > 0.
+            The size of observation window.
+
+    Returns:
+        A ndarray with the same length as quotes, NaN when the history is not longer than period.
+    """
+    return average_true_range_series(quotes, period) / moving_average_series(norm_price_series(quotes), period)
+
+
+def reverse_bulge_series(quotes, window=25, threshold=REVERSE_BULGE_THRESHOLD):
+    """
+    Whether the Mass Index turns down from a bulge, i.e. the previous MI reaches threshold and the current MI is
+    lower, for every index of quotes.
+    Args:
+        quotes: DataFrame.
+            A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+        window: int > 0.
+            The window of the Mass Index.
+        threshold: float, default REVERSE_BULGE_THRESHOLD.
+            The Mass Index of a bulge.
+
+    Returns:
+        A bool ndarray with the same length as quotes, false when the history is too short.
+    """
+    mi = mass_index_series(quotes, window)
+
+    out = np.zeros(mi.shape, dtype=bool)
+    if len(mi) > 1:
+        with np.errstate(invalid='ignore'):
+            out[1:] = (mi[:-1] >= threshold) & (mi[1:] < mi[:-1])
+    return out
 
 
 # ---------------------------- Standard Indicator -----------------------------
@@ -16,7 +345,9 @@ def moving_average(data_array, cur_idx, window=14):
     Returns:
         A scalar.
     """
-    return np.mean(data_array[cur_idx - window + 1: cur_idx + 1])
+    if window <= 0 or cur_idx + 1 < window:
+        return np.nan
+    return _as_float_array(np.asarray(data_array)[cur_idx - window + 1: cur_idx + 1]).mean()
 
 
 def exp_moving_average(data_array, cur_idx, window=14):
@@ -33,14 +364,40 @@ def exp_moving_average(data_array, cur_idx, window=14):
     Returns:
         A scalar.
     """
+    if cur_idx < window:
+        return np.nan
 
+    # the same updates as exp_moving_average_series, on python floats as there is a single ema
     alpha = 2 / (window + 1)
-    ema = data_array[cur_idx - window]
+    values = _as_float_array(np.asarray(data_array)[cur_idx - window: cur_idx + 1]).tolist()
+    ema = values[0]
+    for value in values[1:]:
+        ema = ema + alpha * (value - ema)
+    return np.float64(ema)
 
-    for idx in range(cur_idx - window + 1, cur_idx + 1):
-        ema = ema + alpha * (data_array[idx] - ema)
 
-    return ema
+def moving_max(data_array, cur_idx, window=14):
+    """
+    Moving Max of data_array in observation window (cur_idx - window, cur_idx].
+
+    Returns:
+        A scalar, NaN when the history is shorter than window.
+    """
+    if cur_idx + 1 < window or window <= 0:
+        return np.nan
+    return _as_float_array(np.asarray(data_array)[cur_idx - window + 1: cur_idx + 1]).max()
+
+
+def moving_min(data_array, cur_idx, window=14):
+    """
+    Moving Min of data_array in observation window (cur_idx - window, cur_idx].
+
+    Returns:
+        A scalar, NaN when the history is shorter than window.
+    """
+    if cur_idx + 1 < window or window <= 0:
+        return np.nan
+    return _as_float_array(np.asarray(data_array)[cur_idx - window + 1: cur_idx + 1]).min()
 
 
 def ema_list(data_array, cur_idx, lead_size, window=14):
@@ -73,7 +430,7 @@ def ema_list(data_array, cur_idx, lead_size, window=14):
     return np.array(res_list)
 
 
-def true_range(quotes, cur_idx):
+def true_range(quotes, cur_idx, indicators=None):
     """
     True Range indicator (TR), is used to indicate the true range of the trading day.
     Args:
@@ -81,16 +438,19 @@ def true_range(quotes, cur_idx):
             A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
         cur_idx: int > 0.
             The current index.
+        indicators: IndicatorStore, optional.
+            The indicator store of quotes, the value is read from its memoized series when it's given.
 
     Returns:
         A scalar.
     """
-    pre_close = quotes.iloc[cur_idx - 1].close
-    quote = quotes.iloc[cur_idx]
-    return max(quote.high - quote.low, abs(quote.high - pre_close), abs(quote.low - pre_close))
+    if indicators is not None:
+        return indicators.get('true_range', None, 1)[cur_idx]
+    start_idx = _tail_start(cur_idx, 2)
+    return true_range_series(_QuoteSlice(quotes, start_idx, cur_idx + 1))[-1]
 
 
-def average_true_range(quotes, cur_idx, window=14):
+def average_true_range(quotes, cur_idx, window=14, indicators=None):
     """
     Average True Range (ATR), is used to simply indicate the degree of price volatility.
     Args:
@@ -100,15 +460,19 @@ def average_true_range(quotes, cur_idx, window=14):
             The current index.
         window: int > 0.
             The size of observation window.
+        indicators: IndicatorStore, optional.
+            The indicator store of quotes, the value is read from its memoized series when it's given.
 
     Returns:
         A scalar.
     """
-    tr_list = [true_range(quotes, i) for i in range(cur_idx - window + 1, cur_idx + 1)]
-    return np.mean(tr_list)
+    if indicators is not None:
+        return indicators.get('average_true_range', None, window)[cur_idx]
+    start_idx = _tail_start(cur_idx, window + 1)
+    return average_true_range_series(_QuoteSlice(quotes, start_idx, cur_idx + 1), window)[-1]
 
 
-def norm_price(quotes, cur_idx):
+def norm_price(quotes, cur_idx, indicators=None):
     """
     Normalized Price (NP), also known as Typical Price (TP), is the average of high price, the low price and the
     closing price.
@@ -117,73 +481,64 @@ def norm_price(quotes, cur_idx):
             A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
         cur_idx: int > 0.
             The current index.
+        indicators: IndicatorStore, optional.
+            The indicator store of quotes, the value is read from its memoized series when it's given.
 
     Returns:
         A scalar.
     """
-    quote = quotes.iloc[cur_idx]
-    return (quote.high + quote.low + quote.close) / 3
+    if indicators is not None:
+        return indicators.get('norm_price', None, 1)[cur_idx]
+    return norm_price_series(_QuoteSlice(quotes, cur_idx, cur_idx + 1))[-1]
 
 
-def money_flow_index(quotes, cur_idx, window=14):
+def money_flow_index(quotes, cur_idx, window=14, indicators=None):
     """
-    Average True Range (ATR), is an oscillator that ranges from 0 to 100. It is used to show the money flow over
+    Money Flow Index (MFI), is an oscillator that ranges from 0 to 100. It is used to show the money flow over
     several days.
     Args:
         quotes: DataFrame.
-            A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+            A dataframe contains the <quote_date, open, high, low, close, volume>, and be sorted by quote_date
+            ascending.
         cur_idx: int > 0.
             The current index.
         window: int > 0.
             The size of observation window.
+        indicators: IndicatorStore, optional.
+            The indicator store of quotes, the value is read from its memoized series when it's given.
 
     Returns:
         A scalar.
     """
-    pos_mf = 0.0
-    neg_mf = 0.0
-
-    prev_np = norm_price(quotes, cur_idx - window)
-    for i in range(cur_idx - window + 1, cur_idx + 1):
-        cur_np = norm_price(quotes, i)
-        if prev_np < cur_np:
-            # positive MF
-            pos_mf += quotes.iloc[i].volume * cur_np
-        elif prev_np > cur_np:
-            # negative MF
-            neg_mf += quotes.iloc[i].volume * cur_np
-
-        prev_np = cur_np
+    if indicators is not None:
+        return indicators.get('money_flow_index', None, window)[cur_idx]
+    start_idx = _tail_start(cur_idx, window + 1)
+    return money_flow_index_series(_QuoteSlice(quotes, start_idx, cur_idx + 1), window)[-1]
 
-    return 100 * (pos_mf / (pos_mf + neg_mf))
 
-
-def mass_index(quotes, cur_idx, window=25):
+def mass_index(quotes, cur_idx, window=25, indicators=None):
     """
-    Mass Index.
+    Mass Index (MI) at cur_idx.
 
     Args:
-        quotes:
-        cur_idx:
-        window:
+        quotes: DataFrame.
+            A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+        cur_idx: int > 0.
+            The current index.
+        window: int > 0.
+            The size of observation window.
+        indicators: IndicatorStore, optional.
+            The indicator store of quotes, the value is read from its memoized series when it's given.
 
     Returns:
-
+        A scalar, NaN when the history is too short.
     """
+    if indicators is not None:
+        return indicators.get('mass_index', None, window)[cur_idx]
     ema_period = 9
 
-    try:
-
-        high_low_diff = quotes.high - quotes.low
-        high_low_diff = high_low_diff[0: cur_idx + 1]
-        # single_ema list including (period + EMA_PERIOD) elements
-
-        single_ema_list = ema_list(high_low_diff, cur_idx, ema_period)[ema_period:]
-        double_ema_list = ema_list(single_ema_list, cur_idx, ema_period)
-
-        return np.sum(single_ema_list[-window:] / double_ema_list[-window:])
-    except:
-        return None
+    start_idx = _tail_start(cur_idx, window + 2 * ema_period)
+    return mass_index_series(_QuoteSlice(quotes, start_idx, cur_idx + 1), window, ema_period)[-1]
 
 
 # ---------------------------------- Customize Indicator ----------------------------
@@ -203,48 +558,64 @@ def angular(quotes, cur_idx, side_window=5):
         True if it's angular point, otherwise False.
     """
 
-    ob_quotes = quotes.iloc[cur_idx - side_window: cur_idx + side_window]
+    high = np.asarray(quotes.high)
+    low = np.asarray(quotes.low)
+    ob_start = cur_idx - side_window
+    ob_end = cur_idx + side_window
 
-    if quotes.iloc[cur_idx].high >= np.max(ob_quotes.high) or quotes.iloc[cur_idx].low <= np.min(ob_quotes.low):
+    if high[cur_idx] >= np.max(high[ob_start: ob_end]) or low[cur_idx] <= np.min(low[ob_start: ob_end]):
         return True
     else:
         return False
 
 
-def is_reverse_bulge(quotes, index):
-    if index < 0:
+def is_reverse_bulge(quotes, index, indicators=None):
+    """
+    Check whether the Mass Index turns down from a bulge at index, see reverse_bulge_series.
+    Args:
+        quotes: DataFrame.
+            A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+        index: int > 0.
+            The current index.
+        indicators: IndicatorStore, optional.
+            The indicator store of quotes, the Mass Index is read from its memoized series when it's given.
+
+    Returns:
+        True if it's a reverse bulge, otherwise False.
+    """
+    if index < 1:
         return False
-    try:
-        pre_mi = MI(quotes, index - 1)
-        if pre_mi < 26.5:
-            return False
-        cur_mi = MI(quotes, index)
-        if cur_mi >= pre_mi:
-            return False
 
-        return True
-    except:
+    pre_mi = mass_index(quotes, index - 1, indicators=indicators)
+    if not pre_mi >= REVERSE_BULGE_THRESHOLD:
         return False
+    return bool(mass_index(quotes, index, indicators=indicators) < pre_mi)
 
 
-def VOLATILITY_AN(quotes, index, period=14):
+def VOLATILITY_AN(quotes, index, period=14, indicators=None):
     """
-    Volatility calucated by mean of NP divide ATR
+    Volatility calculated by ATR divided by the mean NP over the period.
     Args:
-        quotes:
-        index:
-        period:
+        quotes: DataFrame.
+            A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+        index: int > 0.
+            The current index.
+        period: int > 0.
+            The size of observation window.
+        indicators: IndicatorStore, optional.
+            The indicator store of quotes, the value is read from its memoized series when it's given.
 
     Returns:
-
+        A scalar, NaN when the history is not longer than period.
     """
-    try:
-        return ATR(quotes, index, period) / np.mean([NP(quotes, j) for j in range(index - period + 1, index + 1)])
-    except Exception as e:
-        return None
+    if indicators is not None:
+        return indicators.get('volatility_an', None, period)[index]
+    start_idx = _tail_start(index, period + 1)
+    return volatility_an_series(_QuoteSlice(quotes, start_idx, index + 1), period)[-1]
 
 
-def volatility(quotes, index, period):
-    atr = average_true_range(quotes, index, period)
-    avg = np.mean(quotes.iloc[index - period + 1: index + 1].close)
-    return atr / avg
+def volatility(quotes, index, period, indicators=None):
+    if indicators is not None:
+        return indicators.get('volatility', None, period)[index]
+    start_idx = _tail_start(index, period + 1)
+    return volatility_series(_QuoteSlice(quotes, start_idx, index + 1), period)[-1]
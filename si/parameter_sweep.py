@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/7/3 14:02
+@desc: Back test a grid of strategy configurations over one load of the quote universe.
+"""
+import copy
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from si.lib.indicator_store import IndicatorStore
+from si.lib.prefetch import prefetch
+from si.lib.quote_filter import QuoteFilterSpec
+from si.strategy_runner import StrategyRunner, BACK_TEST_DTYPE, _merge_signals
+
+
+class ParameterSweep(object):
+    """
+    Evaluate every configuration of the sweep.grid config section over the same quotes. Each ticker is loaded once and
+    its indicator arrays are shared by all configurations through one IndicatorStore, so an indicator is computed once
+    per distinct window size.
+
+    The grid maps a dotted config key to the list of its values, e.g.
+        sweep:
+          grid:
+            base_filter.ob_window: [50, 100]
+            strategy.bigspike.rule_8_horizon: [3, 5]
+
+    The universe is loaded once with the loosest company and quote filters of all configurations, see
+    QuoteFilterSpec.from_configs, and every configuration only evaluates the companies that its own filters keep, so
+    the grid can vary any base_filter key.
+    """
+
+    def __init__(self, strategy_cls, config):
+        sweep_config = config['sweep']
+        self.strategy_cls = strategy_cls
+        self.config = config
+        self.grid = sweep_config['grid']
+        self.past_ob_window = sweep_config.get('past_ob_window', 250)
+        self.future_window = sweep_config.get('future_window', 20)
+        self.n_workers = sweep_config.get('n_workers', 1)
+        self.runner = StrategyRunner(strategy_cls(config), config)
+
+    def iter_params(self):
+        """
+
+        Returns:
+            A dict like {dotted_key: value} for every configuration of the grid.
+        """
+        keys = list(self.grid.keys())
+        for values in itertools.product(*[self.grid[key] for key in keys]):
+            yield dict(zip(keys, values))
+
+    def run(self):
+        """
+        Back test all configurations.
+
+        Returns:
+            DataFrame of the summary per configuration, see summarize.
+        """
+        params_list = list(self.iter_params())
+        configs = [_apply_params(self.config, params) for params in params_list]
+        strategies = [self.strategy_cls(config) for config in configs]
+        # load the companies and quotes that any configuration keeps
+        quote_filter = QuoteFilterSpec.from_configs([config['base_filter'] for config in configs])
+        self.runner.quote_filter = quote_filter
+        # load the bars that the most demanding configuration needs
+        quote_window = self.runner.quote_window(
+            self.past_ob_window, self.future_window,
+            lookback_length=max(strategy.get_lookback_length() for strategy in strategies))
+
+        # connect db
+        self.runner.db.connect()
+        company_filters = self._company_filters(configs)
+
+        if self.n_workers > 1:
+            companies = self.runner._get_companies()
+            shards = [companies.iloc[i::self.n_workers] for i in range(self.n_workers)]
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                futures = [executor.submit(_sweep_shard, self.strategy_cls, self.config, quote_filter, strategies,
+                                           company_filters, shard, self.past_ob_window, self.future_window,
+                                           quote_window)
+                           for shard in shards]
+                shard_results = [future.result() for future in futures]
+            results = [_merge_signals([shard_result[k] for shard_result in shard_results], BACK_TEST_DTYPE)
+                       for k in range(len(strategies))]
+        else:
+            results = _evaluate(self.runner, strategies, company_filters,
+                                self.runner._iter_company_quotes(quote_window=quote_window), self.past_ob_window,
+                                self.future_window)
+
+        # close db
+        self.runner.db.close_db()
+
+        return summarize(params_list, results)
+
+    def _company_filters(self, configs):
+        """
+        The company filter of every configuration, so it evaluates the companies that a back test of the configuration
+        alone would load: a tuple like (QuoteFilterSpec, ids of the companies that the backend keeps with it), or None
+        when the configuration keeps the same companies as the runner's quote filter.
+        """
+        runner_key = self.runner.quote_filter.company_id_sql()
+        company_ids = {}
+        company_filters = []
+        for config in configs:
+            quote_filter = QuoteFilterSpec.from_config(config['base_filter'])
+            # the compiled SQL identifies the companies that a spec keeps
+            key = quote_filter.company_id_sql()
+            if key == runner_key:
+                company_filters.append(None)
+                continue
+            if key not in company_ids:
+                company_ids[key] = set(self.runner.db.get_companies_with_id(quote_filter)['id'].tolist())
+            company_filters.append((quote_filter, company_ids[key]))
+        return company_filters
+
+
+def summarize(params_list, results):
+    """
+    Summarize the back test result of every configuration.
+    Args:
+        params_list: list of dict.
+            The parameters of every configuration.
+        results: list of record array.
+            The signals of BACK_TEST_DTYPE of every configuration.
+
+    Returns:
+        DataFrame with the parameters, the number of signals, the hit rate (positive hold ROI) and the distribution of
+        the ROI of every configuration.
+    """
+    rows = []
+    for params, signals in zip(params_list, results):
+        hold_roi = signals['hold_roi']
+        row = dict(params)
+        row['n_signals'] = len(signals)
+        if len(signals) > 0:
+            row['hit_rate'] = np.mean(hold_roi > 0)
+            row['hold_roi_mean'] = np.mean(hold_roi)
+            row['hold_roi_std'] = np.std(hold_roi)
+            row['hold_roi_p10'], row['hold_roi_median'], row['hold_roi_p90'] = np.percentile(hold_roi, [10, 50, 90])
+            row['low_roi_mean'] = np.mean(signals['low_roi'])
+            row['high_roi_mean'] = np.mean(signals['high_roi'])
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def _apply_params(config, params):
+    config = copy.deepcopy(config)
+    for dotted_key, value in params.items():
+        section = config
+        keys = dotted_key.split('.')
+        for key in keys[:-1]:
+            section = section[key]
+        section[keys[-1]] = value
+    return config
+
+
+def _accept_company(company_filter, company, quotes):
+    """
+    Whether a company passes the company filter of a configuration, see ParameterSweep._company_filters.
+    """
+    if company_filter is None:
+        return True
+    quote_filter, company_ids = company_filter
+    return company['id'] in company_ids and quote_filter.accept_company(company) and quote_filter.accept_quotes(quotes)
+
+
+def _evaluate(runner, strategies, company_filters, company_quotes, past_ob_window, future_window):
+    """
+    Back test every strategy over company_quotes, each over the companies that its company filter keeps.
+
+    Returns:
+        A list of record array of BACK_TEST_DTYPE, one per strategy.
+    """
+    results = [[] for _ in strategies]
+    for company, quotes in prefetch(company_quotes, runner.prefetch_size):
+        if runner._filter_company(company):
+            continue
+        symbol = company['symbol']
+
+        len_quotes = len(quotes)
+        start_idx = max(len_quotes - past_ob_window - future_window, 0)
+        end_idx = max(len_quotes - future_window, 0)
+
+        indicators = IndicatorStore(quotes)
+        for k, strategy in enumerate(strategies):
+            if not _accept_company(company_filters[k], company, quotes):
+                continue
+            signal_indices = runner.signal_indices(quotes, start_idx, end_idx, strategy=strategy,
+                                                   indicators=indicators)
+            results[k].append(runner.signal_records(symbol, quotes, signal_indices, future_window, with_profit=True,
+                                                    strategy=strategy))
+
+    return [_merge_signals(signals, BACK_TEST_DTYPE) for signals in results]
+
+
+def _sweep_shard(strategy_cls, config, quote_filter, strategies, company_filters, companies, past_ob_window,
+                 future_window, quote_window):
+    """
+    Back test a shard of companies in a worker process.
+    """
+    runner = StrategyRunner(strategy_cls(config), config)
+    runner.quote_filter = quote_filter
+    if runner.quote_cache is None:
+        runner.db.connect()
+    try:
+        return _evaluate(runner, strategies, company_filters, runner._iter_company_quotes(companies, quote_window),
+                         past_ob_window, future_window)
+    finally:
+        if runner.quote_cache is None:
+            runner.db.close_db()
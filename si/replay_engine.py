@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/9/11 16:40
+@desc: Replay the daily bars of the universe in time order and simulate the trades of the strategies.
+"""
+import heapq
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from si.lib.quote_arrays import Bar, QuoteArrays
+from si.lib.quote_window import QuoteWindow
+
+# Number of bars of a ticker whose signals are computed, and which are held as Bar, at a time #
+DEFAULT_CHUNK_SIZE = 256
+
+DEFAULT_INITIAL_CASH = 100000.0
+
+DEFAULT_MAX_POSITIONS = 10
+
+# Number of bars a position is held when its EntryOrder doesn't set hold_window #
+DEFAULT_HOLD_WINDOW = 20
+
+TRADE_DTYPE = [('symbol', 'U16'), ('strategy', 'U32'), ('entry_date', np.int64), ('entry_price', np.float64),
+               ('shares', np.int64), ('exit_date', np.int64), ('exit_price', np.float64), ('exit_reason', 'U16'),
+               ('roi', np.float64)]
+
+EQUITY_DTYPE = [('quote_date', np.int64), ('cash', np.float64), ('equity', np.float64), ('n_positions', np.int64)]
+
+# A bar of one ticker, with the (strategy name, EntryOrder) of the signals at its close #
+BarEvent = namedtuple('BarEvent', ['quote_date', 'symbol', 'bar', 'orders'])
+
+
+class _PendingOrder(object):
+    __slots__ = ['strategy', 'order', 'n_bars']
+
+    def __init__(self, strategy, order):
+        self.strategy = strategy
+        self.order = order
+        self.n_bars = 0
+
+
+class _Position(object):
+    __slots__ = ['strategy', 'entry_date', 'entry_price', 'shares', 'stop_price', 'hold_window', 'n_bars']
+
+    def __init__(self, strategy, entry_date, entry_price, shares, stop_price, hold_window):
+        self.strategy = strategy
+        self.entry_date = entry_date
+        self.entry_price = entry_price
+        self.shares = shares
+        self.stop_price = stop_price
+        self.hold_window = hold_window
+        self.n_bars = 0
+
+
+class Portfolio(object):
+    """
+    The cash, the open positions and the pending entry orders, updated bar by bar.
+
+    An order is filled on a bar after its signal, with an equal share of the equity per position, and a ticker holds
+    at most one position or pending order. A position is sold at the open of the hold_window-th bar after its entry,
+    or at its stop price, or at the open when a bar opens below it, whichever comes first. The stop is only checked
+    from the bar after the entry, as a daily bar doesn't tell whether its low came before the fill.
+    """
+
+    def __init__(self, cash=DEFAULT_INITIAL_CASH, max_positions=DEFAULT_MAX_POSITIONS, hold_window=DEFAULT_HOLD_WINDOW):
+        self.cash = cash
+        self.max_positions = max_positions
+        self.hold_window = hold_window
+
+        self.positions = {}
+        self.orders = {}
+        self.last_price = {}
+        self.trades = []
+        self.equity_curve = []
+
+    def place(self, symbol, strategy, order):
+        """
+        Place order on symbol, ignored when the ticker already has a position or an order.
+        """
+        if order is None or symbol in self.positions or symbol in self.orders:
+            return False
+        self.orders[symbol] = _PendingOrder(strategy, order)
+        return True
+
+    def on_bar(self, quote_date, symbol, bar):
+        """
+        Fill the pending order of symbol, or check the exits of its position, on its bar of quote_date.
+        """
+        position = self.positions.get(symbol)
+        if position is not None:
+            position.n_bars += 1
+            if position.n_bars >= position.hold_window:
+                self._close(symbol, quote_date, bar.open, 'hold')
+            elif position.stop_price is not None and bar.open <= position.stop_price:
+                self._close(symbol, quote_date, bar.open, 'stop_loss')
+            elif position.stop_price is not None and bar.low <= position.stop_price:
+                self._close(symbol, quote_date, position.stop_price, 'stop_loss')
+            else:
+                self.last_price[symbol] = bar.close
+            return
+
+        pending = self.orders.get(symbol)
+        if pending is not None:
+            pending.n_bars += 1
+            fill_price = self._fill_price(pending.order, bar)
+            if fill_price is not None:
+                del self.orders[symbol]
+                self._open(symbol, quote_date, fill_price, pending, bar)
+            elif pending.n_bars >= pending.order.entry_window:
+                del self.orders[symbol]
+
+    def mark(self, quote_date):
+        """
+        Record the equity at the close of quote_date.
+        """
+        self.equity_curve.append((quote_date, self.cash, self.equity(), len(self.positions)))
+
+    def equity(self):
+        return self.cash + sum(position.shares * self.last_price[symbol]
+                               for symbol, position in self.positions.items())
+
+    def close_all(self, quote_date):
+        """
+        Sell every position at its last close, e.g. at the end of the replay.
+        """
+        for symbol in list(self.positions):
+            self._close(symbol, quote_date, self.last_price[symbol], 'end')
+        self.orders.clear()
+
+    @staticmethod
+    def _fill_price(order, bar):
+        if order.limit_price is None:
+            return bar.open
+        if bar.open <= order.limit_price:
+            return bar.open
+        if bar.low <= order.limit_price:
+            return order.limit_price
+        return None
+
+    def _open(self, symbol, quote_date, price, pending, bar):
+        if len(self.positions) >= self.max_positions or not price > 0:
+            return
+        allocation = min(self.cash, self.equity() / self.max_positions)
+        shares = int(allocation // price)
+        if shares <= 0:
+            return
+
+        order = pending.order
+        stop_price = None if order.stop_loss_roi is None else price * (1 + order.stop_loss_roi)
+        hold_window = self.hold_window if order.hold_window is None else order.hold_window
+        self.cash -= shares * price
+        self.positions[symbol] = _Position(pending.strategy, quote_date, price, shares, stop_price, hold_window)
+        self.last_price[symbol] = bar.close
+
+    def _close(self, symbol, quote_date, price, reason):
+        position = self.positions.pop(symbol)
+        del self.last_price[symbol]
+        self.cash += position.shares * price
+        self.trades.append((symbol, position.strategy, position.entry_date, position.entry_price, position.shares,
+                            quote_date, price, reason, price / position.entry_price - 1))
+
+
+class ReplayEngine(object):
+    """
+    Replay the daily bars of every ticker in quote_date order, as a heap-based k-way merge of one bar iterator per
+    ticker, and trade the signals of the runner's strategies in a Portfolio.
+
+    A ticker's iterator reads chunk_size bars at a time from the quote cache, with the lookback bars before them, and
+    computes their signals with StrategyRunner.scan_quotes. Between its events a ticker only holds its current chunk,
+    copied out of the memory-mapped columns, so a replay of the whole universe over many years streams through the
+    cache instead of loading every quote. The replay needs the quote cache, i.e. data.use_cache.
+
+    The replay config section:
+        initial_cash: float, default DEFAULT_INITIAL_CASH.
+        max_positions: int, default DEFAULT_MAX_POSITIONS.
+        hold_window: int, default DEFAULT_HOLD_WINDOW.
+        chunk_size: int, default DEFAULT_CHUNK_SIZE.
+    """
+
+    def __init__(self, runner, config):
+        if runner.quote_cache is None:
+            raise ValueError("The replay streams the quotes from the quote cache, set data.use_cache to true")
+
+        replay_config = config.get('replay', {})
+        self.runner = runner
+        self.profiler = runner.profiler
+        self.initial_cash = replay_config.get('initial_cash', DEFAULT_INITIAL_CASH)
+        self.max_positions = replay_config.get('max_positions', DEFAULT_MAX_POSITIONS)
+        self.hold_window = replay_config.get('hold_window', DEFAULT_HOLD_WINDOW)
+        self.chunk_size = replay_config.get('chunk_size', DEFAULT_CHUNK_SIZE)
+
+    def run(self, start_date=None, end_date=None):
+        """
+        Replay the bars of [start_date, end_date], all bars when neither is set. The positions still open after the
+        last bar are sold at their last close.
+
+        Returns:
+            A tuple like (trades, equity), DataFrames with the columns of TRADE_DTYPE and EQUITY_DTYPE.
+        """
+        lookback_length = self.runner.get_lookback_length()
+        quote_window = None
+        if start_date is not None or end_date is not None:
+            quote_window = QuoteWindow.date_range(start_date, end_date, n_before=lookback_length)
+
+        portfolio = Portfolio(self.initial_cash, self.max_positions, self.hold_window)
+        with self.profiler.session('replay'):
+            # connect db
+            self.runner.db.connect()
+            try:
+                # only the symbols are kept, the quotes are read again chunk by chunk
+                symbols = [company['symbol'] for company, _ in
+                           self.runner._iter_company_quotes(quote_window=quote_window, prune=True)
+                           if not self.runner._filter_company(company)]
+                events = heapq.merge(*[self._iter_events(symbol, quote_window, lookback_length)
+                                       for symbol in symbols],
+                                     key=lambda event: (event.quote_date, event.symbol))
+                self._replay(events, portfolio)
+            finally:
+                # close db
+                self.runner.db.close_db()
+
+        return (pd.DataFrame(np.array(portfolio.trades, dtype=TRADE_DTYPE)),
+                pd.DataFrame(np.array(portfolio.equity_curve, dtype=EQUITY_DTYPE)))
+
+    def _replay(self, events, portfolio):
+        cur_date = None
+        for event in events:
+            if event.quote_date != cur_date:
+                if cur_date is not None:
+                    portfolio.mark(cur_date)
+                cur_date = event.quote_date
+
+            self.profiler.count('bars_replayed')
+            portfolio.on_bar(event.quote_date, event.symbol, event.bar)
+            for strategy_name, order in event.orders:
+                if portfolio.place(event.symbol, strategy_name, order):
+                    self.profiler.count('orders')
+
+        if cur_date is not None:
+            portfolio.close_all(cur_date)
+            portfolio.mark(cur_date)
+        self.profiler.count('trades', len(portfolio.trades))
+
+    def _iter_events(self, symbol, quote_window, lookback_length):
+        """
+        Iterate the BarEvent of a ticker over the replayed range, chunk by chunk.
+        """
+        start_idx, end_idx = self._replay_indices(symbol, quote_window)
+
+        for chunk_start in range(start_idx, end_idx, self.chunk_size):
+            chunk_end = min(chunk_start + self.chunk_size, end_idx)
+            offset = max(chunk_start - lookback_length, 0)
+            chunk_quotes = self._read_quotes(symbol, offset, chunk_end)
+
+            orders = {}
+            with self.profiler.stage('replay.signals'):
+                records = self.runner.scan_quotes(symbol, chunk_quotes, chunk_start - offset, chunk_end - offset,
+                                                  0, with_profit=False)
+                for strategy, strategy_records in zip(self.runner.strategies, records):
+                    signal_indices = np.searchsorted(chunk_quotes.quote_date, strategy_records['quote_date'])
+                    for signal_idx in signal_indices.tolist():
+                        orders.setdefault(signal_idx + offset, []).append(
+                            (strategy.get_name(), strategy.entry(chunk_quotes, signal_idx)))
+
+            bars = zip(*[getattr(chunk_quotes, column)[chunk_start - offset:].tolist() for column in Bar._fields])
+            for idx, row in enumerate(bars, chunk_start):
+                bar = Bar(*row)
+                yield BarEvent(bar.quote_date, symbol, bar, orders.get(idx, ()))
+
+    def _replay_indices(self, symbol, quote_window):
+        """
+        Returns:
+            A tuple like (start_idx, end_idx), the range of the cached bars of symbol that are replayed.
+        """
+        quotes = self.runner.quote_cache.get_quote_arrays_by_symbol(symbol)
+        if quote_window is not None:
+            return quote_window.date_range_indices(quotes)
+        return 0, len(quotes)
+
+    def _read_quotes(self, symbol, start, stop):
+        """
+        Read the cached bars [start, stop) of symbol, copied so that the memory-mapped columns, and their open files,
+        are released at once.
+        """
+        quotes = self.runner.quote_cache.get_quote_arrays_by_symbol(symbol)
+        return QuoteArrays.concat([quotes[start: stop]])
@@ -9,38 +9,128 @@
 from abc import abstractmethod, ABC
 import numpy as np
 
+from si.lib.indicator_store import IndicatorStore
+from si.lib.profiler import NULL_PROFILER
+from si.lib.quote_filter import DEFAULT_MIN_CLOSE_RANGE
+from si.strategy.order import EntryOrder
+from si.strategy.rule_set import RuleSet
+
+
+def all_rules(rules):
+    """
+    Combine the bool arrays of a rule dict, true where every rule is met.
+    """
+    return np.logical_and.reduce(list(rules.values()))
+
 
 class BaseStrategy(ABC):
+    # The name that tags the signals of the strategy, the class name when it's None #
+    name = None
+
+    # StrategyRunner replaces it when the profiling is enabled #
+    profiler = NULL_PROFILER
+
+    # The dotted config keys that the strategy reads, checked by si.config.validate_config #
+    required_config = ['base_filter.ob_window', 'base_filter.min_price', 'base_filter.min_volume']
 
     def __init__(self, config):
         self.base_filter_config = config['base_filter']
+        self.adaptive_rule_order = config.get('runner', {}).get('adaptive_rule_order', False)
+        self._rule_set = None
 
-    def forward(self, quotes, cur_idx, **kwargs):
+    def __getstate__(self):
+        # the rules are closures, they are built again in the worker processes
+        state = self.__dict__.copy()
+        state['_rule_set'] = None
+        return state
+
+    def get_name(self):
+        return self.name if self.name is not None else type(self).__name__
+
+    def get_rules(self):
+        """
+        The rules of the strategy, a strategy that declares them can evaluate them with rule_set.
+
+        Returns:
+            A list of Rule, or None when the strategy checks its rules in apply_strategy itself.
+        """
+        return None
+
+    @property
+    def rule_set(self):
+        """
+        The RuleSet of get_rules, built once, or None.
+        """
+        if self._rule_set is None:
+            rules = self.get_rules()
+            if rules is not None:
+                self._rule_set = RuleSet(rules, adaptive=self.adaptive_rule_order, name=self.get_name())
+        return self._rule_set
+
+    def forward(self, quotes, cur_idx, indicators=None, **kwargs):
         """
         Run strategy at the cur_idx of quotes.
         Args:
-            quotes: DataFrame.
-                A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+            quotes: QuoteArrays.
+                The quotes of <quote_date, open, close, high, low, volume>, sorted by quote_date ascending.
             cur_idx: int > 0.
                 The current index.
+            indicators: IndicatorStore, optional.
+                The indicators of quotes shared across the indices and strategies. A new store is used when it's None.
             **kwargs:
 
         Returns:
             A bool, true if the signal is met, false otherwise.
         """
-        if self.filter_quotes(quotes, cur_idx, **kwargs) and self.apply_strategy(quotes, cur_idx, **kwargs):
-            return True
-        else:
+        if indicators is None:
+            indicators = IndicatorStore(quotes)
+
+        with self.profiler.stage('filter_quotes'):
+            passed = self.filter_quotes(quotes, cur_idx, indicators=indicators, **kwargs)
+        if not passed:
             return False
 
-    def filter_quotes(self, quotes, cur_idx, **kwargs):
+        with self.profiler.stage('apply_strategy'):
+            return self.apply_strategy(quotes, cur_idx, indicators=indicators, **kwargs)
+
+    def forward_all(self, quotes, indicators=None, **kwargs):
+        """
+        Run strategy at every index of quotes at once.
+        Args:
+            quotes: QuoteArrays.
+                The quotes of <quote_date, open, close, high, low, volume>, sorted by quote_date ascending.
+            indicators: IndicatorStore, optional.
+                The indicator arrays of quotes shared with other strategies or configurations. A new store is used
+                when it's None.
+            **kwargs:
+
+        Returns:
+            A bool ndarray with the same length as quotes, true where the signal is met. None if the strategy doesn't
+            implement apply_strategy_all, then the caller should fall back to forward.
+        """
+        if indicators is None:
+            indicators = IndicatorStore(quotes)
+
+        with self.profiler.stage('apply_strategy'):
+            strategy_signals = self.apply_strategy_all(quotes, indicators, **kwargs)
+        if strategy_signals is None:
+            return None
+
+        with self.profiler.stage('filter_quotes'):
+            filter_signals = self.filter_quotes_all(quotes, indicators, **kwargs)
+
+        return filter_signals & strategy_signals
+
+    def filter_quotes(self, quotes, cur_idx, indicators=None, **kwargs):
         """
         Apply a basely filter on quotes.
         Args:
-            quotes: DataFrame.
-                A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+            quotes: QuoteArrays.
+                The quotes of <quote_date, open, close, high, low, volume>, sorted by quote_date ascending.
             cur_idx: int > 0.
                 The current index.
+            indicators: IndicatorStore, optional.
+                The window statistics are read from it, a new store is used when it's None.
             **kwargs:
 
         Returns:
@@ -49,36 +139,85 @@ class BaseStrategy(ABC):
         ob_window = self.base_filter_config['ob_window']
         min_price = self.base_filter_config['min_price']
         min_volume = self.base_filter_config['min_volume']
+        min_close_range = self.base_filter_config.get('min_close_range', DEFAULT_MIN_CLOSE_RANGE)
 
         start_idx = cur_idx - ob_window
 
         if start_idx < 0:
+            self.profiler.reject('base_filter.history')
             return False
 
-        # filter price
-        period_quotes = quotes.iloc[start_idx: cur_idx]
+        if indicators is None:
+            indicators = IndicatorStore(quotes)
 
-        if np.min(period_quotes.low) < min_price:
+        # filter price, over the window [start_idx, cur_idx)
+        if indicators.value('moving_min', 'low', ob_window, cur_idx, shift=1) < min_price:
+            self.profiler.reject('base_filter.min_price')
             return False
 
         # filter volume
-        if np.mean(period_quotes.volume) < min_volume:
+        if indicators.value('moving_average', 'volume', ob_window, cur_idx, shift=1) < min_volume:
+            self.profiler.reject('base_filter.min_volume')
             return False
 
-        if np.max(period_quotes.close) / np.min(period_quotes.close) < 1.4:
+        period_max_close = indicators.value('moving_max', 'close', ob_window, cur_idx, shift=1)
+        if period_max_close / indicators.value('moving_min', 'close', ob_window, cur_idx, shift=1) < min_close_range:
+            self.profiler.reject('base_filter.min_close_range')
             return False
 
         return True
 
+    def filter_quotes_all(self, quotes, indicators, **kwargs):
+        """
+        Apply the basely filter at every index of quotes at once, the same as filter_quotes.
+        Args:
+            quotes: QuoteArrays.
+                The quotes of <quote_date, open, close, high, low, volume>, sorted by quote_date ascending.
+            indicators: IndicatorStore.
+                The indicator arrays of quotes.
+            **kwargs:
+
+        Returns:
+            A bool ndarray with the same length as quotes.
+        """
+        return all_rules(self.filter_rules_all(quotes, indicators, **kwargs))
+
+    def filter_rules_all(self, quotes, indicators, **kwargs):
+        """
+        The rules of the basely filter at every index of quotes, in the order filter_quotes checks them.
+
+        Returns:
+            A dict of rule name to bool ndarray with the same length as quotes.
+        """
+        ob_window = self.base_filter_config['ob_window']
+        min_price = self.base_filter_config['min_price']
+        min_volume = self.base_filter_config['min_volume']
+        min_close_range = self.base_filter_config.get('min_close_range', DEFAULT_MIN_CLOSE_RANGE)
+
+        # statistics of the period [cur_idx - ob_window, cur_idx)
+        period_min_low = indicators.get('moving_min', 'low', ob_window, shift=1)
+        period_avg_volume = indicators.get('moving_average', 'volume', ob_window, shift=1)
+        period_max_close = indicators.get('moving_max', 'close', ob_window, shift=1)
+        period_min_close = indicators.get('moving_min', 'close', ob_window, shift=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {
+                'min_price': period_min_low >= min_price,
+                'min_volume': period_avg_volume >= min_volume,
+                'min_close_range': period_max_close / period_min_close >= min_close_range,
+            }
+
     @abstractmethod
-    def apply_strategy(self, quotes, cur_idx, **kwargs):
+    def apply_strategy(self, quotes, cur_idx, indicators=None, **kwargs):
         """
         Apply the strategy to exploit the trading signal.
         Args:
-            quotes: DataFrame.
-                A dataframe contains the <quote_date, open, high, low, close>, and be sorted by quote_date ascending.
+            quotes: QuoteArrays.
+                The quotes of <quote_date, open, close, high, low, volume>, sorted by quote_date ascending.
             cur_idx: int > 0.
                 The current index.
+            indicators: IndicatorStore, optional.
+                The indicators of quotes shared with the base filter and the other strategies.
             **kwargs:
 
         Returns:
@@ -86,6 +225,57 @@ class BaseStrategy(ABC):
         """
         pass
 
+    def apply_strategy_all(self, quotes, indicators, **kwargs):
+        """
+        Apply the strategy at every index of quotes at once, with the rule_set by default.
+        Args:
+            quotes: QuoteArrays.
+                The quotes of <quote_date, open, close, high, low, volume>, sorted by quote_date ascending.
+            indicators: IndicatorStore.
+                The indicator arrays of quotes.
+            **kwargs:
+
+        Returns:
+            A bool ndarray with the same length as quotes, or None when it's not implemented.
+        """
+        if self.rule_set is None:
+            return None
+
+        return self.rule_set.evaluate_all(quotes, indicators)
+
+    def strategy_rules_all(self, quotes, indicators, **kwargs):
+        """
+        The rules of the strategy at every index of quotes, in the order the rule_set evaluates them.
+
+        Returns:
+            A dict of rule name to bool ndarray with the same length as quotes, or None when it's not implemented.
+        """
+        if self.rule_set is None:
+            return None
+
+        return self.rule_set.rules_all(quotes, indicators)
+
+    def entry(self, quotes, signal_index):
+        """
+        The order to place on the signal at signal_index, buying at the open of the next bar by default.
+        Args:
+            quotes: QuoteArrays.
+                The quotes of <quote_date, open, close, high, low, volume>, sorted by quote_date ascending. Only the
+                bars up to signal_index are known.
+            signal_index: int.
+                The index of the signal.
+
+        Returns:
+            EntryOrder, or None to skip the signal.
+        """
+        return EntryOrder()
+
+    def get_lookback_length(self):
+        """
+        The number of bars before an index that forward needs, covering both the base filter and the strategy.
+        """
+        return max(self.get_context_length(), self.base_filter_config['ob_window']) + 1
+
     @abstractmethod
     def get_context_length(self):
         pass
@@ -6,16 +6,21 @@
 @time: 2021/1/9 21:52
 @desc:
 """
-import numpy as np
-
-from si.lib.ta_lib import moving_average, exp_moving_average
+from si.lib.indicator_store import IndicatorStore
 from si.strategy.base_strategy import BaseStrategy
+from si.strategy.order import EntryOrder
+from si.strategy.rule_set import Rule
 
 
 class BigSpikeStrategy(BaseStrategy):
     """
     Find the quotes that experience a series big spike.
     """
+    name = 'bigspike'
+
+    required_config = BaseStrategy.required_config + [
+        'strategy.bigspike.ob_window', 'strategy.bigspike.rule_3_volume', 'strategy.bigspike.rule_8_horizon',
+        'strategy.bigspike.rule_8_volume_multiple']
 
     def __init__(
             self,
@@ -27,6 +32,8 @@ class BigSpikeStrategy(BaseStrategy):
         self.rule_3_volume = strategy_config['rule_3_volume']
         self.rule_8_horizon = strategy_config['rule_8_horizon']
         self.rule_8_volume_multiple = strategy_config['rule_8_volume_multiple']
+        self.entry_window = strategy_config.get('entry_window', 5)
+        self.stop_loss_roi = strategy_config.get('stop_loss_roi', -0.1)
 
     def get_context_length(self):
         return self.ob_window
@@ -35,44 +42,64 @@ class BigSpikeStrategy(BaseStrategy):
         # return self.rule_8_horizon
         return 0
 
-    def apply_strategy(self, quotes, cur_idx, **kwargs):
-        # price on spike day above {ob_window} day price high.
-        rule_2 = quotes.iloc[cur_idx].close > np.max(quotes.iloc[cur_idx - self.ob_window:cur_idx].high)
-
-        # 50 day volume moving average is less than 300000.
-        rule_3 = quotes['volume'].iloc[cur_idx - self.ob_window: cur_idx].mean() < self.rule_3_volume
-
-        # closing price on spike day is above the opening price on the same day.
-        rule_4 = quotes.iloc[cur_idx]['close'] > quotes.iloc[cur_idx]['open']
-
-        # closing price on spike day is above the closing price on the day before the spike.
-        rule_5 = quotes.iloc[cur_idx]['close'] > quotes.iloc[cur_idx - 1]['close']
-
-        # volume after the spike is at least three times the volume traded the day before the spike.
-        # rule_8 = (moving_average(quotes['volume'], cur_idx + self.rule_8_horizon, self.rule_8_horizon) >
-        #           moving_average(quotes['volume'], cur_idx - 1, self.rule_8_horizon) * self.rule_8_volume_multiple)
-        rule_8 = (quotes['volume'].iloc[cur_idx] >
-                  moving_average(quotes['volume'], cur_idx - 1, self.rule_8_horizon) * self.rule_8_volume_multiple)
-
-        # gradual volume increase but not enough to push the stock above the 60 day high.
-        rule_9 = ((exp_moving_average(quotes['volume'], cur_idx, self.ob_window) <
-                  moving_average(quotes['volume'], cur_idx, self.ob_window) * 1.5)
-                  and (exp_moving_average(quotes['volume'], cur_idx, self.ob_window) >
-                  moving_average(quotes['volume'], cur_idx, self.ob_window)))
-
-        # apply rules
-        result = rule_2 & rule_3 & rule_4 & rule_5 & rule_8 & rule_9
-
-        return result
+    def apply_strategy(self, quotes, cur_idx, indicators=None, **kwargs):
+        if cur_idx < self.ob_window:
+            return False
+
+        if indicators is None:
+            indicators = IndicatorStore(quotes)
+        return self.rule_set.evaluate(quotes, cur_idx, indicators, self.profiler)
+
+    def get_rules(self):
+        ob_window = self.ob_window
+        horizon = self.rule_8_horizon
+
+        def rule_9(quotes, cur_idx, indicators):
+            volume_ema = indicators.value('exp_moving_average', 'volume', ob_window, cur_idx)
+            volume_ma = indicators.value('moving_average', 'volume', ob_window, cur_idx)
+            return volume_ma < volume_ema < volume_ma * 1.5
+
+        def rule_9_all(quotes, indicators):
+            volume_ema = indicators.get('exp_moving_average', 'volume', ob_window)
+            volume_ma = indicators.get('moving_average', 'volume', ob_window)
+            return (volume_ema < volume_ma * 1.5) & (volume_ema > volume_ma)
+
+        return [
+            # price on spike day above {ob_window} day price high.
+            Rule('rule_2',
+                 lambda quotes, cur_idx, indicators: quotes.close[cur_idx] > indicators.value(
+                     'moving_max', 'high', ob_window, cur_idx, shift=1),
+                 lambda quotes, indicators: indicators.column('close') > indicators.get('moving_max', 'high',
+                                                                                        ob_window, shift=1),
+                 cost=ob_window),
+            # 50 day volume moving average is less than 300000.
+            Rule('rule_3',
+                 lambda quotes, cur_idx, indicators: indicators.value(
+                     'moving_average', 'volume', ob_window, cur_idx, shift=1) < self.rule_3_volume,
+                 lambda quotes, indicators: indicators.get('moving_average', 'volume', ob_window,
+                                                           shift=1) < self.rule_3_volume,
+                 cost=ob_window),
+            # closing price on spike day is above the opening price on the same day.
+            Rule('rule_4',
+                 lambda quotes, cur_idx, indicators: quotes.close[cur_idx] > quotes.open[cur_idx],
+                 lambda quotes, indicators: indicators.column('close') > indicators.column('open')),
+            # closing price on spike day is above the closing price on the day before the spike.
+            Rule('rule_5',
+                 lambda quotes, cur_idx, indicators: quotes.close[cur_idx] > quotes.close[cur_idx - 1],
+                 lambda quotes, indicators: indicators.column('close') > indicators.column('close', shift=1)),
+            # volume after the spike is at least three times the volume traded the day before the spike.
+            Rule('rule_8',
+                 lambda quotes, cur_idx, indicators: quotes.volume[cur_idx] > indicators.value(
+                     'moving_average', 'volume', horizon, cur_idx, shift=1) * self.rule_8_volume_multiple,
+                 lambda quotes, indicators: indicators.column('volume') > indicators.get(
+                     'moving_average', 'volume', horizon, shift=1) * self.rule_8_volume_multiple,
+                 cost=horizon),
+            # gradual volume increase but not enough to push the stock above the 60 day high.
+            Rule('rule_9', rule_9, rule_9_all, cost=4 * ob_window),
+        ]
 
     def entry(self, quotes, signal_index):
-        stop_loss_roi = - 0.1
-        entry_window = 5
-
-        triger_price = (quotes.iloc[signal_index]['close'] + quotes.iloc[signal_index]['open']) / 2.0
-        for idx in range(signal_index + 1, signal_index + 1 + entry_window):
-            if quotes.iloc[idx]:
-                pass
-
-
-
+        # buy on a pullback to the middle of the spike day within entry_window days
+        trigger_price = (quotes.close[signal_index] + quotes.open[signal_index]) / 2.0
+        return EntryOrder(limit_price=float(trigger_price), entry_window=self.entry_window,
+                          stop_loss_roi=self.stop_loss_roi)
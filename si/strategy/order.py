@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/9/11 16:05
+@desc: The entry order that a strategy places on a signal.
+"""
+
+
+class EntryOrder(object):
+    """
+    How to enter and leave a position after a signal, filled by the ReplayEngine on the bars after the signal bar.
+    Args:
+        limit_price: float, optional.
+            Buy when a bar trades at or below it, at the open when the bar opens below it. None buys at the open of
+            the next bar.
+        entry_window: int > 0, default 1.
+            The number of bars after the signal that the order stays open.
+        stop_loss_roi: float < 0, optional.
+            Sell when a bar trades at or below entry_price * (1 + stop_loss_roi), from the bar after the entry.
+        hold_window: int > 0, optional.
+            Sell at the open of the hold_window-th bar after the entry, the replay.hold_window config when it's None.
+    """
+    __slots__ = ['limit_price', 'entry_window', 'stop_loss_roi', 'hold_window']
+
+    def __init__(self, limit_price=None, entry_window=1, stop_loss_roi=None, hold_window=None):
+        self.limit_price = limit_price
+        self.entry_window = entry_window
+        self.stop_loss_roi = stop_loss_roi
+        self.hold_window = hold_window
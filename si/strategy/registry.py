@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/9/18 10:36
+@desc: The strategies by name, imported only when they are used.
+"""
+import importlib
+
+# The dotted class path of every strategy, keyed by the name that tags its signals #
+STRATEGY_REGISTRY = {
+    'bigspike': 'si.strategy.bigspike_strategy.BigSpikeStrategy',
+    'stable_break': 'si.strategy.stable_break_strategy.StableBreakStrategy',
+}
+
+
+def strategy_names():
+    return list(STRATEGY_REGISTRY.keys())
+
+
+def get_strategy_class(name):
+    """
+    Import the strategy registered as name.
+
+    Returns:
+        The BaseStrategy subclass.
+    """
+    if name not in STRATEGY_REGISTRY:
+        raise ValueError(f"Unknown strategy: {name}, expected one of {strategy_names()}")
+
+    module_name, class_name = STRATEGY_REGISTRY[name].rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
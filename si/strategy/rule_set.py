@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/8/21 10:37
+@desc: Declarative strategy rules, evaluated cheapest first and stopped at the first failure.
+"""
+import numpy as np
+
+from si.lib.profiler import NULL_PROFILER
+
+# Number of evaluations between two reorderings of an adaptive rule set #
+DEFAULT_REORDER_INTERVAL = 1000
+
+
+class Rule(object):
+    """
+    A named rule of a strategy.
+    Args:
+        name: str.
+            The name of the rule, e.g. in the rejection counts of the profiler.
+        check: function of (quotes, cur_idx, indicators).
+            Whether the rule is met at cur_idx, reading the windowed statistics from the IndicatorStore with value.
+        check_all: function of (quotes, indicators).
+            The bool ndarray of whether the rule is met at every index, the same as check.
+        cost: float, default 1.
+            The relative cost of check, e.g. 1 for comparing two prices and the window length for a rolling mean.
+    """
+    __slots__ = ['name', 'check', 'check_all', 'cost']
+
+    def __init__(self, name, check, check_all, cost=1):
+        self.name = name
+        self.check = check
+        self.check_all = check_all
+        self.cost = cost
+
+
+class RuleSet(object):
+    """
+    The conjunction of rules. evaluate checks the rules in ascending cost and returns at the first one that fails,
+    so an index that fails a cheap rule never pays for the expensive ones.
+
+    The rejections are counted by the profiler as '<name>.<rule name>'.
+
+    When adaptive, evaluate also counts how often every rule is checked and rejects, and reorders the rules every
+    reorder_interval evaluations by cost / rejection rate, so the cheap and selective rules run first on the data
+    actually scanned. The order never changes the result, only the work spent on it.
+    """
+
+    def __init__(self, rules, adaptive=False, reorder_interval=DEFAULT_REORDER_INTERVAL, name='strategy'):
+        self.rules = sorted(rules, key=lambda rule: rule.cost)
+        self.name = name
+        self.adaptive = adaptive
+        self.reorder_interval = reorder_interval
+
+        self.n_checked = {rule.name: 0 for rule in self.rules}
+        self.n_rejected = {rule.name: 0 for rule in self.rules}
+        self._n_evaluations = 0
+
+    def evaluate(self, quotes, cur_idx, indicators, profiler=NULL_PROFILER):
+        """
+        Returns:
+            A bool, true if every rule is met at cur_idx.
+        """
+        if self.adaptive:
+            return self._evaluate_adaptive(quotes, cur_idx, indicators, profiler)
+
+        for rule in self.rules:
+            if not rule.check(quotes, cur_idx, indicators):
+                profiler.reject(self.name + '.' + rule.name)
+                return False
+        return True
+
+    def _evaluate_adaptive(self, quotes, cur_idx, indicators, profiler):
+        self._n_evaluations += 1
+        if self._n_evaluations % self.reorder_interval == 0:
+            self.reorder()
+
+        for rule in self.rules:
+            self.n_checked[rule.name] += 1
+            if not rule.check(quotes, cur_idx, indicators):
+                self.n_rejected[rule.name] += 1
+                profiler.reject(self.name + '.' + rule.name)
+                return False
+        return True
+
+    def reorder(self):
+        """
+        Sort the rules by cost / rejection rate, the rejection rates are smoothed so that a rule that was seldom
+        checked keeps a rate near 1/2.
+        """
+        def rank(rule):
+            rejection_rate = (self.n_rejected[rule.name] + 1) / (self.n_checked[rule.name] + 2)
+            return rule.cost / rejection_rate
+
+        self.rules.sort(key=rank)
+
+    def evaluate_all(self, quotes, indicators):
+        """
+        Evaluate the rules at every index at once, in the same order, and skip the remaining rules once no index is
+        left.
+
+        Returns:
+            A bool ndarray with the same length as quotes, or of the same shape as the columns of a QuotePanel.
+        """
+        passed = None
+        with np.errstate(invalid='ignore'):
+            for rule in self.rules:
+                rule_passed = rule.check_all(quotes, indicators)
+                passed = rule_passed.copy() if passed is None else passed & rule_passed
+                if not passed.any():
+                    break
+        if passed is None:
+            return np.ones(len(quotes), dtype=bool)
+        return passed
+
+    def rules_all(self, quotes, indicators):
+        """
+        Returns:
+            A dict of rule name to its bool ndarray at every index, in the order of evaluation.
+        """
+        with np.errstate(invalid='ignore'):
+            return {rule.name: rule.check_all(quotes, indicators) for rule in self.rules}
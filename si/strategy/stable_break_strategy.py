@@ -6,9 +6,9 @@
 @time: 2021/5/22 14:21
 @desc:
 """
-import numpy as np
-
+from si.lib.indicator_store import IndicatorStore
 from si.strategy.base_strategy import BaseStrategy
+from si.strategy.rule_set import Rule
 
 
 def is_stable_window(quotes, cur_idx, window_threshold=10):
@@ -20,40 +20,61 @@ def is_stable_window(quotes, cur_idx, window_threshold=10):
 
 
 class StableBreakStrategy(BaseStrategy):
+    name = 'stable_break'
+
     def __init__(self, config):
         super().__init__(config)
 
         self.closeness_window = 20
         self.previous_window = 20
 
-    def apply_strategy(self, quotes, cur_idx, **kwargs):
-        # previous window recognize
-        previous_window_quotes = quotes.iloc[
-                                 cur_idx - self.previous_window - self.closeness_window: cur_idx - self.closeness_window]
-
-        prev_low = previous_window_quotes['low'].min()
-
-        # closeness window
-        closeness_window_quotes = quotes.iloc[cur_idx - self.closeness_window: cur_idx]
-        closeness_window_high = closeness_window_quotes['high'].max()
-
-        closeness_window_avg_vol = closeness_window_quotes['volume'].mean()
-
-        # current
-        cur_quote = quotes.iloc[cur_idx]
+    def apply_strategy(self, quotes, cur_idx, indicators=None, **kwargs):
+        if cur_idx < self.get_context_length():
+            return False
 
-        rules = [
-            prev_low > closeness_window_high * 0.95,
-            cur_quote['close'] > closeness_window_high,
-            cur_quote['volume'] > closeness_window_avg_vol * 1.5,
-            cur_quote['close'] > cur_quote.open
+        if indicators is None:
+            indicators = IndicatorStore(quotes)
+        return self.rule_set.evaluate(quotes, cur_idx, indicators, self.profiler)
+
+    def get_rules(self):
+        closeness_window = self.closeness_window
+        previous_window = self.previous_window
+
+        def prev_low(quotes, cur_idx, indicators):
+            # low of the previous window [cur_idx - previous_window - closeness_window, cur_idx - closeness_window)
+            return indicators.value('moving_min', 'low', previous_window, cur_idx, shift=closeness_window + 1)
+
+        def closeness_window_high(quotes, cur_idx, indicators):
+            # high of the closeness window [cur_idx - closeness_window, cur_idx)
+            return indicators.value('moving_max', 'high', closeness_window, cur_idx, shift=1)
+
+        def closeness_window_high_all(indicators):
+            return indicators.get('moving_max', 'high', closeness_window, shift=1)
+
+        return [
+            Rule('stable_low',
+                 lambda quotes, cur_idx, indicators: prev_low(quotes, cur_idx, indicators) >
+                 closeness_window_high(quotes, cur_idx, indicators) * 0.95,
+                 lambda quotes, indicators: indicators.get('moving_min', 'low', previous_window,
+                                                           shift=closeness_window + 1) >
+                 closeness_window_high_all(indicators) * 0.95,
+                 cost=previous_window + closeness_window),
+            Rule('break_high',
+                 lambda quotes, cur_idx, indicators: quotes.close[cur_idx] > closeness_window_high(quotes, cur_idx,
+                                                                                                  indicators),
+                 lambda quotes, indicators: indicators.column('close') > closeness_window_high_all(indicators),
+                 cost=closeness_window),
+            Rule('volume_surge',
+                 lambda quotes, cur_idx, indicators: quotes.volume[cur_idx] > indicators.value(
+                     'moving_average', 'volume', closeness_window, cur_idx, shift=1) * 1.5,
+                 lambda quotes, indicators: indicators.column('volume') > indicators.get(
+                     'moving_average', 'volume', closeness_window, shift=1) * 1.5,
+                 cost=closeness_window),
+            Rule('close_above_open',
+                 lambda quotes, cur_idx, indicators: quotes.close[cur_idx] > quotes.open[cur_idx],
+                 lambda quotes, indicators: indicators.column('close') > indicators.column('open')),
         ]
 
-        if np.mean(rules) == 1.0:
-            return True
-        else:
-            return False
-
     def get_context_length(self):
         return self.closeness_window + self.previous_window
 
@@ -6,82 +6,539 @@
 @time: 2021/1/10 18:25
 @desc:
 """
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from si.lib.data_source import create_data_source
+from si.lib.indicator_store import IndicatorStore
+from si.lib.prefetch import prefetch
+from si.lib.profiler import StageProfiler
+from si.lib.quote_arrays import QuoteArrays
+from si.lib.quote_cache import QuoteCache
+from si.lib.quote_filter import QuoteFilterSpec
+from si.lib.quote_panel import QuotePanel
+from si.lib.quote_summary import QuoteSummary
+from si.lib.quote_window import QuoteWindow
+from si.lib.scan_state import ScanState
+
+DEFAULT_CACHE_DIR = 'cache/quotes'
+DEFAULT_STATE_DIR = 'cache/scan_state'
 
-from si.lib.db_operation import DBService
+# Number of tickers fetched ahead of the one being evaluated #
+DEFAULT_PREFETCH_SIZE = 2
+
+# Record of a signal, tagged with the name of the strategy #
+SIGNAL_DTYPE = [('symbol', 'U16'), ('quote_date', np.int64), ('strategy', 'U32')]
+
+# Record of a signal with its ROI in the future window #
+BACK_TEST_DTYPE = SIGNAL_DTYPE + [('entry_price', np.float64), ('low_roi', np.float64), ('high_roi', np.float64),
+                                  ('hold_roi', np.float64)]
 
 
 class StrategyRunner(object):
+    """
+    Scan the quote universe with one strategy or a list of strategies. Every ticker is loaded once per scan, and its
+    indicators and base filter are computed once and shared by all strategies, whose signals are tagged with their
+    name. The strategies share the base_filter config section.
+    """
 
     def __init__(self, strategy, config):
         data_config = config['data']
-        self.db = DBService(database=data_config['database'], user=data_config['user'],
-                            password=data_config['password'],
-                            host=data_config['host'], port=data_config['port'])
-        self.strategy = strategy
+        self.db = create_data_source(data_config)
+        if data_config.get('use_cache', True):
+            self.quote_cache = QuoteCache(data_config.get('cache_dir', DEFAULT_CACHE_DIR), self.db.quote_dtypes)
+        else:
+            self.quote_cache = None
+        self.strategies = list(strategy) if isinstance(strategy, (list, tuple)) else [strategy]
+        self.strategy = self.strategies[0]
+        self.quote_filter = QuoteFilterSpec.from_config(config['base_filter'])
+
+        runner_config = config.get('runner', {})
+        self.n_workers = runner_config.get('n_workers', 1)
+        self.state_dir = runner_config.get('state_dir', DEFAULT_STATE_DIR)
+        self.prefetch_size = runner_config.get('prefetch_size', DEFAULT_PREFETCH_SIZE)
+        self.config = config
+
+        self.profiler = StageProfiler.from_config(config.get('profiling', {}))
+        if self.profiler.enabled:
+            for strategy in self.strategies:
+                strategy.profiler = self.profiler
+            self.db.profiler = self.profiler
+
+    def back_test(self, past_ob_window, future_window, start_date=None, end_date=None, symbols=None, **kwargs):
+        """
+        Run the strategies over the last past_ob_window indices before the future_window, and measure the ROI of
+        every signal in the future_window. When start_date or end_date is set, the strategy runs over the indices with
+        quote_date in [start_date, end_date] instead, as long as they have a whole future_window after them. When
+        symbols is set, only these tickers are back tested.
+
+        Returns:
+            DataFrame with the columns of BACK_TEST_DTYPE, sorted by symbol, quote_date and strategy.
+        """
+        quote_window = self.quote_window(past_ob_window, future_window, start_date, end_date)
+        with self.profiler.session('back_test'):
+            signals = self._scan(past_ob_window, future_window, with_profit=True, quote_window=quote_window,
+                                 symbols=symbols, **kwargs)
+        return pd.DataFrame(signals)
+
+    def run(self, past_ob_window=5, symbols=None, **kwargs):
+        future_window = self.get_future_length()
+        quote_window = self.quote_window(past_ob_window, future_window)
+        with self.profiler.session('run'):
+            signals = self._scan(past_ob_window, future_window, with_profit=False, quote_window=quote_window,
+                                 symbols=symbols, **kwargs)
+        for symbol, quote_date, strategy_name in signals:
+            print(f"Ticker: {symbol}, Date: {quote_date:.0f}, Strategy: {strategy_name}")
+
+        return
+
+    def run_panel(self, past_ob_window=5, **kwargs):
+        """
+        Like run, but on a date x ticker QuotePanel of the last dates of the universe, so every rule is evaluated for
+        all tickers at once. Only the strategies that implement apply_strategy_all can run on a panel.
+        """
+        future_window = self.get_future_length()
+        quote_window = self.quote_window(past_ob_window, future_window)
+        n_dates = quote_window.last_n
+
+        with self.profiler.session('run_panel'):
+            # connect db
+            self.db.connect()
+
+            with self.profiler.stage('load_panel'):
+                company_quotes = ((company, quotes) for company, quotes in
+                                  self._iter_company_quotes(quote_window=quote_window)
+                                  if not self._filter_company(company))
+                panel = QuotePanel.from_company_quotes(company_quotes, n_dates)
+
+            # close db
+            self.db.close_db()
+
+            signals = self.panel_signals(panel, max(len(panel) - past_ob_window - future_window, 0),
+                                         max(len(panel) - future_window, 0), **kwargs)
+
+        for symbol, quote_date, strategy_name in signals:
+            print(f"Ticker: {symbol}, Date: {quote_date:.0f}, Strategy: {strategy_name}")
+
+        return
+
+    def panel_signals(self, panel, start_idx, end_idx, **kwargs):
+        """
+        Run every strategy over the dates [start_idx, end_idx) of a panel, sharing one IndicatorStore over the panel
+        and the base filter like scan_quotes.
+
+        Returns:
+            A record array of SIGNAL_DTYPE, sorted by symbol, quote_date and strategy.
+        """
+        if start_idx >= end_idx or panel.n_tickers == 0:
+            return np.empty(0, dtype=SIGNAL_DTYPE)
+
+        self.profiler.count('tickers', panel.n_tickers)
+        self.profiler.count('indices_evaluated', (end_idx - start_idx) * panel.n_tickers)
+        indicators = IndicatorStore(panel)
+
+        filter_mask = None
+        signals = []
+        for strategy in self.strategies:
+            with self.profiler.stage('apply_strategy'):
+                strategy_mask = strategy.apply_strategy_all(panel, indicators, **kwargs)
+            if strategy_mask is None:
+                raise ValueError(f"{strategy.get_name()} doesn't implement apply_strategy_all to run on a panel")
 
-    def back_test(self, past_ob_window, future_window, **kwargs):
+            if filter_mask is None:
+                with self.profiler.stage('filter_quotes'):
+                    filter_mask = strategy.filter_quotes_all(panel, indicators, **kwargs)
+
+            date_idx, ticker_idx = np.nonzero((filter_mask & strategy_mask)[start_idx: end_idx])
+            records = np.empty(len(date_idx), dtype=SIGNAL_DTYPE)
+            records['symbol'] = panel.symbols[ticker_idx]
+            records['quote_date'] = panel.quote_date[date_idx + start_idx]
+            records['strategy'] = strategy.get_name()
+            self.profiler.count('signals', len(records))
+            signals.append(records)
+
+        return _merge_signals(signals, SIGNAL_DTYPE)
+
+    def run_incremental(self, past_ob_window=5, **kwargs):
+        """
+        Run the strategy only on the bars that arrived since the last incremental run. A ticker that was never scanned
+        is evaluated over its last past_ob_window indices like run.
+        """
+        with self.profiler.session('run_incremental'):
+            signals = self._scan_incremental(past_ob_window, **kwargs)
+
+        for symbol, quote_date, strategy_name in signals:
+            print(f"Ticker: {symbol}, Date: {quote_date:.0f}, Strategy: {strategy_name}")
+
+        return
+
+    def _scan_incremental(self, past_ob_window, **kwargs):
+        future_window = self.get_future_length()
+        lookback_length = self.get_lookback_length()
+        scan_state = ScanState(self.state_dir)
 
         # connect db
         self.db.connect()
 
-        for company, quotes in self.db.get_all_company_quotes_iterator():
-            if self._filter_company(company):
+        signals = []
+        quote_window = self.quote_window(past_ob_window, future_window)
+        company_quotes = prefetch(self._iter_incremental_quotes(scan_state, quote_window), self.prefetch_size)
+        for company, quotes in self.profiler.timed_iter('fetch_wait', company_quotes):
+            self.profiler.count('tickers')
+            if self._filter_company(company) or not self.quote_filter.accept_quotes(quotes):
+                self.profiler.count('tickers_filtered')
                 continue
             symbol = company['symbol']
 
             len_quotes = len(quotes)
-            start_idx = max(len_quotes - past_ob_window - future_window, 0)
-            end_idx = max(len_quotes - future_window, 0)
-            for idx in range(start_idx, end_idx):
-                if self.strategy.forward(quotes, idx, **kwargs):
-                    cur_quote = quotes.iloc[idx]
-                    profit = self.profit(quotes, idx, future_window)
-                    print(f"Ticker: {symbol}, Date: {cur_quote['quote_date']:.0f}, Profit: {profit}")
+            end_idx = len_quotes - future_window
+            if end_idx <= 0:
+                continue
+
+            last_evaluated_date = scan_state.get_last_evaluated_date(symbol)
+            if last_evaluated_date is None:
+                start_idx = max(end_idx - past_ob_window, 0)
+            else:
+                start_idx = int(np.searchsorted(quotes.quote_date, last_evaluated_date, side='right'))
+
+            # only the lookback bars before start_idx are needed to evaluate [start_idx, end_idx)
+            offset = max(start_idx - lookback_length, 0)
+            signals.extend(self.scan_quotes(symbol, quotes[offset:], start_idx - offset, end_idx - offset,
+                                            future_window, with_profit=False, **kwargs))
+
+            tail_start = max(len_quotes - lookback_length - future_window, 0)
+            scan_state.update(symbol, quotes.quote_date[end_idx - 1], quotes[tail_start:])
+
+        scan_state.save()
 
         # close db
         self.db.close_db()
 
-        return
+        return _merge_signals(signals, SIGNAL_DTYPE)
+
+    def profits(self, quotes, signal_indices, future_window):
+        """
+        ROI of every signal at once. The entry price is the open price of the day after the signal, the low and high
+        ROI are measured with the lowest low and highest high of [signal_idx, signal_idx + future_window), and the
+        hold ROI with the open price of signal_idx + future_window.
+        Args:
+            quotes: QuoteArrays.
+                The quotes of <quote_date, open, close, high, low, volume>, sorted by quote_date ascending.
+            signal_indices: ndarray of int.
+                The signal indices, each of them is less than len(quotes) - future_window.
+            future_window: int > 0.
+                The size of the holding window.
+
+        Returns:
+            A tuple of ndarray like (entry_price, low_roi, high_roi, hold_roi).
+        """
+        signal_indices = np.asarray(signal_indices, dtype=np.int64)
+        entry_price = quotes.open[signal_indices + 1]
+        min_price = sliding_window_view(quotes.low, future_window)[signal_indices].min(axis=-1)
+        max_price = sliding_window_view(quotes.high, future_window)[signal_indices].max(axis=-1)
+        last_price = quotes.open[signal_indices + future_window]
+
+        low_roi = (min_price / entry_price) - 1
+        high_roi = (max_price / entry_price) - 1
+        hold_roi = (last_price / entry_price) - 1
+
+        return entry_price, low_roi, high_roi, hold_roi
+
+    def quote_window(self, past_ob_window, future_window, start_date=None, end_date=None, lookback_length=None):
+        """
+        The bars of each ticker that a scan needs: the last past_ob_window indices before the future_window, plus
+        the lookback bars the first of them needs, or the bars of [start_date, end_date] padded the same way when
+        either of them is set.
+        Args:
+            lookback_length: int, optional.
+                The number of bars before an index that the strategies need, get_lookback_length() when it's None.
+
+        Returns:
+            QuoteWindow.
+        """
+        if lookback_length is None:
+            lookback_length = self.get_lookback_length()
 
-    def run(self, past_ob_window=5, **kwargs):
+        if start_date is not None or end_date is not None:
+            return QuoteWindow.date_range(start_date, end_date, n_before=lookback_length, n_after=future_window)
+
+        return QuoteWindow.trailing(lookback_length + past_ob_window + future_window)
+
+    def _scan(self, past_ob_window, future_window, with_profit, quote_window=None, symbols=None, **kwargs):
+        """
+        Run the strategy over the last past_ob_window indices (before the future_window) of every company, or over
+        the date range of quote_window, serially or sharded across a process pool when runner.n_workers > 1. Only the
+        bars in quote_window are loaded, and only the companies in symbols when symbols is set.
+
+        Returns:
+            A record array of SIGNAL_DTYPE, or BACK_TEST_DTYPE when with_profit, sorted by symbol and quote_date so
+            that the output doesn't depend on the execution mode.
+        """
         # connect db
         self.db.connect()
 
-        for company, quotes in self.db.get_all_company_quotes_iterator():
+        companies = None
+        if self.n_workers > 1 or symbols is not None:
+            companies = self._get_companies(symbols)
+
+        if self.n_workers > 1:
+            shards = [companies.iloc[i::self.n_workers] for i in range(self.n_workers)]
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                futures = [executor.submit(_scan_shard, self.strategies, self.config, shard, past_ob_window,
+                                           future_window, with_profit, quote_window, kwargs) for shard in shards]
+                results = [future.result() for future in futures]
+            signals = [shard_signals for shard_signals, _ in results]
+            for _, profiler_state in results:
+                self.profiler.merge(profiler_state)
+        else:
+            signals = [self._scan_companies(self._iter_company_quotes(companies, quote_window, prune=True),
+                                            past_ob_window, future_window, with_profit, quote_window, **kwargs)]
+
+        # close db
+        self.db.close_db()
+
+        return _merge_signals(signals, BACK_TEST_DTYPE if with_profit else SIGNAL_DTYPE)
+
+    def _scan_companies(self, company_quotes, past_ob_window, future_window, with_profit, quote_window=None,
+                        **kwargs):
+        signals = []
+        # evaluate a ticker while the next ones are fetched
+        for company, quotes in self.profiler.timed_iter('fetch_wait', prefetch(company_quotes, self.prefetch_size)):
+            self.profiler.count('tickers')
             if self._filter_company(company):
+                self.profiler.count('tickers_filtered')
                 continue
-            future_window = self.strategy.get_future_length()
-
             symbol = company['symbol']
+
             len_quotes = len(quotes)
-            start_idx = max(len_quotes - past_ob_window - future_window, 0)
-            end_idx = max(len_quotes - future_window, 0)
-            for idx in range(start_idx, end_idx):
-                if self.strategy.forward(quotes, idx, **kwargs):
-                    cur_quote = quotes.iloc[idx]
-                    print(f"Ticker: {symbol}, Date: {cur_quote['quote_date']:.0f}")
+            if quote_window is not None and quote_window.is_date_range:
+                start_idx, end_idx = quote_window.date_range_indices(quotes)
+                end_idx = min(end_idx, len_quotes - future_window)
+            else:
+                start_idx = max(len_quotes - past_ob_window - future_window, 0)
+                end_idx = max(len_quotes - future_window, 0)
 
-        # close db
-        self.db.close_db()
+            if not self._accept_span(quotes, start_idx, end_idx):
+                self.profiler.count('tickers_pruned')
+                continue
+            signals.extend(self.scan_quotes(symbol, quotes, start_idx, end_idx, future_window, with_profit, **kwargs))
 
-        return
+        return _merge_signals(signals, BACK_TEST_DTYPE if with_profit else SIGNAL_DTYPE)
 
-    def profit(self, quotes, signal_idx, future_window):
-        entry_price = quotes.iloc[signal_idx + 1]['open']
-        window_quotes = quotes.iloc[signal_idx: signal_idx + future_window]
-        min_price = np.min(window_quotes['low'])
-        max_price = np.max(window_quotes['high'])
-        last_price = quotes.iloc[signal_idx + future_window]['open']
+    def scan_quotes(self, symbol, quotes, start_idx, end_idx, future_window, with_profit, **kwargs):
+        """
+        Run every strategy over the indices [start_idx, end_idx) of a ticker. The strategies share one IndicatorStore,
+        and the base filter is evaluated once for all of the strategies that implement apply_strategy_all.
 
-        low_roi = (min_price / entry_price) - 1
-        high_roi = (max_price / entry_price) - 1
-        hold_roi = (last_price / entry_price) - 1
+        Returns:
+            A list of record arrays, one per strategy, see signal_records.
+        """
+        if start_idx >= end_idx:
+            return []
 
-        return f'low_roi: {low_roi:.2f}, high_roi: {high_roi:.2f}, hold_roi: {hold_roi:.2f}'
+        self.profiler.count('indices_evaluated', end_idx - start_idx)
+        indicators = kwargs.pop('indicators', None)
+        if indicators is None:
+            indicators = IndicatorStore(quotes)
 
-    def _filter_company(self, company):
-        if company['sector'] in ['Healthcare']:
+        filter_mask = None
+        alive = None
+        records = []
+        for strategy in self.strategies:
+            with self.profiler.stage('apply_strategy'):
+                strategy_mask = strategy.apply_strategy_all(quotes, indicators, **kwargs)
+
+            if strategy_mask is None:
+                signal_indices = [idx for idx in range(start_idx, end_idx)
+                                  if strategy.forward(quotes, idx, indicators=indicators, **kwargs)]
+            else:
+                if filter_mask is None:
+                    with self.profiler.stage('filter_quotes'):
+                        filter_mask = strategy.filter_quotes_all(quotes, indicators, **kwargs)
+                    if self.profiler.enabled:
+                        alive = self._count_filter_rejections(strategy, quotes, start_idx, end_idx, indicators,
+                                                              **kwargs)
+                if self.profiler.enabled:
+                    self.profiler.count_rejections(strategy.get_name(),
+                                                   strategy.strategy_rules_all(quotes, indicators, **kwargs), alive)
+                signal_indices = np.flatnonzero((filter_mask & strategy_mask)[start_idx: end_idx]) + start_idx
+
+            records.append(self.signal_records(symbol, quotes, signal_indices, future_window, with_profit, strategy))
+
+        return records
+
+    def signal_records(self, symbol, quotes, signal_indices, future_window, with_profit, strategy=None):
+        """
+        Build the signal records of a ticker, tagged with the name of strategy, the runner's strategy when it's None.
+
+        Returns:
+            A record array of BACK_TEST_DTYPE when with_profit, otherwise of SIGNAL_DTYPE.
+        """
+        signal_indices = np.asarray(signal_indices, dtype=np.int64)
+        self.profiler.count('signals', len(signal_indices))
+        records = np.empty(len(signal_indices), dtype=BACK_TEST_DTYPE if with_profit else SIGNAL_DTYPE)
+        records['symbol'] = symbol
+        records['quote_date'] = quotes.quote_date[signal_indices]
+        records['strategy'] = (self.strategy if strategy is None else strategy).get_name()
+        if with_profit and len(signal_indices) > 0:
+            with self.profiler.stage('profits'):
+                records['entry_price'], records['low_roi'], records['high_roi'], records['hold_roi'] = self.profits(
+                    quotes, signal_indices, future_window)
+        return records
+
+    def signal_indices(self, quotes, start_idx, end_idx, strategy=None, **kwargs):
+        """
+        Indices in [start_idx, end_idx) where the strategy signals, evaluated by forward_all when the strategy
+        implements it, otherwise by forward at every index. The runner's strategy is used when strategy is None.
+        """
+        if strategy is None:
+            strategy = self.strategy
+
+        if start_idx >= end_idx:
+            return []
+
+        self.profiler.count('indices_evaluated', end_idx - start_idx)
+        if kwargs.get('indicators') is None:
+            # share the indicators of the ticker between forward_all, forward at every index and the rejection counts
+            kwargs['indicators'] = IndicatorStore(quotes)
+
+        signal_mask = strategy.forward_all(quotes, **kwargs)
+        if signal_mask is None:
+            return [idx for idx in range(start_idx, end_idx) if strategy.forward(quotes, idx, **kwargs)]
+
+        if self.profiler.enabled:
+            alive = self._count_filter_rejections(strategy, quotes, start_idx, end_idx, **kwargs)
+            self.profiler.count_rejections(strategy.get_name(), strategy.strategy_rules_all(quotes, **kwargs), alive)
+
+        return np.flatnonzero(signal_mask[start_idx: end_idx]) + start_idx
+
+    def _count_filter_rejections(self, strategy, quotes, start_idx, end_idx, indicators, **kwargs):
+        """
+        Count the indices of [start_idx, end_idx) rejected by every rule of the base filter, each index by the first
+        rule it fails like forward would. The strategy rules are counted on the returned indices that pass the filter.
+        """
+        alive = np.zeros(len(quotes), dtype=bool)
+        alive[start_idx: end_idx] = True
+        return self.profiler.count_rejections('base_filter', strategy.filter_rules_all(quotes, indicators, **kwargs),
+                                              alive)
+
+    def get_lookback_length(self):
+        """
+        The number of bars before an index that the strategies need.
+        """
+        return max(strategy.get_lookback_length() for strategy in self.strategies)
+
+    def get_future_length(self):
+        """
+        The number of bars after an index that the strategies need.
+        """
+        return max(strategy.get_future_length() for strategy in self.strategies)
+
+    def _get_companies(self, symbols=None):
+        """
+        Get the companies to scan, from the local quote cache after refreshing it, or from the database directly when
+        the cache is disabled. When symbols is given, only these companies are refreshed and returned.
+        """
+        if self.quote_cache is None:
+            companies = self.db.get_companies_with_id(self.quote_filter)
+            if symbols is not None:
+                companies = companies[companies['symbol'].isin(symbols)].reset_index(drop=True)
+            return companies
+
+        with self.profiler.stage('cache_refresh'):
+            if symbols is not None:
+                return self.quote_cache.refresh_symbols(self.db, symbols, self.quote_filter)
+            self.quote_cache.refresh(self.db, self.quote_filter)
+        return self.quote_cache.get_companies()
+
+    def _iter_company_quotes(self, companies=None, quote_window=None, prune=False):
+        """
+        Iterate (company, quotes) from the local quote cache after refreshing it, or from the database directly when
+        the cache is disabled. When companies is given, only these companies are loaded. When quote_window is given,
+        only the bars in it are loaded. When prune, the cached companies whose summary shows that the base filter
+        can't pass in quote_window are skipped without reading their quotes.
+        """
+        if self.quote_cache is None:
+            return self.db.get_all_company_quotes_iterator(self.quote_filter.accept_quotes, companies=companies,
+                                                           as_arrays=True, quote_filter=self.quote_filter,
+                                                           quote_window=quote_window)
+
+        if companies is None:
+            with self.profiler.stage('cache_refresh'):
+                self.quote_cache.refresh(self.db, self.quote_filter)
+        return self.quote_cache.get_all_company_quotes_iterator(self.quote_filter.accept_quotes, companies=companies,
+                                                                as_arrays=True, quote_window=quote_window,
+                                                                span_filter=self.quote_filter if prune else None)
+
+    def _iter_incremental_quotes(self, scan_state, quote_window):
+        """
+        Iterate (company, quotes) for the incremental scan. The quote cache already fetches only the new bars and its
+        arrays are memory-mapped, so they are used as they are. Without the cache, only the bars newer than the scan
+        state are loaded from the database and appended to the stored tails. A ticker without any scan state only
+        needs the bars of quote_window.
+        """
+        min_tail_date = scan_state.get_min_tail_date()
+        if min_tail_date is None:
+            for company, quotes in self._iter_company_quotes(quote_window=quote_window):
+                yield company, quotes
+            return
+
+        if self.quote_cache is not None:
+            for company, quotes in self._iter_company_quotes():
+                yield company, quotes
+            return
+
+        for company, new_quotes in self.db.iter_company_quotes(as_arrays=True, after_date=min_tail_date,
+                                                               quote_filter=self.quote_filter):
+            tail = scan_state.load_tail(company['symbol'])
+            if tail is None:
+                quotes = self.db.get_quote_arrays_by_company_id(company['id'], quote_window=quote_window)
+            else:
+                quotes = QuoteArrays.concat([tail, new_quotes[new_quotes.quote_date > tail.quote_date[-1]]])
+            yield company, quotes
+
+    def _accept_span(self, quotes, start_idx, end_idx):
+        """
+        Whether the base filter can pass at any index of [start_idx, end_idx), checked on the summary of the bars its
+        windows read, so a ticker that can't pass skips the indicators and the rules.
+        """
+        if start_idx >= end_idx:
             return True
+        span_start = max(start_idx - self.config['base_filter']['ob_window'], 0)
+        return self.quote_filter.accept_span(QuoteSummary.from_quotes(quotes[span_start: end_idx]).span_statistics())
+
+    def _filter_company(self, company):
+        return not self.quote_filter.accept_company(company)
+
+
+def _scan_shard(strategies, config, companies, past_ob_window, future_window, with_profit, quote_window, kwargs):
+    """
+    Scan a shard of companies in a worker process, which owns its DBService connection and reads the quote cache
+    directly.
+
+    Returns:
+        A tuple like (signals, profiler_state), the profiler state is merged by the parent runner.
+    """
+    runner = StrategyRunner(strategies, config)
+    if runner.quote_cache is None:
+        runner.db.connect()
+    try:
+        company_quotes = runner._iter_company_quotes(companies, quote_window, prune=True)
+        signals = runner._scan_companies(company_quotes, past_ob_window, future_window, with_profit, quote_window,
+                                         **kwargs)
+        return signals, runner.profiler.state()
+    finally:
+        if runner.quote_cache is None:
+            runner.db.close_db()
+
 
-        return False
\ No newline at end of file
+def _merge_signals(signals, dtype):
+    """
+    Concatenate a list of signal record arrays and sort them by symbol, quote_date and strategy.
+    """
+    if len(signals) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.sort(np.concatenate(signals), order=['symbol', 'quote_date', 'strategy'], kind='stable')
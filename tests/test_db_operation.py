@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/10/16 14:20
+@desc: The connection pool of PooledDBService, over a SQLite database.
+"""
+import sqlite3
+import time
+
+import pytest
+
+from si.lib.db_operation import PooledDBService, _SQLiteConnection
+
+# Number of companies of the test database, and of quotes per company #
+N_COMPANIES = 8
+N_QUOTES = 30
+
+
+class _TrackedConnection(_SQLiteConnection):
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.closed = False
+
+    def close(self):
+        super().close()
+        self.closed = True
+
+
+class _PooledSQLiteDBService(PooledDBService):
+    """
+    A PooledDBService over a SQLite file, which remembers every connection it made and the errors of the fetches. A
+    fetch takes at least fetch_delay seconds, so that the fetches are still running when the consumer stops.
+    """
+
+    def __init__(self, path, pool_size=2, fetch_delay=0.0):
+        super().__init__(pool_size=pool_size)
+        self.path = path
+        self.fetch_delay = fetch_delay
+        self.connections = []
+        self.fetch_errors = []
+
+    def _new_connection(self):
+        conn = _TrackedConnection(self.path)
+        self.connections.append(conn)
+        return conn
+
+    def _fetch_quotes_by_company_id(self, company_id, after_date=None, quote_window=None, cursor=None):
+        time.sleep(self.fetch_delay)
+        try:
+            return super()._fetch_quotes_by_company_id(company_id, after_date, quote_window, cursor)
+        except Exception as e:
+            self.fetch_errors.append(e)
+            raise
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'quotes.sqlite')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE company (id INTEGER PRIMARY KEY, symbol TEXT, name TEXT, ipo_year INTEGER, '
+                 'sector TEXT, industry TEXT, last_quote_dt TEXT)')
+    conn.execute('CREATE TABLE stock_quote (company_id INTEGER, quote_date INTEGER, open REAL, close REAL, '
+                 'high REAL, low REAL, volume INTEGER)')
+    for company_id in range(1, N_COMPANIES + 1):
+        conn.execute('INSERT INTO company VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (company_id, f'S{company_id:02d}', 'name', 2000, 'Technology', 'Software', '2021-10-15'))
+        conn.executemany('INSERT INTO stock_quote VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         [(company_id, 20210101 + i, 10.0 + i, 10.5 + i, 11.0 + i, 9.5 + i, 1000 * company_id)
+                          for i in range(N_QUOTES)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_close_before_connect(db_path):
+    db = _PooledSQLiteDBService(db_path)
+    db.close_db()
+    assert db.connections == []
+
+    # and closing twice is a no-op too
+    db.connect()
+    db.close_db()
+    db.close_db()
+    assert all(conn.closed for conn in db.connections)
+
+
+def test_pooled_quotes_in_order(db_path):
+    db = _PooledSQLiteDBService(db_path, pool_size=3)
+    db.connect()
+    try:
+        company_ids = list(range(N_COMPANIES, 0, -1))
+        quotes_list = list(db.iter_quotes_by_company_ids(company_ids, as_arrays=True))
+    finally:
+        db.close_db()
+
+    assert [int(quotes.volume[0]) for quotes in quotes_list] == [1000 * company_id for company_id in company_ids]
+    assert all(len(quotes) == N_QUOTES for quotes in quotes_list)
+    assert db.fetch_errors == []
+
+
+def test_close_with_fetches_in_flight(db_path):
+    db = _PooledSQLiteDBService(db_path, pool_size=2, fetch_delay=0.05)
+    db.connect()
+    quotes_iter = db.iter_quotes_by_company_ids(list(range(1, N_COMPANIES + 1)), as_arrays=True)
+    assert len(next(quotes_iter)) == N_QUOTES
+
+    # the consumer stops early, with the next fetches still sleeping on their pooled connections
+    db.close_db()
+    quotes_iter.close()
+
+    assert len(db.connections) == db.pool_size + 1
+    assert all(conn.closed for conn in db.connections)
+    assert db.fetch_errors == []
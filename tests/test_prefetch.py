@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@author: Maple.S
+@project: StockInsight
+@time: 2021/10/16 14:52
+@desc: The background iteration of prefetch and ordered_map.
+"""
+import pytest
+
+from si.lib.prefetch import prefetch, ordered_map
+
+
+def _failing_producer(n_items):
+    for i in range(n_items):
+        yield i
+    raise RuntimeError('connection lost')
+
+
+@pytest.mark.parametrize('queue_size', [0, 1, 2])
+def test_prefetch_in_order(queue_size):
+    assert list(prefetch(iter(range(10)), queue_size=queue_size)) == list(range(10))
+
+
+@pytest.mark.parametrize('queue_size', [0, 2])
+def test_prefetch_raises_producer_error(queue_size):
+    items = []
+    with pytest.raises(RuntimeError, match='connection lost'):
+        for item in prefetch(_failing_producer(3), queue_size=queue_size):
+            items.append(item)
+
+    # the items before the error are all delivered first
+    assert items == [0, 1, 2]
+
+
+def test_prefetch_stops_early():
+    closed = []
+
+    def producer():
+        try:
+            for i in range(100):
+                yield i
+        finally:
+            closed.append(True)
+
+    items = prefetch(producer(), queue_size=2)
+    assert next(items) == 0
+    items.close()
+
+    # the producer thread is joined and its iterator closed
+    assert closed == [True]
+
+
+def test_ordered_map_in_order():
+    assert list(ordered_map(lambda x: x * x, range(20), n_workers=4)) == [x * x for x in range(20)]